@@ -14,8 +14,8 @@ import torchvision.datasets as dsets
 import torchvision.transforms as transforms
 import torchvision.datasets as datasets
 
-import torchattacks
-from torchattacks import PGD
+from attack.adv_store import AdversarialStore
+from inference import InferenceEngine
 import models
 
 
@@ -31,62 +31,33 @@ transform_test = transforms.Compose([
 testset = torchvision.datasets.CIFAR100(
     root='./data', train=False, download=True, transform=transform_test)
 
-testloader = torch.utils.data.DataLoader(testset, batch_size=10,
-                                         shuffle=False, num_workers=8)
+pgd_attack_loader = torch.utils.data.DataLoader(testset, batch_size=256,
+                                                shuffle=False, num_workers=8)
 
 # saved_model_path = './checkpoint/ResNet18/ckpt.t7_ResNet18_epoch50_2_1_baseline_20220103'  
 saved_model_path = './checkpoint/ResNet18/cifar100/ckpt.pth_ResNet18_epoch200_cutmix_20220423'
-pgd_saved_path = "./data/cifar100_test_pgd_1-0.pt"
-if os.path.exists(pgd_saved_path) == False :
-    checkpoint = torch.load(saved_model_path)
-    net = checkpoint['net']
-    net = net.eval()
-    # atk = PGD(net, eps=8/255, alpha=2/255, steps=4)
-    atk = PGD(net, eps=6.0 / 255, alpha=1.0 / 255, steps=40)
-    atk.set_return_type('int') # 0-255 Save as integer. float 0-1
-    atk.save(data_loader=testloader, save_path=pgd_saved_path, verbose=True)
+# 对抗样本按 (模型权重, 攻击参数, 数据集) 的hash缓存, 只生成一次
+store = AdversarialStore('./data/adv_store')
+checkpoint = torch.load(saved_model_path)
+net = checkpoint['net']
+net = net.eval()
+# 已被攻破的样本提前退出, 大batch攻击
+adv_images, adv_labels = store.fetch(net, pgd_attack_loader, split='cifar100-test', verbose=True,
+                                     eps=6.0 / 255, alpha=1.0 / 255, steps=40)
 
 
 
 ##测试所存模型在的准确率
-adv_images, adv_labels = torch.load(pgd_saved_path)
 adv_data = TensorDataset(adv_images.float()/255, adv_labels)
-adv_loader = DataLoader(adv_data, batch_size=128, shuffle=False)
 
-checkpoint = torch.load(saved_model_path)
-net = checkpoint['net']
 net.eval().cuda()
+engine = InferenceEngine(net)  # inference_mode, 自动选择batch size
 
 # 模型在原测试集上的准确率
-correct = 0
-total = 0
-
-for images, labels in testloader:
-    
-    images = images.cuda()
-    outputs = net(images)
-    
-    _, predicted = torch.max(outputs.data, 1)
-    
-    total += labels.size(0)
-    correct += (predicted == labels.cuda()).sum()
-    
-print('Before PGD attack, accuracy: %.2f %%' % (100 * float(correct) / total))
+acc = engine.accuracy(testset, name='clean')
+print('Before PGD attack, accuracy: %.2f %%' % acc)
 
 
 # 模型在被PGD攻击后的测试集样本上的准确率
-correct_adv = 0
-total_adv = 0
-
-for images, labels in adv_loader:
-    
-    images = images.cuda()
-    outputs = net(images)
-    
-    _, predicted = torch.max(outputs.data, 1)
-    
-    total_adv += labels.size(0)
-    correct_adv += (predicted == labels.cuda()).sum()
-    
-print('After PGD attack, accuracy: %.2f %%' % (100 * float(correct_adv) / total_adv))
-
+acc_adv = engine.accuracy(adv_data, name='pgd')
+print('After PGD attack, accuracy: %.2f %%' % acc_adv)
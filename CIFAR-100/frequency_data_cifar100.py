@@ -3,6 +3,8 @@ __author__ = 'Haohan Wang'
 import numpy as np
 from scipy import signal
 
+from frequency import frequency_decompose, mask_radial, save_frequency_data
+
 def fft(img):
     return np.fft.fft2(img)
 
@@ -26,15 +28,6 @@ def distance(i, j, imageSize, r):
     else:
         return 0
 
-def mask_radial(img, r):
-    rows, cols = img.shape
-    mask = np.zeros((rows, cols))
-    for i in range(rows):
-        for j in range(cols):
-            mask[i, j] = distance(i, j, imageSize=rows, r=r)
-    return mask
-
-
 def generateSmoothKernel(data, r):
     result = np.zeros_like(data)
     [k1, k2, m, n] = data.shape
@@ -64,26 +57,7 @@ def generateDataWithDifferentFrequencies_GrayScale(Images, r):
     return np.array(Images_freq_low)
 
 def generateDataWithDifferentFrequencies_3Channel(Images, r):
-    Images_freq_low = []
-    Images_freq_high = []
-    mask = mask_radial(np.zeros([Images.shape[1], Images.shape[2]]), r)
-    for i in range(Images.shape[0]):
-        tmp = np.zeros([Images.shape[1], Images.shape[2], 3])
-        for j in range(3):
-            fd = fftshift(Images[i, :, :, j])
-            fd = fd * mask
-            img_low = ifftshift(fd)
-            tmp[:,:,j] = np.real(img_low)
-        Images_freq_low.append(tmp)
-        tmp = np.zeros([Images.shape[1], Images.shape[2], 3])
-        for j in range(3):
-            fd = fftshift(Images[i, :, :, j])
-            fd = fd * (1 - mask)
-            img_high = ifftshift(fd)
-            tmp[:,:,j] = np.real(img_high)
-        Images_freq_high.append(tmp)
-
-    return np.array(Images_freq_low), np.array(Images_freq_high)
+    return frequency_decompose(Images, [r])[r]
 
 if __name__ == '__main__':
     import sys
@@ -140,46 +114,6 @@ if __name__ == '__main__':
     np.save('./data/CIFAR100/train_images', train_images)
     np.save('./data/CIFAR100/train_label', train_labels)
 
-    train_image_low_4, train_image_high_4 = generateDataWithDifferentFrequencies_3Channel(train_images, 4)
-    np.save('./data/CIFAR100/train_data_low_4', train_image_low_4)
-    np.save('./data/CIFAR100/train_data_high_4', train_image_high_4)
-
-    train_image_low_8, train_image_high_8 = generateDataWithDifferentFrequencies_3Channel(train_images, 8)
-    np.save('./data/CIFAR100/train_data_low_8', train_image_low_8)
-    np.save('./data/CIFAR100/train_data_high_8', train_image_high_8)
-
-    train_image_low_12, train_image_high_12 = generateDataWithDifferentFrequencies_3Channel(train_images, 12)
-    np.save('./data/CIFAR100/train_data_low_12', train_image_low_12)
-    np.save('./data/CIFAR100/train_data_high_12', train_image_high_12)
-
-    train_image_low_16, train_image_high_16 = generateDataWithDifferentFrequencies_3Channel(train_images, 16)
-    np.save('./data/CIFAR100/train_data_low_16', train_image_low_16)
-    np.save('./data/CIFAR100/train_data_high_16', train_image_high_16)
-
-    eval_image_low_4, eval_image_high_4 = generateDataWithDifferentFrequencies_3Channel(eval_images, 4)
-    np.save('./data/CIFAR100/test_data_low_4', eval_image_low_4)
-    np.save('./data/CIFAR100/test_data_high_4', eval_image_high_4)
-
-    eval_image_low_8, eval_image_high_8 = generateDataWithDifferentFrequencies_3Channel(eval_images, 8)
-    np.save('./data/CIFAR100/test_data_low_8', eval_image_low_8)
-    np.save('./data/CIFAR100/test_data_high_8', eval_image_high_8)
-
-    eval_image_low_12, eval_image_high_12 = generateDataWithDifferentFrequencies_3Channel(eval_images, 12)
-    np.save('./data/CIFAR100/test_data_low_12', eval_image_low_12)
-    np.save('./data/CIFAR100/test_data_high_12', eval_image_high_12)
-
-    eval_image_low_16, eval_image_high_16 = generateDataWithDifferentFrequencies_3Channel(eval_images, 16)
-    np.save('./data/CIFAR100/test_data_low_16', eval_image_low_16)
-    np.save('./data/CIFAR100/test_data_high_16', eval_image_high_16)
-
-    eval_image_low_20, eval_image_high_20 = generateDataWithDifferentFrequencies_3Channel(eval_images, 20)
-    np.save('./data/CIFAR100/test_data_low_20', eval_image_low_20)
-    np.save('./data/CIFAR100/test_data_high_20', eval_image_high_20)
-
-    eval_image_low_24, eval_image_high_24 = generateDataWithDifferentFrequencies_3Channel(eval_images, 24)
-    np.save('./data/CIFAR100/test_data_low_24', eval_image_low_24)
-    np.save('./data/CIFAR100/test_data_high_24', eval_image_high_24)
-
-    eval_image_low_28, eval_image_high_28 = generateDataWithDifferentFrequencies_3Channel(eval_images, 28)
-    np.save('./data/CIFAR100/test_data_low_28', eval_image_low_28)
-    np.save('./data/CIFAR100/test_data_high_28', eval_image_high_28)
\ No newline at end of file
+    # 每个batch只做一次fft, 所有半径的低频/高频一次得到
+    save_frequency_data(train_images, [4, 8, 12, 16], './data/CIFAR100/train_data')
+    save_frequency_data(eval_images, [4, 8, 12, 16, 20, 24, 28], './data/CIFAR100/test_data')
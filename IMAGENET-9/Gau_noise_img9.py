@@ -9,7 +9,7 @@ import torchvision.transforms as transforms
 import torchvision.datasets as datasets
 import torch.multiprocessing
 from torch.utils.data.distributed import DistributedSampler
-from dataset_img_9 import get_imagenet_dataloader
+from dataset_img_9 import get_imagenet_dataloader, ManifestSampler
 import argparse
 parser = argparse.ArgumentParser()
 parser.add_argument('--input_size', default=224, type=int,
@@ -33,23 +33,8 @@ device = torch.device('cuda', args.local_rank)
 torch.distributed.init_process_group(backend='nccl') #初始化
 
 
-class AddGaussianNoise(object):
-
-    def __init__(self, mean=0.0, variance=1.0, amplitude=1.0):
-
-        self.mean = mean            #均值
-        self.variance = variance    #方差
-        self.amplitude = amplitude  #倍数，原始图像所加的高斯噪声的倍数
-
-    def __call__(self, img):
-        img = np.array(img)
-        h, w, c = img.shape
-        N = self.amplitude * np.random.normal(loc=self.mean, scale=self.variance, size=(h, w, 1))
-        N = np.repeat(N, c, axis=2)
-        img = N + img
-        img[img > 255] = 255
-        img = Image.fromarray(img.astype('uint8')).convert('RGB')
-        return img
+from corruptions import AddGaussianNoise
+from inference import InferenceEngine
 
 transform_test = transforms.Compose([
     transforms.Resize([args.input_size,args.input_size]),
@@ -59,8 +44,6 @@ transform_test = transforms.Compose([
 
 test_dir = './imagenet-1k/val'
 testset = get_imagenet_dataloader(test_dir, batch_size=batch_size,transform = transform_test, train=False, val_data='ImageNet-A',)
-testloader = torch.utils.data.DataLoader(
-    testset, batch_size=batch_size,  num_workers=2,sampler=DistributedSampler(testset,shuffle=False))
 
 # saved_model_path = 'checkpoint/resnest50/ckpt.pth_resnest50_cutmix_last_model.pth'
 # saved_model_path = 'checkpoint/resnest50/ckpt.pth_resnest50_ori_last_model.pth'
@@ -70,26 +53,15 @@ saved_model_path = 'checkpoint/resnest50/ckpt.pth_resnest50_one_fourth_last_mode
 checkpoint = torch.load(saved_model_path)
 net = checkpoint['net']
 net.eval().cuda()
+engine = InferenceEngine(net, device=device)  # inference_mode, 自动选择batch size
 
 # 模型在原测试集上的准确率
-correct = 0
-total = 0
-
-for images, labels in testloader:
-    images = images.cuda()
-    outputs = net(images)
-
-    _, predicted = torch.max(outputs.data, 1)
-
-    total += labels.size(0)
-    correct += (predicted == labels.cuda()).sum()
-
-print('Before Gaussian Noise attack, accuracy: %.2f %%' % (100 * float(correct) / total))
+acc = engine.accuracy(engine.loader(testset, num_workers=2, sampler=ManifestSampler(testset, shuffle=False)),
+                      name='clean')
+print('Before Gaussian Noise attack, accuracy: %.2f %%' % acc)
 
 
 # 模型在被GAU Noise攻击后的测试集样本上的准确率
-correct_adv = 0
-total_adv = 0
 transform_test_adv = transforms.Compose([
     AddGaussianNoise(0.0, 15.0, 1.0),
     transforms.Resize([args.input_size,args.input_size]),
@@ -98,16 +70,6 @@ transform_test_adv = transforms.Compose([
 ])
 
 testset_adv = get_imagenet_dataloader(test_dir, batch_size=batch_size,transform = transform_test_adv, train=False, val_data='ImageNet-A',)
-testloader_adv = torch.utils.data.DataLoader(
-    testset_adv, batch_size=16,  num_workers=2,sampler=DistributedSampler(testset_adv,shuffle=False))
-
-
-for images, labels in testloader_adv:
-    images = images.cuda()
-    outputs = net(images)
-    _, predicted = torch.max(outputs.data, 1)
-
-    total_adv += labels.size(0)
-    correct_adv += (predicted == labels.cuda()).sum()
-
-print('After Gaussian Noise attack, accuracy: %.2f %%' % (100 * float(correct_adv) / total_adv))
\ No newline at end of file
+acc_adv = engine.accuracy(engine.loader(testset_adv, num_workers=2, sampler=ManifestSampler(testset_adv, shuffle=False)),
+                          name='gaussian noise')
+print('After Gaussian Noise attack, accuracy: %.2f %%' % acc_adv)
@@ -1,6 +1,6 @@
 from torch.utils.data import DataLoader, TensorDataset
-import torchattacks
-from torchattacks import PGD
+from attack.adv_store import AdversarialStore
+from inference import InferenceEngine
 import models
 import numpy as np
 import random
@@ -13,13 +13,15 @@ import torchvision.transforms as transforms
 import torchvision.datasets as datasets
 import torch.multiprocessing
 from torch.utils.data.distributed import DistributedSampler
-from dataset_img_9 import get_imagenet_dataloader
+from dataset_img_9 import get_imagenet_dataloader, ManifestSampler
 import argparse
 parser = argparse.ArgumentParser()
 parser.add_argument('--input_size', default=224, type=int,
                     help='the size of input image')
 parser.add_argument('--batch_size', default=16, type=int,
                     help='total epochs to run')
+parser.add_argument('--attack_batch_size', default=128, type=int,
+                    help='batch size of the PGD attack, fooled samples leave the batch early')
 parser.add_argument('--local_rank', type=int, default=0)
 
 args = parser.parse_args()
@@ -49,69 +51,38 @@ transform_test = transforms.Compose([
 
 test_dir = './imagenet-1k/val'
 testset = get_imagenet_dataloader(test_dir, batch_size=batch_size,transform = transform_test, train=False, val_data='ImageNet-A',)
-testloader = torch.utils.data.DataLoader(
-    testset, batch_size=batch_size,  num_workers=2,sampler=DistributedSampler(testset,shuffle=False))
+pgd_attack_loader = torch.utils.data.DataLoader(
+    testset, batch_size=args.attack_batch_size,  num_workers=2,sampler=ManifestSampler(testset,shuffle=False))
 
 # saved_model_path = 'checkpoint/resnest50/ckpt.pth_resnest50_ori_last_model.pth'
 # saved_model_path = 'checkpoint/resnest50/ckpt.pth_resnest50_one_fourth_last_model.pth'
 # saved_model_path = 'checkpoint/resnest50/ckpt.pth_resnest50_none_last_model.pth'
 saved_model_path = 'checkpoint/resnest50/ckpt.pth_resnest50_cutmix_last_model.pth'
-pgd_saved_path = "data/imagenet9_test_pgd_1-0_.pt"
-
-if os.path.exists(pgd_saved_path) == False :
-    checkpoint = torch.load(saved_model_path)
-    net = checkpoint['net']
-    # net = net.eval()
-    net = net.to(device)
-    # net = net.eval().cuda()
-    # atk = PGD(net, eps=8/255, alpha=2/255, steps=4)
-    atk = PGD(net, eps=6.0 / 255, alpha=1.0 / 255, steps=40)
-    atk.set_return_type('int') # 0-255 Save as integer. float 0-1
-    atk.save(data_loader=testloader, save_path=pgd_saved_path, verbose=True)
+# 对抗样本按 (模型权重, 攻击参数, 数据集) 的hash缓存, 每个进程攻击并缓存自己的那一份数据
+# (数据集由文件manifest的hash和ManifestSampler分到的那一份确定)
+store = AdversarialStore('data/adv_store')
+checkpoint = torch.load(saved_model_path)
+net = checkpoint['net']
+net = net.to(device)
+net = net.eval()
+# 已被攻破的样本提前退出
+adv_images, adv_labels = store.fetch(
+    net, pgd_attack_loader, verbose=True, eps=6.0 / 255, alpha=1.0 / 255, steps=40,
+    split='imagenet9-A-%s-rank%d-of-%d' % (testset.digest[:16], torch.distributed.get_rank(),
+                                           torch.distributed.get_world_size()))
 
 
 ##测试所存模型在的准确率
-adv_images, adv_labels = torch.load(pgd_saved_path)
 adv_data = TensorDataset(adv_images.float()/255, adv_labels)
-adv_loader = DataLoader(adv_data, batch_size=16, shuffle=False, sampler=DistributedSampler(adv_data))
 
-checkpoint = torch.load(saved_model_path)
-net = checkpoint['net']
-net.eval()
-# net.eval().cuda()
+engine = InferenceEngine(net, device=device)  # inference_mode, 自动选择batch size
 
 # 模型在原测试集上的准确率
-correct = 0
-total = 0
-
-for images, labels in testloader:
-    
-    images = images.cuda()
-    outputs = net(images)
-    
-    _, predicted = torch.max(outputs.data, 1)
-    
-    total += labels.size(0)
-    correct += (predicted == labels.cuda()).sum()
-    
-print('Before PGD attack, accuracy: %.2f %%' % (100 * float(correct) / total))
-
-
-# 模型在被PGD攻击后的测试集样本上的准确率
-correct_adv = 0
-total_adv = 0
-
-for images, labels in adv_loader:
-    
-    images = images.cuda()
-    outputs = net(images)
-    
-    _, predicted = torch.max(outputs.data, 1)
-    
-    total_adv += labels.size(0)
-    correct_adv += (predicted == labels.cuda()).sum()
-    
-print('After PGD attack, accuracy: %.2f %%' % (100 * float(correct_adv) / total_adv))
-
+acc = engine.accuracy(engine.loader(testset, num_workers=2, sampler=ManifestSampler(testset, shuffle=False)),
+                      name='clean')
+print('Before PGD attack, accuracy: %.2f %%' % acc)
 
 
+# 模型在被PGD攻击后的测试集样本上的准确率 (每个进程自己的那一份)
+acc_adv = engine.accuracy(adv_data, name='pgd')
+print('After PGD attack, accuracy: %.2f %%' % acc_adv)
@@ -6,11 +6,16 @@ https://github.com/pytorch/vision/blob/master/torchvision/datasets/imagenet.py
 The following nine classes are selected to build the subset:
     dog, cat, frog, turtle, bird, monkey, fish, crab, insect
 """
+import hashlib
+import io
 import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from PIL import Image
 from torchvision import transforms
 import torch
 import torch.utils.data
+from torch.utils.data.distributed import DistributedSampler
 
 
 IMG_EXTENSIONS = [
@@ -94,11 +99,109 @@ def pil_loader(path):
             return img.convert('RGB')
 
 
+MANIFEST_VERSION = 1
+
+
+def _manifest_path(root, val_data, manifest_dir):
+    key = hashlib.sha1(('%s|%s' % (os.path.abspath(root), val_data)).encode()).hexdigest()[:16]
+    return os.path.join(manifest_dir, 'imagefolder_%s.npz' % key)
+
+
+def build_manifest(root, val_data='ImageNet'):
+    """
+    file index of root for val_data: relative path, label and size of every image, the classes,
+    and the mtime of every directory walked (adding or removing a file changes its directory mtime)
+    """
+    root = os.path.expanduser(root)
+    classes, class_to_idx = find_classes(root)
+    imgs, class_to_idx_ = make_dataset(root, class_to_idx, val_data)
+    class_names = sorted(class_to_idx_.keys())
+    dirs = [root]
+    for target in class_names:
+        d = os.path.join(root, target)
+        if os.path.isdir(d):
+            dirs.extend(r for r, _, _ in os.walk(d))
+    return {'version': np.array(MANIFEST_VERSION),
+            'classes': np.array(classes),
+            'class_names': np.array(class_names),
+            'class_idx': np.array([class_to_idx_[c] for c in class_names], dtype=np.int64),
+            'dirs': np.array([os.path.relpath(d, root) for d in dirs]),
+            'mtimes': np.array([os.stat(d).st_mtime_ns for d in dirs], dtype=np.int64),
+            'paths': np.array([os.path.relpath(p, root) for p, _ in imgs], dtype=str),
+            'labels': np.array([t for _, t in imgs], dtype=np.int64),
+            'sizes': np.array([os.path.getsize(p) for p, _ in imgs], dtype=np.int64)}
+
+
+def _manifest_valid(root, manifest):
+    if int(manifest['version']) != MANIFEST_VERSION:
+        return False
+    try:
+        return all(os.stat(os.path.join(root, d)).st_mtime_ns == m
+                   for d, m in zip(manifest['dirs'].tolist(), manifest['mtimes'].tolist()))
+    except OSError:
+        return False
+
+
+def load_manifest(root, val_data='ImageNet', manifest_dir='./data/manifests'):
+    '''the manifest of (root, val_data) from manifest_dir, rebuilt and saved when missing or stale'''
+    root = os.path.expanduser(root)
+    path = _manifest_path(root, val_data, manifest_dir)
+    if os.path.exists(path):
+        with np.load(path) as f:
+            manifest = {k: f[k] for k in f.files}
+        if _manifest_valid(root, manifest):
+            return manifest
+    manifest = build_manifest(root, val_data)
+    os.makedirs(manifest_dir, exist_ok=True)
+    tmp = '%s.%d.tmp.npz' % (path[:-len('.npz')], os.getpid())
+    np.savez(tmp, **manifest)
+    os.replace(tmp, path)  # 多个DDP进程同时重建时也不会读到写了一半的文件
+    return manifest
+
+
+class ManifestSampler(DistributedSampler):
+    '''
+    DistributedSampler whose shards are balanced by file size: every group of num_replicas
+    consecutive indices (of the epoch permutation when shuffle) is sorted by the sizes of the
+    dataset manifest and dealt in alternating directions, so each rank gets the same number of
+    images and about the same number of bytes to decode. Without sizes it is DistributedSampler.
+    '''
+
+    def __iter__(self):
+        if self.shuffle:
+            g = torch.Generator()
+            g.manual_seed(self.seed + self.epoch)
+            indices = torch.randperm(len(self.dataset), generator=g).numpy()
+        else:
+            indices = np.arange(len(self.dataset))
+        # 与DistributedSampler相同: 丢弃尾部或循环补齐到total_size
+        indices = indices[:self.total_size] if self.drop_last else np.resize(indices, self.total_size)
+        groups = indices.reshape(-1, self.num_replicas)
+        sizes = getattr(self.dataset, 'sizes', None)
+        if sizes is not None:
+            order = np.argsort(sizes[groups], axis=1, kind='stable')
+            order[1::2] = order[1::2, ::-1]
+            groups = np.take_along_axis(groups, order, axis=1)
+        return iter(groups[:, self.rank].tolist())
+
+
 class ImageFolder(torch.utils.data.Dataset):
     def __init__(self, root, transform=None, target_transform=None, loader=pil_loader,
-                 train=True, val_data='ImageNet'):
-        classes, class_to_idx = find_classes(root)
-        imgs, class_to_idx_ = make_dataset(root, class_to_idx, val_data)
+                 train=True, val_data='ImageNet', manifest_dir='./data/manifests'):
+        self.sizes, self.digest = None, None
+        if manifest_dir is None:
+            classes, class_to_idx = find_classes(root)
+            imgs, class_to_idx_ = make_dataset(root, class_to_idx, val_data)
+        else:
+            # 文件列表缓存在manifest中, 目录mtime不变时不再遍历整个目录树
+            manifest = load_manifest(root, val_data, manifest_dir)
+            base = os.path.expanduser(root)
+            classes = manifest['classes'].tolist()
+            class_to_idx_ = dict(zip(manifest['class_names'].tolist(), manifest['class_idx'].tolist()))
+            imgs = [(os.path.join(base, p), t)
+                    for p, t in zip(manifest['paths'].tolist(), manifest['labels'].tolist())]
+            self.sizes = manifest['sizes']
+            self.digest = hashlib.sha1(manifest['paths'].tobytes() + manifest['labels'].tobytes()).hexdigest()
         if len(imgs) == 0:
             raise (RuntimeError("Found 0 images in subfolders of: " + root + "\n"
                    "Supported image extensions are: " + ",".join(
@@ -137,8 +240,97 @@ class ImageFolder(torch.utils.data.Dataset):
         return len(self.dataset)
 
 
+def _encode_record(path, size, quality):
+    '''JPEG bytes of the image, shorter side resized to size (aspect kept)'''
+    img = pil_loader(path)
+    if size:
+        w, h = img.size
+        scale = size / min(w, h)
+        if scale < 1:
+            img = img.resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.BILINEAR)
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=quality)
+    return buf.getvalue()
+
+
+def write_records(root, prefix, val_data='ImageNet', size=256, quality=95, num_thread=1, chunk_size=512):
+    """
+    Packs the images of the ImageFolder(root, val_data) subset into one binary file of
+    pre-resized JPEG bytes, <prefix>.rec, and its index <prefix>.idx.npz (offset, length and
+    label of every record, the classes, val_data and size). Images are encoded by num_thread
+    threads, in order.
+    """
+    manifest = build_manifest(root, val_data)
+    paths = [os.path.join(os.path.expanduser(root), p) for p in manifest['paths'].tolist()]
+    offsets = np.zeros(len(paths), dtype=np.int64)
+    lengths = np.zeros(len(paths), dtype=np.int64)
+    tmp = '%s.%d.tmp' % (prefix, os.getpid())
+    with open(tmp, 'wb') as f, ThreadPoolExecutor(num_thread) as pool:
+        position = 0
+        for start in range(0, len(paths), chunk_size):
+            # 分块提交, 编码结果不会在内存中堆积
+            records = pool.map(lambda p: _encode_record(p, size, quality), paths[start:start + chunk_size])
+            for i, record in enumerate(records, start):
+                f.write(record)
+                offsets[i], lengths[i] = position, len(record)
+                position += len(record)
+    os.replace(tmp, prefix + '.rec')
+    np.savez(prefix + '.idx.npz', offsets=offsets, lengths=lengths, labels=manifest['labels'],
+             classes=manifest['classes'], class_names=manifest['class_names'],
+             class_idx=manifest['class_idx'], val_data=val_data, size=size or 0)
+    return len(paths)
+
+
+class ShardedImageDataset(torch.utils.data.Dataset):
+    '''
+    Images of a <prefix>.rec / <prefix>.idx.npz pair written by write_records (prepare_imagenet.py
+    --with-rec): every record is read from the memory-mapped file by its offset and decoded, so
+    there is no open / stat per image. Items are the same as ImageFolder's: (PIL image, label).
+    '''
+
+    def __init__(self, prefix, transform=None, target_transform=None, train=True):
+        with np.load(prefix + '.idx.npz') as index:
+            self.offsets = index['offsets']
+            self.sizes = index['lengths']
+            self.targets = index['labels'].tolist()
+            self.classes = index['classes'].tolist()
+            self.class_to_idx = dict(zip(index['class_names'].tolist(), index['class_idx'].tolist()))
+            # 旧版本的index没有记录子集和尺寸
+            self.val_data = str(index['val_data']) if 'val_data' in index else None
+            self.size = int(index['size']) if 'size' in index else None
+        self.prefix = prefix
+        self.transform = transform
+        self.target_transform = target_transform
+        self.train = train
+        self.digest = hashlib.sha1(self.offsets.tobytes() + self.sizes.tobytes() +
+                                   np.asarray(self.targets).tobytes()).hexdigest()
+        self._data = None
+
+    def __getstate__(self):
+        # DataLoader worker在各自进程中重新mmap, 不把映射的数据序列化
+        state = self.__dict__.copy()
+        state['_data'] = None
+        return state
+
+    def __getitem__(self, index):
+        if self._data is None:
+            self._data = np.memmap(self.prefix + '.rec', dtype=np.uint8, mode='r')
+        offset = self.offsets[index]
+        record = self._data[offset:offset + self.sizes[index]].tobytes()
+        img = Image.open(io.BytesIO(record)).convert('RGB')
+        target = self.targets[index]
+        if self.transform is not None:
+            img = self.transform(img)
+        if self.target_transform is not None:
+            target = self.target_transform(target)
+        return img, target
+
+    def __len__(self):
+        return len(self.targets)
+
+
 def get_imagenet_dataloader(root, batch_size, transform,train=True, num_workers=8,
-                            load_size=256, image_size=224, val_data='ImageNet'):
+                            load_size=256, image_size=224, val_data='ImageNet', rec_prefix=None):
     # if train:
     #     transform = transforms.Compose([
     #         transforms.RandomResizedCrop(image_size),
@@ -153,6 +345,13 @@ def get_imagenet_dataloader(root, batch_size, transform,train=True, num_workers=
     #         transforms.ToTensor(),
     #         transforms.Normalize(mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225))])
 
+    if rec_prefix is not None and os.path.exists(rec_prefix + '.rec'):
+        dataset = ShardedImageDataset(rec_prefix, transform=transform, train=train)
+        # records of another subset or size (prepare_imagenet.py --rec-subset / --rec-size) are not used
+        if (dataset.val_data, dataset.size) == (val_data, load_size):
+            return dataset
+        print('Ignoring %s.rec: built for val_data=%s size=%s, requested val_data=%s size=%s, '
+              'reading the image files' % (rec_prefix, dataset.val_data, dataset.size, val_data, load_size))
     dataset = ImageFolder(root, transform=transform, train=train, val_data=val_data)
 
     # dataloader = torch.utils.data.DataLoader(dataset=dataset,
@@ -7,6 +7,8 @@ import cv2
 import random
 
 from dataset_img_9 import find_classes, make_dataset
+from frequency import frequency_decompose, mask_radial, save_frequency_data
+from image_memmap import images_to_memmap
 
 def fft(img):
     return np.fft.fft2(img)
@@ -31,15 +33,6 @@ def distance(i, j, imageSize, r):
     else:
         return 0
 
-def mask_radial(img, r):
-    rows, cols = img.shape
-    mask = np.zeros((rows, cols))
-    for i in range(rows):
-        for j in range(cols):
-            mask[i, j] = distance(i, j, imageSize=rows, r=r)
-    return mask
-
-
 def generateSmoothKernel(data, r):
     result = np.zeros_like(data)
     [k1, k2, m, n] = data.shape
@@ -69,26 +62,7 @@ def generateDataWithDifferentFrequencies_GrayScale(Images, r):
     return np.array(Images_freq_low)
 
 def generateDataWithDifferentFrequencies_3Channel(Images, r):
-    Images_freq_low = []
-    Images_freq_high = []
-    mask = mask_radial(np.zeros([Images.shape[1], Images.shape[2]]), r)
-    for i in range(Images.shape[0]):
-        tmp = np.zeros([Images.shape[1], Images.shape[2], 3])
-        for j in range(3):
-            fd = fftshift(Images[i, :, :, j])
-            fd = fd * mask
-            img_low = ifftshift(fd)
-            tmp[:,:,j] = np.real(img_low)
-        Images_freq_low.append(tmp)
-        tmp = np.zeros([Images.shape[1], Images.shape[2], 3])
-        for j in range(3):
-            fd = fftshift(Images[i, :, :, j])
-            fd = fd * (1 - mask)
-            img_high = ifftshift(fd)
-            tmp[:,:,j] = np.real(img_high)
-        Images_freq_high.append(tmp)
-
-    return np.array(Images_freq_low), np.array(Images_freq_high)
+    return frequency_decompose(Images, [r])[r]
 
 
 
@@ -103,21 +77,8 @@ def image_label(imageLabel, label2idx, i):
 
 def image2npy(imgs):
 
-    i = 0
-    label2idx = {}
-    data = []
-    for t in imgs:
-        img_data = cv2.imread(t[0])
-        img_data = cv2.resize(img_data,(224,224))
-        label = t[1]
-        data.append([np.array(img_data), label])    # 存储image和label数据
-    random.shuffle(data) 
-
-    img = np.array([i[0] for i in data])      # 图像
-    label = np.array([i[1] for i in data])    # 标签
-
-    print(len(img), len(label))
-    np.save('./data/test_label', label)       #保存标签的npy文件
+    # 多进程解码并resize成224x224, 直接写入预分配的uint8 memmap, 标签保存为./data/test_label.npy
+    img, label = images_to_memmap(imgs, './data/test_data_regular.npy', './data/test_label.npy', size=224)
     return img, label, len(img)
 
 
@@ -132,11 +93,8 @@ if __name__ == '__main__':
     eval_images, eval_labels, len_images = image2npy(imgs=imgs)
     # eval_images, eval_labels = load_datafile('./data/cifar-10-batches-py/test_batch')
 
-    images = np.zeros((len_images, 224, 224, 3), dtype='uint8')
-
-    for i, cur_images in enumerate(eval_images):
-        images[i,...] = cur_images
-    
+    # eval_images是./data/test_data_regular.npy的memmap, fft按块读取, 内存占用有界
+    images = eval_images
 
     # eval_image_low_32, eval_image_high_32 = generateDataWithDifferentFrequencies_3Channel(images, 32)
     # np.save('./data/test_data_low_32', eval_image_low_32)
@@ -154,9 +112,8 @@ if __name__ == '__main__':
     # np.save('./data/test_data_low_128', eval_image_low_128)
     # np.save('./data/test_data_high_128', eval_image_high_128)
 
-    eval_image_low_160, eval_image_high_160 = generateDataWithDifferentFrequencies_3Channel(images, 160)
-    np.save('./data/test_data_low_160', eval_image_low_160)
-    np.save('./data/test_data_high_160', eval_image_high_160)
+    # 每个batch只做一次fft, 要多个半径时在列表中加入即可, 如[32, 64, 96, 128, 160, 192, 224]
+    save_frequency_data(images, [160], './data/test_data')
 
 
     # eval_image_low_192, eval_image_high_192 = generateDataWithDifferentFrequencies_3Channel(images, 192)
@@ -19,6 +19,7 @@ import models
 import argparse
 
 from new_dataset import New_Dataset
+from inference import InferenceEngine
 
 
 parser = argparse.ArgumentParser(description='PyTorch CIFAR10 Training')
@@ -42,6 +43,10 @@ transform_test = transforms.Compose([
 saved_model_path = 'checkpoint/resnest50/ckpt.pth_resnest50_none_last_model.pth'
 
 
+checkpoint = torch.load(saved_model_path)
+net = checkpoint['net']
+engine = InferenceEngine(net, device=device)  # inference_mode, 自动选择batch size
+
 radius = [160]
 # radius = [32, 64, 96, 128, 160, 192, 224]
 
@@ -50,34 +55,13 @@ for r in radius:
 
     testset_low = New_Dataset(test_low,'./data/test_label.npy',transform_test)
 
-    testloader = torch.utils.data.DataLoader(testset_low, batch_size=10,
-                                            shuffle=False, num_workers=8)
 
     # test_high = './data/test_data_high_' + str(r) + '.npy'
     # testset_high = New_Dataset(test_high,'./data/test_label.npy',transform_test)
     #
     # testloader = torch.utils.data.DataLoader(testset_high, batch_size=10,
     #                                           shuffle=False, num_workers=8)
-    checkpoint = torch.load(saved_model_path)
-    net = checkpoint['net']
-    net.eval()
-    # net.eval().cuda()
 
     # 模型在原测试集上的准确率
-    correct = 0
-    total = 0
-
-    for images, labels in testloader:
-        
-        images = images.cuda()
-        outputs = net(images)
-        
-        _, predicted = torch.max(outputs.data, 1)
-        
-        total += labels.size(0)
-        correct += (predicted == labels.cuda()).sum()
-        
-    print('frequency =',r,', test accuracy: %.2f %%' % (100 * float(correct) / total))
-    
-
-
+    acc = engine.accuracy(testset_low)
+    print('frequency =',r,', test accuracy: %.2f %%' % acc)
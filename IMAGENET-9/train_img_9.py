@@ -35,7 +35,7 @@ from lib.utils import *
 from lib.validation import validate
 
 import matplotlib.pyplot as plt
-from dataset_img_9 import get_imagenet_dataloader
+from dataset_img_9 import get_imagenet_dataloader, ManifestSampler
 
 from puzzlemix.mixup_puzzle import mixup_graph
 
@@ -508,6 +508,8 @@ def main(self):
                             default='fast_adv',
                             type=str,
                             help='prefix used to define output path')
+    parser.add_argument('--rec_dir', default='', type=str,
+                        help='directory of the train/val .rec files of prepare_imagenet.py --with-rec')
     args = parser.parse_args()
 
     configs = parse_config_file(args)
@@ -569,14 +571,16 @@ def main(self):
     test_dir = './imagenet-1k/val'
 
 
-    trainset =  get_imagenet_dataloader(train_dir, batch_size=batch_size, transform = transform_train,train=True, val_data='ImageNet-A',)
-    train_sampler = DistributedSampler(trainset)
+    # --rec_dir给出时从打包的record文件读取, 不再逐个打开jpeg文件
+    rec_prefix = lambda split: os.path.join(args.rec_dir, split) if args.rec_dir else None
+    trainset =  get_imagenet_dataloader(train_dir, batch_size=batch_size, transform = transform_train,train=True, val_data='ImageNet-A', rec_prefix=rec_prefix('train'))
+    train_sampler = ManifestSampler(trainset)
     trainloader = torch.utils.data.DataLoader(
         trainset, batch_size=batch_size, num_workers=1,sampler=train_sampler) # 这个sampler会自动分配数据到各个gpu上
 
-    testset = get_imagenet_dataloader(test_dir, batch_size=batch_size,transform = transform_test, train=False, val_data='ImageNet-A',)
+    testset = get_imagenet_dataloader(test_dir, batch_size=batch_size,transform = transform_test, train=False, val_data='ImageNet-A', rec_prefix=rec_prefix('val'))
     testloader = torch.utils.data.DataLoader(
-        testset, batch_size=batch_size,  num_workers=1,sampler=DistributedSampler(testset,shuffle=False))
+        testset, batch_size=batch_size,  num_workers=1,sampler=ManifestSampler(testset,shuffle=False))
 
     criterion = nn.CrossEntropyLoss()
     criterion_batch = nn.CrossEntropyLoss(reduction='none').cuda()
@@ -3,24 +3,19 @@ import random
 from PIL import Image,ImageFilter
 from torchvision.utils import save_image
 
-#添加椒盐噪声
+from corruptions import salt_pepper_noise, apply_to_pil
+
+#添加椒盐噪声, 整个batch见 corruptions.salt_pepper_noise
 class AddSaltPepperNoise(object):
 
-    def __init__(self, density=0,p=0.5):
+    def __init__(self, density=0,p=0.5, generator=None):
         self.density = density      #Signal Noise Rate
         self.p = p                  #概率值， 依概率执行
+        self.generator = generator
 
     def __call__(self, img):
         if random.uniform(0, 1) < self.p:  # 概率的判断
-            img = np.array(img)  # 图片转numpy
-            h, w, c = img.shape
-            Nd = self.density
-            Sd = 1 - Nd
-            mask = np.random.choice((0, 1, 2), size=(h, w, 1), p=[Nd / 2.0, Nd / 2.0, Sd])  # 生成一个通道的mask
-            mask = np.repeat(mask, c, axis=2)  # 在通道的维度复制，生成彩色的mask
-            img[mask == 0] = 0  # 椒
-            img[mask == 1] = 255  # 盐
-            img = Image.fromarray(img.astype('uint8')).convert('RGB')  # numpy转图片
-            return img
+            return apply_to_pil(salt_pepper_noise, img, density=self.density, p=1.0,
+                                 generator=self.generator)
         else:
             return img
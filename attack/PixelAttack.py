@@ -15,6 +15,7 @@ import torchvision.transforms as transforms
 from models import *
 from torch.autograd import Variable
 
+from attack.batch_pixel_attack import perturb_pixels, CIFAR_MEAN, CIFAR_STD
 from attack.differential_evolution import differential_evolution
 from tqdm import tqdm
 parser = argparse.ArgumentParser(description='One pixel attack with PyTorch')
@@ -30,38 +31,29 @@ parser.add_argument('--verbose', action='store_true', help='Print out additional
 args = parser.parse_known_args()[0]
 
 def perturb_image(xs, img):
-        if xs.ndim < 2:
-                xs = np.array([xs])
-        batch = len(xs)
-        imgs = img.repeat(batch, 1, 1, 1)
-        xs = xs.astype(int)
-
-        count = 0
-        for x in xs:
-                pixels = np.split(x, len(x)/5)
-                
-                for pixel in pixels:
-                        # 核心代码这里
-                        x_pos, y_pos, r, g, b = pixel
-                        imgs[count, 0, x_pos, y_pos] = (r/255.0-0.4914)/0.2023
-                        imgs[count, 1, x_pos, y_pos] = (g/255.0-0.4822)/0.1994
-                        imgs[count, 2, x_pos, y_pos] = (b/255.0-0.4465)/0.2010
-                count += 1
-
-        return imgs
+        # img: 1*3*W*H tensor on the model device, xs: [n, 5 * pixels] or [5 * pixels]
+        return perturb_pixels(img, xs, CIFAR_MEAN, CIFAR_STD)
 
-def predict_classes(xs, img, target_calss, net, minimize=True):
-        imgs_perturbed = perturb_image(xs, img.clone())
-        input = Variable(imgs_perturbed, volatile=True).cuda()
-        predictions = F.softmax(net(input)).data.cpu().numpy()[:, target_calss]
+def predict_classes(xs, img, target_calss, net, minimize=True, return_probs=False):
+        imgs_perturbed = perturb_image(xs, img)
+        with torch.no_grad():
+                probs = F.softmax(net(imgs_perturbed), dim=1).cpu().numpy()
+        predictions = probs[:, target_calss]
+        predictions = predictions if minimize else 1 - predictions
 
-        return predictions if minimize else 1 - predictions
+        if return_probs:
+                return predictions, probs
+        return predictions
 
 def attack_success(x, img, target_calss, net, targeted_attack=False, verbose=False):
 
-        attack_image = perturb_image(x, img.clone())
+        attack_image = perturb_image(x, img)
         input = Variable(attack_image, volatile=True).cuda()
         confidence = F.softmax(net(input)).data.cpu().numpy()[0]
+        return prediction_success(confidence, target_calss, targeted_attack, verbose)
+
+def prediction_success(confidence, target_calss, targeted_attack=False, verbose=False):
+        # confidence: softmax of one perturbed image, as kept by the DE solver for its best member
         predicted_class = np.argmax(confidence)
 
         if (verbose):
@@ -76,15 +68,17 @@ def _attack(img, label, net, target=None, pixels=1, maxiter=75, popsize=400, ver
 
         targeted_attack = target is not None
         target_calss = target if targeted_attack else label
+        img = img.cuda()
 
         bounds = [(0,32), (0,32), (0,255), (0,255), (0,255)] * pixels
 
         popmul = max(1, popsize/len(bounds))
 
+        # the solver keeps the softmax of its best member, so the success check needs no forward
         predict_fn = lambda xs: predict_classes(
-                xs, img, target_calss, net, target is None)
-        callback_fn = lambda x, convergence: attack_success(
-                x, img, target_calss, net, targeted_attack, verbose)
+                xs, img, target_calss, net, target is None, return_probs=True)
+        callback_fn = lambda x, convergence, output: prediction_success(
+                output, target_calss, targeted_attack, verbose)
 
         # print("type.popmul", type(popmul))
         inits = np.zeros([int(popmul*len(bounds)), len(bounds)])
@@ -97,11 +91,10 @@ def _attack(img, label, net, target=None, pixels=1, maxiter=75, popsize=400, ver
                         init[i*5+4] = np.random.normal(128,127)
 
         attack_result = differential_evolution(predict_fn, bounds, maxiter=maxiter, popsize=popmul,
-                recombination=1, atol=-1, callback=callback_fn, polish=False, init=inits)
+                recombination=1, atol=-1, callback=callback_fn, polish=False, init=inits,
+                outputs=True)
 
-        attack_image = perturb_image(attack_result.x, img)
-        attack_var = Variable(attack_image, volatile=True).cuda()
-        predicted_probs = F.softmax(net(attack_var)).data.cpu().numpy()[0]
+        predicted_probs = attack_result.output
 
         predicted_class = np.argmax(predicted_probs)
 
@@ -115,15 +108,17 @@ def attack(img, label, net, target=None, pixels=1, maxiter=75, popsize=400, verb
 
         targeted_attack = target is not None
         target_calss = target if targeted_attack else label
+        img = img.cuda()
 
         bounds = [(0,32), (0,32), (0,255), (0,255), (0,255)] * pixels
 
         popmul = max(1, popsize/len(bounds))
 
+        # the solver keeps the softmax of its best member, so the success check needs no forward
         predict_fn = lambda xs: predict_classes(
-                xs, img, target_calss, net, target is None)
-        callback_fn = lambda x, convergence: attack_success(
-                x, img, target_calss, net, targeted_attack, verbose)
+                xs, img, target_calss, net, target is None, return_probs=True)
+        callback_fn = lambda x, convergence, output: prediction_success(
+                output, target_calss, targeted_attack, verbose)
 
         # print("type.popmul", type(popmul))
         inits = np.zeros([int(popmul*len(bounds)), len(bounds)])
@@ -136,11 +131,10 @@ def attack(img, label, net, target=None, pixels=1, maxiter=75, popsize=400, verb
                         init[i*5+4] = np.random.normal(128,127)
 
         attack_result = differential_evolution(predict_fn, bounds, maxiter=maxiter, popsize=popmul,
-                recombination=1, atol=-1, callback=callback_fn, polish=False, init=inits)
+                recombination=1, atol=-1, callback=callback_fn, polish=False, init=inits,
+                outputs=True)
 
-        attack_image = perturb_image(attack_result.x, img)
-        attack_var = Variable(attack_image, volatile=True).cuda()
-        predicted_probs = F.softmax(net(attack_var)).data.cpu().numpy()[0]
+        predicted_probs = attack_result.output
 
         predicted_class = np.argmax(predicted_probs)
 
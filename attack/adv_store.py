@@ -0,0 +1,200 @@
+'''Content-addressed store of adversarial test sets.
+
+A set is keyed by the sha1 of (model weights, attack name and all its
+parameters, dataset split, test transform), so a retrained checkpoint or a new
+eps never reuses a stale file. Every set is a uint8 .npy (0-255, read back
+memory-mapped) plus its labels, and index.json maps the keys to the files
+together with the readable parameters.
+
+    store = AdversarialStore('./data/adv_store')
+    adv_images, adv_labels = store.fetch(net, loader, split='cifar10-test',
+                                         eps=6.0 / 255, alpha=1.0 / 255, steps=40)
+'''
+import hashlib
+import inspect
+import json
+import os
+import socket
+import time
+
+import numpy as np
+import torch
+
+from attack.pgd import attack_loader, pgd
+
+# 2: early exit decided on the uint8-truncated iterate, quantize in the key
+VERSION = 2
+ATTACKS = {'pgd': pgd}
+
+
+def weights_digest(net):
+    '''sha1 of the parameters and buffers, independent of device and of a DataParallel wrapper'''
+    sha = hashlib.sha1()
+    for name, tensor in sorted(net.state_dict().items()):
+        if name.startswith('module.'):
+            name = name[len('module.'):]
+        sha.update(name.encode())
+        sha.update(str(tensor.dtype).encode())
+        sha.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return sha.hexdigest()
+
+
+def attack_params(attack, **kwargs):
+    '''every parameter of the attack, defaults included, so a changed default changes the key'''
+    params = {name: p.default for name, p in inspect.signature(ATTACKS[attack]).parameters.items()
+              if p.default is not inspect.Parameter.empty and name != 'generator'}
+    params.update(kwargs)
+    return params
+
+
+def set_key(digest, attack, params, split):
+    desc = json.dumps({'version': VERSION, 'weights': digest, 'attack': attack,
+                       'params': params, 'split': split}, sort_keys=True)
+    return hashlib.sha1(desc.encode()).hexdigest()
+
+
+class AdversarialStore(object):
+    def __init__(self, root='./data/adv_store'):
+        self.root = root
+        self.index_path = os.path.join(root, 'index.json')
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _lock(self, name, timeout=None, warn_every=60):
+        '''
+        exclusive lock file, so that a set requested by several scripts at once is generated once.
+        The lock holds the host and pid of its owner: a lock left by a dead process of this host is
+        broken, otherwise a warning is printed every warn_every seconds while waiting.
+        '''
+        path = self._path(name + '.lock')
+        owner = '%s %d' % (socket.gethostname(), os.getpid())
+        start = last_warning = time.time()
+        while True:
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, owner.encode())
+                os.close(fd)
+                return path
+            except FileExistsError:
+                if self._stale(path):
+                    print('removing stale lock %s' % path)
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    continue
+                if timeout is not None and time.time() - start > timeout:
+                    raise TimeoutError('%s is held by another process' % path)
+                if time.time() - last_warning > warn_every:
+                    print('waiting for %s (held by %s) for %ds' % (path, self._owner(path), time.time() - start))
+                    last_warning = time.time()
+                time.sleep(1)
+
+    @staticmethod
+    def _owner(path):
+        try:
+            with open(path) as f:
+                return f.read()
+        except FileNotFoundError:
+            return ''
+
+    def _stale(self, path):
+        '''the owner of the lock is a process of this host that no longer runs'''
+        owner = self._owner(path).split()
+        if len(owner) != 2 or owner[0] != socket.gethostname():
+            # 其他主机的锁, 或者owner还没写入
+            return False
+        try:
+            os.kill(int(owner[1]), 0)
+        except ProcessLookupError:
+            return True
+        except (PermissionError, ValueError):
+            return False
+        return False
+
+    def index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        with open(self.index_path) as f:
+            return json.load(f)
+
+    def get(self, key):
+        '''
+        :return: (uint8 images [N, C, H, W] memory-mapped from disk, labels), or None if missing
+        '''
+        entry = self.index().get(key)
+        if entry is None or not os.path.exists(self._path(entry['images'])):
+            return None
+        # copy-on-write map: nothing is read until used and the file is never modified
+        images = np.load(self._path(entry['images']), mmap_mode='c')
+        labels = np.load(self._path(entry['labels']))
+        return torch.from_numpy(images), torch.from_numpy(labels)
+
+    def put(self, key, images, labels, meta=None):
+        images = images.cpu().numpy() if torch.is_tensor(images) else np.asarray(images)
+        labels = labels.cpu().numpy() if torch.is_tensor(labels) else np.asarray(labels)
+        assert images.dtype == np.uint8, 'adversarial sets are stored as 0-255 uint8'
+
+        entry = {'images': key + '.npy', 'labels': key + '.labels.npy',
+                 'shape': list(images.shape), 'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+                 'meta': meta or {}}
+        for name, array in [(entry['images'], images), (entry['labels'], labels)]:
+            tmp = self._path(name + '.tmp')
+            out = np.lib.format.open_memmap(tmp, mode='w+', dtype=array.dtype, shape=array.shape)
+            out[...] = array
+            out.flush()
+            del out
+            os.replace(tmp, self._path(name))
+
+        lock = self._lock('index')
+        try:
+            index = self.index()
+            index[key] = entry
+            tmp = self.index_path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(index, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.index_path)
+        finally:
+            os.remove(lock)
+
+    def fetch(self, net, data_loader, split, attack='pgd', verbose=True, **kwargs):
+        """
+        The adversarial set of net on data_loader, generated only if it is not in the store yet.
+
+        :param split: name of the attacked data, e.g. 'cifar10-test'; the length and the
+                      transform of data_loader.dataset are added to the key
+        :param kwargs: parameters of the attack (eps, alpha, steps, restarts, ...)
+        :return: (uint8 images, labels) cpu tensors
+        """
+        # attack_loader runs pgd with quantize=True unless told otherwise: the key is built from the
+        # parameters the attack actually gets, and attack_loader is called with the same kwargs
+        kwargs.setdefault('quantize', True)
+        params = attack_params(attack, **kwargs)
+        dataset = data_loader.dataset
+        split = {'name': split, 'size': len(dataset),
+                 'transform': repr(getattr(dataset, 'transform', None))}
+        digest = weights_digest(net)
+        key = set_key(digest, attack, params, split)
+
+        found = self.get(key)
+        if found is not None:
+            if verbose:
+                print('adversarial set %s found in %s' % (key, self.root))
+            return found
+
+        lock = self._lock(key)
+        try:
+            # another process may have generated it while we waited for the lock
+            found = self.get(key)
+            if found is not None:
+                return found
+            if verbose:
+                print('generating adversarial set %s' % key)
+            images, labels = attack_loader(net, data_loader, verbose=verbose, **kwargs)
+            self.put(key, images, labels,
+                     meta={'weights': digest, 'attack': attack, 'params': params, 'split': split})
+        finally:
+            os.remove(lock)
+        return self.get(key)
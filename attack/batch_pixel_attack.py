@@ -0,0 +1,205 @@
+'''One pixel attack on many images at once.
+
+Every image keeps its own differential evolution population (best1bin with
+dithering, the scipy defaults used by pixel_attack.attack). The candidates of
+all images that are still being attacked are stacked into one model forward
+per generation, and an image is retired as soon as the best member of its
+population fools the model.
+'''
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+CIFAR_MEAN = (0.4914, 0.4822, 0.4465)
+CIFAR_STD = (0.2023, 0.1994, 0.2010)
+
+
+def init_population(rng, n_images, popsize, n_params):
+    """
+    Latin hypercube initialisation of one population per image, scaled to [0, 1)
+    """
+    segments = ((rng.random_sample((n_images, popsize, n_params))
+                 + np.arange(popsize)[:, np.newaxis]) / popsize)
+    order = np.argsort(rng.random_sample((n_images, popsize, n_params)), axis=1)
+    return np.take_along_axis(segments, order, axis=1)
+
+
+def select_samples(rng, n_images, popsize, number_samples=2):
+    """
+    distinct random members for every candidate of every image, none of them
+    equal to the candidate itself. Rows with repeats are drawn again.
+    """
+    candidates = np.arange(popsize)
+    samples = np.empty((n_images, popsize, number_samples), dtype=int)
+
+    redraw = np.ones((n_images, popsize), dtype=bool)
+    while redraw.any():
+        rows = np.nonzero(redraw)
+        draw = rng.randint(0, popsize - 1, (len(rows[0]), number_samples))
+        # skip over the candidate itself
+        draw += draw >= candidates[rows[1], np.newaxis]
+        samples[rows] = draw
+
+        ordered = np.sort(draw, axis=1)
+        redraw[rows] = (ordered[:, 1:] == ordered[:, :-1]).any(axis=1)
+
+    return samples
+
+
+def perturb_pixels(imgs, xs, mean=CIFAR_MEAN, std=CIFAR_STD):
+    """
+    Build all perturbed candidates with one allocation and one index-scatter.
+
+    :param imgs: one image [C, H, W] / [1, C, H, W] or n images [n, C, H, W], normalised with
+                 mean/std, on the model device
+    :param xs: (x, y, r, g, b) * pixels perturbations, numpy array or tensor of shape
+               [candidates, 5 * pixels] for one image or [n, candidates, 5 * pixels] for n images
+    :param mean: per-channel mean of the normalisation, in 0~1 units
+    :param std: per-channel std of the normalisation, in 0~1 units
+    :return: [n * candidates, C, H, W] perturbed images on the device of imgs
+    """
+    xs = torch.as_tensor(xs, device=imgs.device)
+    if xs.dim() < 3:
+        xs = xs.reshape(1, -1, xs.shape[-1])
+    channel, height, width = imgs.shape[-3:]
+    imgs = imgs.reshape(-1, channel, height, width)
+    n_images, candidates = xs.shape[:2]
+
+    # floor the members of xs as int types, [n, candidates, pixels, 5]
+    pixels = xs.reshape(n_images, candidates, -1, 5).long()
+    position = (pixels[..., 0].clamp(0, height - 1) * width
+                + pixels[..., 1].clamp(0, width - 1))
+
+    # RGB 0~255 -> normalised tensor value, [n, candidates, C, pixels]
+    mean = torch.as_tensor(mean, dtype=imgs.dtype, device=imgs.device).reshape(1, 1, -1, 1)
+    std = torch.as_tensor(std, dtype=imgs.dtype, device=imgs.device).reshape(1, 1, -1, 1)
+    values = (pixels[..., 2:].transpose(-1, -2).to(imgs.dtype) / 255. - mean) / std
+
+    out = imgs.reshape(n_images, 1, channel, height * width).repeat(1, candidates, 1, 1)
+    out.scatter_(3, position.unsqueeze(2).expand(-1, -1, channel, -1), values)
+
+    return out.reshape(n_images * candidates, channel, height, width)
+
+
+def attack_batch(imgs, labels, model, target=None, pixel_count=1, maxiter=75, popsize=400,
+                 mutation=(0.5, 1), recombination=1., mean=CIFAR_MEAN, std=CIFAR_STD,
+                 seed=None, max_batch=None, verbose=False):
+    """
+
+    :param imgs: [n, C, H, W] tensor, normalised with mean/std
+    :param labels: [n] true labels
+    :param model: the attacked model, in eval mode
+    :param target: None for an untargeted attack, else one target class (int) or one per image
+    :param pixel_count: number of perturbed pixels
+    :param popsize: population size of every image, as in pixel_attack.attack
+    :param max_batch: split the generation forward into chunks of at most this many images
+    :return: a list with one result dict per image, in input order
+    """
+    device = next(model.parameters()).device
+    rng = np.random.RandomState(seed)
+
+    imgs = imgs.to(device)
+    labels = np.asarray(labels).reshape(-1)
+    n_images, _, height, width = imgs.shape
+
+    targeted_attack = target is not None
+    if targeted_attack:
+        target_class = np.broadcast_to(np.asarray(target), (n_images, )).copy()
+    else:
+        target_class = labels.copy()
+
+    # bounds for a flat vector of x,y,r,g,b values, repeated for more pixels
+    limits = np.array([(0, height), (0, width), (0, 256), (0, 256), (0, 256)] * pixel_count,
+                      dtype=float).T
+    n_params = limits.shape[1]
+    members = max(5, max(1, popsize // n_params) * n_params)
+    dither = np.sort(np.atleast_1d(mutation))
+
+    def evaluate(active, population):
+        '''energy (minimised) and predicted class of every member, one forward'''
+        params = limits[0] + population * (limits[1] - limits[0])
+        chunk = max_batch or len(active)
+        probs = []
+        with torch.no_grad():
+            for i in range(0, len(active), chunk):
+                inputs = perturb_pixels(imgs[active[i:i + chunk]], params[i:i + chunk], mean, std)
+                probs.append(F.softmax(model(inputs), dim=1))
+        probs = torch.cat(probs).reshape(len(active), members, -1)
+
+        index = torch.as_tensor(target_class[active], device=device).reshape(-1, 1, 1)
+        confidence = probs.gather(2, index.expand(-1, members, 1)).squeeze(2)
+        energies = 1 - confidence if targeted_attack else confidence
+        return energies.cpu().numpy(), probs.argmax(2).cpu().numpy()
+
+    def fooled(active, predicted):
+        if targeted_attack:
+            return predicted == target_class[active]
+        return predicted != target_class[active]
+
+    with torch.no_grad():
+        prior_probs = F.softmax(model(imgs), dim=1).cpu().numpy()
+
+    results = [None] * n_images
+    active = np.arange(n_images)
+    population = init_population(rng, n_images, members, n_params)
+    energies, predicted = evaluate(active, population)
+    queries = members
+
+    for nit in range(maxiter + 1):
+        best = energies.argmin(1)
+        best_predicted = predicted[np.arange(len(active)), best]
+        success = fooled(active, best_predicted)
+
+        # retire successful images, and every image after the last generation
+        retire = success if nit < maxiter else np.ones(len(active), dtype=bool)
+        for i in np.flatnonzero(retire):
+            idx = active[i]
+            x = limits[0] + population[i, best[i]] * (limits[1] - limits[0])
+            confidence = 1 - energies[i, best[i]] if targeted_attack else energies[i, best[i]]
+            results[idx] = {
+                'index': int(idx),
+                'label': int(labels[idx]),
+                'target': int(target_class[idx]) if targeted_attack else None,
+                'predicted': int(best_predicted[i]),
+                'success': bool(success[i]),
+                'iterations': nit,
+                'queries': queries,
+                'prior_confidence': float(prior_probs[idx, target_class[idx]]),
+                'confidence': float(confidence),
+                'x': x.astype(int).tolist(),
+            }
+        if verbose and retire.any():
+            print('generation %d: %d images retired, %d left'
+                  % (nit, retire.sum(), len(active) - retire.sum()))
+
+        keep = ~retire
+        active, population = active[keep], population[keep]
+        energies, predicted = energies[keep], predicted[keep]
+        if len(active) == 0:
+            break
+
+        # best1bin mutation with dithering, recombination and constraint repair
+        scale = rng.rand() * (dither[-1] - dither[0]) + dither[0]
+        idx_img = np.arange(len(active))[:, np.newaxis]
+        samples = select_samples(rng, len(active), members, 2)
+        best = energies.argmin(1)
+        bprime = (population[idx_img[:, 0], best][:, np.newaxis] + scale *
+                  (population[idx_img, samples[..., 0]] - population[idx_img, samples[..., 1]]))
+
+        fill_point = rng.randint(0, n_params, (len(active), members))
+        crossovers = rng.rand(len(active), members, n_params) < recombination
+        crossovers[idx_img, np.arange(members), fill_point] = True
+        trials = np.where(crossovers, bprime, population)
+
+        out_of_bounds = (trials < 0) | (trials > 1)
+        trials[out_of_bounds] = rng.rand(np.count_nonzero(out_of_bounds))
+
+        trial_energies, trial_predicted = evaluate(active, trials)
+        queries += members
+
+        improved = trial_energies < energies
+        population[improved] = trials[improved]
+        energies[improved] = trial_energies[improved]
+        predicted[improved] = trial_predicted[improved]
+
+    return results
@@ -10,6 +10,7 @@ differential_evolution: The differential evolution global optimization algorithm
 Added by Andrew Nelson 2014
 """
 from __future__ import division, print_function, absolute_import
+import time
 import numpy as np
 from scipy.optimize import OptimizeResult, minimize
 from scipy.optimize.optimize import _status_message
@@ -27,7 +28,8 @@ def differential_evolution(func, bounds, args=(), strategy='best1bin',
                            maxiter=1000, popsize=15, tol=0.01,
                            mutation=(0.5, 1), recombination=0.7, seed=None,
                            callback=None, disp=False, polish=True,
-                           init='latinhypercube', atol=0):
+                           init='latinhypercube', atol=0, vectorized=True,
+                           outputs=False):
     """Finds the global minimum of a multivariate function.
     Differential Evolution is stochastic in nature (does not use gradient
     methods) to find the minimium, and can search large areas of candidate
@@ -133,6 +135,17 @@ def differential_evolution(func, bounds, args=(), strategy='best1bin',
         ``np.std(pop) <= atol + tol * np.abs(np.mean(population_energies))``,
         where and `atol` and `tol` are the absolute and relative tolerance
         respectively.
+    vectorized : bool, optional
+        If True (default), mutation, crossover, constraint repair and scaling
+        are applied to the whole population as array operations. If False,
+        trial vectors are built candidate by candidate, which reproduces the
+        random stream of earlier versions of this module for a given `seed`.
+    outputs : bool, optional
+        If True, `func` returns a tuple ``(energies, outputs)`` where
+        ``outputs[i]`` is any per-candidate array computed together with the
+        energy (e.g. the model probabilities). The outputs of the best member
+        are kept up to date without evaluating it again, passed to `callback`
+        as the ``output`` keyword and returned as ``output`` in the result.
     Returns
     -------
     res : OptimizeResult
@@ -142,7 +155,8 @@ def differential_evolution(func, bounds, args=(), strategy='best1bin',
         ``message`` which describes the cause of the termination. See
         `OptimizeResult` for a description of other attributes.  If `polish`
         was employed, and a lower minimum was obtained by the polishing, then
-        OptimizeResult also contains the ``jac`` attribute.
+        OptimizeResult also contains the ``jac`` attribute. ``gen_time`` is
+        the mean wall time of one generation in seconds.
     Notes
     -----
     Differential evolution is a stochastic population based method that is
@@ -209,7 +223,8 @@ def differential_evolution(func, bounds, args=(), strategy='best1bin',
                                          recombination=recombination,
                                          seed=seed, polish=polish,
                                          callback=callback,
-                                         disp=disp, init=init, atol=atol)
+                                         disp=disp, init=init, atol=atol,
+                                         vectorized=vectorized, outputs=outputs)
     return solver.solve()
 
 
@@ -319,6 +334,17 @@ class DifferentialEvolutionSolver(object):
         ``np.std(pop) <= atol + tol * np.abs(np.mean(population_energies))``,
         where and `atol` and `tol` are the absolute and relative tolerance
         respectively.
+    vectorized : bool, optional
+        If True (default), mutation, crossover, constraint repair and scaling
+        are applied to the whole population as array operations. If False,
+        trial vectors are built candidate by candidate, which reproduces the
+        random stream of earlier versions of this module for a given `seed`.
+    outputs : bool, optional
+        If True, `func` returns a tuple ``(energies, outputs)`` where
+        ``outputs[i]`` is any per-candidate array computed together with the
+        energy (e.g. the model probabilities). The outputs of the best member
+        are kept up to date without evaluating it again, passed to `callback`
+        as the ``output`` keyword and returned as ``output`` in the result.
     """
 
     # Dispatch of mutation strategy method (binomial or exponential).
@@ -343,7 +369,8 @@ class DifferentialEvolutionSolver(object):
                  strategy='best1bin', maxiter=1000, popsize=15,
                  tol=0.01, mutation=(0.5, 1), recombination=0.7, seed=None,
                  maxfun=np.inf, callback=None, disp=False, polish=True,
-                 init='latinhypercube', atol=0):
+                 init='latinhypercube', atol=0, vectorized=True,
+                 outputs=False):
 
         if strategy in self._binomial:
             self.mutation_func = getattr(self, self._binomial[strategy])
@@ -352,6 +379,9 @@ class DifferentialEvolutionSolver(object):
         else:
             raise ValueError("Please select a valid mutation strategy")
         self.strategy = strategy
+        self.vectorized = vectorized
+        self.outputs = outputs
+        self.population_outputs = None
 
         self.callback = callback
         self.polish = polish
@@ -527,6 +557,16 @@ class DifferentialEvolutionSolver(object):
         """
         return self._scale_parameters(self.population[0])
 
+    @property
+    def best_output(self):
+        """
+        The outputs returned by `func` for the best solution, if `outputs`
+        is set.
+        """
+        if self.population_outputs is None:
+            return None
+        return self.population_outputs[0]
+
     @property
     def convergence(self):
         """
@@ -552,6 +592,7 @@ class DifferentialEvolutionSolver(object):
         """
         nit, warning_flag = 0, False
         status_message = _status_message['success']
+        gen_time = 0.
 
         # The population may have just been initialized (all entries are
         # np.inf). If it has you have to calculate the initial energies.
@@ -564,24 +605,30 @@ class DifferentialEvolutionSolver(object):
         # do the optimisation.
         for nit in xrange(1, self.maxiter + 1):
             # evolve the population by a generation
+            start = time.time()
             try:
                 next(self)
             except StopIteration:
                 warning_flag = True
                 status_message = _status_message['maxfev']
                 break
+            gen_time += time.time() - start
 
             if self.disp:
-                print("differential_evolution step %d: f(x)= %g"
+                print("differential_evolution step %d: f(x)= %g (%.1f ms)"
                       % (nit,
-                         self.population_energies[0]))
+                         self.population_energies[0],
+                         1000 * gen_time / nit))
 
             # should the solver terminate?
             convergence = self.convergence
 
+            callback_kwargs = {'convergence': self.tol / convergence}
+            if self.outputs:
+                callback_kwargs['output'] = self.best_output
             if (self.callback and
                     self.callback(self._scale_parameters(self.population[0]),
-                                  convergence=self.tol / convergence) is True):
+                                  **callback_kwargs) is True):
 
                 warning_flag = True
                 status_message = ('callback function requested stop early '
@@ -604,10 +651,16 @@ class DifferentialEvolutionSolver(object):
             nfev=self._nfev,
             nit=nit,
             message=status_message,
-            success=(warning_flag is not True))
+            success=(warning_flag is not True),
+            gen_time=gen_time / max(1, nit))
+        if self.outputs:
+            DE_result.output = self.best_output
 
         if self.polish:
-            result = minimize(self.func,
+            func = self.func
+            if self.outputs:
+                func = lambda x, *args: self.func(x, *args)[0]
+            result = minimize(func,
                               np.copy(DE_result.x),
                               method='L-BFGS-B',
                               bounds=self.limits.T,
@@ -623,6 +676,10 @@ class DifferentialEvolutionSolver(object):
                 # to keep internal state consistent
                 self.population_energies[0] = result.fun
                 self.population[0] = self._unscale_parameters(result.x)
+                if self.outputs:
+                    self.population_outputs[0] = self._evaluate(
+                        np.atleast_2d(result.x))[1][0]
+                    DE_result.output = self.best_output
 
         return DE_result
 
@@ -638,9 +695,10 @@ class DifferentialEvolutionSolver(object):
         ##############
         itersize = max(0, min(len(self.population), self.maxfun - self._nfev + 1))
         candidates = self.population[:itersize]
-        parameters = np.array([self._scale_parameters(c) for c in candidates]) # TODO: vectorize
-        energies = self.func(parameters, *self.args)
+        parameters = self._scale_parameters(candidates)
+        energies, outputs = self._evaluate(parameters)
         self.population_energies = energies
+        self.population_outputs = outputs
         self._nfev += itersize
 
         # for index, candidate in enumerate(self.population):
@@ -665,6 +723,8 @@ class DifferentialEvolutionSolver(object):
         self.population_energies[0] = lowest_energy
 
         self.population[[0, minval], :] = self.population[[minval, 0], :]
+        if self.outputs:
+            self.population_outputs[[0, minval]] = self.population_outputs[[minval, 0]]
 
     def __iter__(self):
         return self
@@ -693,24 +753,32 @@ class DifferentialEvolutionSolver(object):
         ##############
 
         itersize = max(0, min(self.num_population_members, self.maxfun - self._nfev + 1))
-        trials = np.array([self._mutate(c) for c in range(itersize)]) # TODO: vectorize
-        for trial in trials: self._ensure_constraint(trial)
-        parameters = np.array([self._scale_parameters(trial) for trial in trials])
-        energies = self.func(parameters, *self.args)
+        if self.vectorized:
+            trials = self._mutate_population(itersize)
+            self._ensure_constraint_population(trials)
+        else:
+            trials = np.array([self._mutate(c) for c in range(itersize)])
+            for trial in trials: self._ensure_constraint(trial)
+        parameters = self._scale_parameters(trials)
+        energies, outputs = self._evaluate(parameters)
         self._nfev += itersize
 
-        for candidate,(energy,trial) in enumerate(zip(energies, trials)):
-            # if the energy of the trial candidate is lower than the
-            # original population member then replace it
-            if energy < self.population_energies[candidate]:
-                self.population[candidate] = trial
-                self.population_energies[candidate] = energy
-
-                # if the trial candidate also has a lower energy than the
-                # best solution then replace that as well
-                if energy < self.population_energies[0]:
-                    self.population_energies[0] = energy
-                    self.population[0] = trial
+        # if the energy of a trial candidate is lower than the original
+        # population member then replace it
+        improved = energies < self.population_energies[:itersize]
+        self.population[:itersize][improved] = trials[improved]
+        self.population_energies[:itersize][improved] = energies[improved]
+        if self.outputs:
+            self.population_outputs[:itersize][improved] = outputs[improved]
+
+        # if the best trial candidate also has a lower energy than the best
+        # solution then replace that as well
+        best = np.argmin(energies)
+        if energies[best] < self.population_energies[0]:
+            self.population_energies[0] = energies[best]
+            self.population[0] = trials[best]
+            if self.outputs:
+                self.population_outputs[0] = outputs[best]
 
         # for candidate in range(self.num_population_members):
         #     if self._nfev > self.maxfun:
@@ -759,6 +827,15 @@ class DifferentialEvolutionSolver(object):
         # next() is required for compatibility with Python2.7.
         return self.__next__()
 
+    def _evaluate(self, parameters):
+        """
+        energies (and outputs, if `outputs` is set) of a parameters array
+        """
+        if self.outputs:
+            energies, outputs = self.func(parameters, *self.args)
+            return np.asarray(energies), np.asarray(outputs)
+        return np.asarray(self.func(parameters, *self.args)), None
+
     def _scale_parameters(self, trial):
         """
         scale from a number between 0 and 1 to parameters.
@@ -778,6 +855,50 @@ class DifferentialEvolutionSolver(object):
         for index in np.where((trial < 0) | (trial > 1))[0]:
             trial[index] = self.random_number_generator.rand()
 
+    def _ensure_constraint_population(self, trials):
+        """
+        make sure the parameters of every trial lie between the limits
+        """
+        out_of_bounds = (trials < 0) | (trials > 1)
+        trials[out_of_bounds] = self.random_number_generator.rand(
+            np.count_nonzero(out_of_bounds))
+
+    def _mutate_population(self, itersize):
+        """
+        create the trial vectors of the first `itersize` candidates at once
+        """
+        candidates = np.arange(itersize)
+        trials = np.copy(self.population[:itersize])
+
+        rng = self.random_number_generator
+
+        fill_point = rng.randint(0, self.parameter_count, itersize)
+
+        # samples[k] holds the k-th random member for every candidate
+        samples = self._select_samples_population(candidates, 5).T
+        if self.strategy in ['currenttobest1exp', 'currenttobest1bin']:
+            bprime = self.mutation_func(candidates, samples)
+        else:
+            bprime = self.mutation_func(samples)
+
+        if self.strategy in self._binomial:
+            crossovers = rng.rand(itersize, self.parameter_count)
+            crossovers = crossovers < self.cross_over_probability
+            crossovers[candidates, fill_point] = True
+
+        elif self.strategy in self._exponential:
+            # a run of consecutive successes starting at fill_point (with
+            # wrap-around) is taken from the bprime vector
+            successes = (rng.rand(itersize, self.parameter_count) <
+                         self.cross_over_probability)
+            run_length = np.where(successes.all(axis=1), self.parameter_count,
+                                  successes.argmin(axis=1))
+            offset = ((np.arange(self.parameter_count) - fill_point[:, np.newaxis])
+                      % self.parameter_count)
+            crossovers = offset < run_length[:, np.newaxis]
+
+        return np.where(crossovers, bprime, trials)
+
     def _mutate(self, candidate):
         """
         create a trial vector based on a mutation strategy
@@ -885,3 +1006,27 @@ class DifferentialEvolutionSolver(object):
         self.random_number_generator.shuffle(idxs)
         idxs = idxs[:number_samples]
         return idxs
+
+    def _select_samples_population(self, candidates, number_samples):
+        """
+        obtain `number_samples` distinct random integers from
+        range(self.num_population_members) for every candidate, none of them
+        equal to the candidate itself. Rows with repeats are drawn again.
+        """
+        rng = self.random_number_generator
+        number_samples = min(number_samples, self.num_population_members - 1)
+        samples = np.empty((len(candidates), number_samples), dtype=int)
+
+        redraw = np.ones(len(candidates), dtype=bool)
+        while redraw.any():
+            rows = np.flatnonzero(redraw)
+            draw = rng.randint(0, self.num_population_members - 1,
+                               (len(rows), number_samples))
+            # skip over the candidate itself
+            draw += draw >= candidates[rows, np.newaxis]
+            samples[rows] = draw
+
+            ordered = np.sort(draw, axis=1)
+            redraw[rows] = (ordered[:, 1:] == ordered[:, :-1]).any(axis=1)
+
+        return samples
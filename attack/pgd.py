@@ -0,0 +1,159 @@
+'''Batched PGD / FGSM with restarts and per-sample early exit.
+
+Drop-in for the torchattacks.PGD(eps, alpha, steps) + atk.save(...) pair used by
+the PGD_eval scripts: same L_inf projection, uniform random start and [0, 1]
+clamp, same (uint8 images, labels) file. Samples are frozen at the first
+iterate that fools the model and dropped from the batch, so the later steps
+(and restarts) only run the forward/backward on the samples still standing.
+With quantize=True (attack_loader) the fooling test is done on the iterate
+truncated to 1/255 steps, which is what the saved uint8 images hold, and the
+truncated value is the one frozen.
+'''
+import time
+
+import torch
+import torch.nn.functional as F
+
+
+def quantize_uint8(x):
+    '''x truncated to the values a uint8 image can hold, as (x * 255).type(torch.uint8) / 255'''
+    return torch.floor(x * 255) / 255
+
+
+def pgd(model, images, labels, eps=8 / 255, alpha=2 / 255, steps=10, restarts=1,
+        random_start=True, targeted=False, early_exit=True, clamp=(0, 1), generator=None,
+        quantize=False):
+    """
+
+    :param model: the attacked model, in eval mode
+    :param images: [n, C, H, W] tensor, in the input space of the model
+    :param labels: [n] true labels, or the target labels when targeted=True
+    :param restarts: random restarts; every restart only attacks the samples not fooled yet
+    :param early_exit: freeze a sample at its first fooling iterate and stop computing on it
+    :param clamp: (min, max) valid input range, None for no clamp
+    :param generator: torch.Generator on the model device for the random starts
+    :param quantize: test (and return) the iterates truncated to 1/255 steps, so a sample counted
+                     as fooled is still fooled after it is saved as uint8
+    :return: adversarial images on the model device, and a bool tensor of the fooled samples
+    """
+    device = next(model.parameters()).device
+    images = images.to(device)
+    labels = torch.as_tensor(labels, device=device)
+
+    adv = images.clone()
+    fooled = torch.zeros(len(images), dtype=torch.bool, device=device)
+    # loss of the kept iterate of the samples not fooled, the max over restarts wins
+    best_loss = torch.full((len(images), ), -float('inf'), device=device)
+
+    def is_fooled(logits, y):
+        predicted = logits.argmax(1)
+        return predicted == y if targeted else predicted != y
+
+    for _ in range(restarts):
+        active = torch.nonzero(~fooled).squeeze(1)
+        if len(active) == 0:
+            break
+        x_clean, y = images[active], labels[active]
+
+        with torch.no_grad():
+            x = x_clean.clone()
+            if random_start:
+                x += torch.empty_like(x).uniform_(-eps, eps, generator=generator)
+                if clamp is not None:
+                    x.clamp_(*clamp)
+
+        for _ in range(steps):
+            x.requires_grad_(True)
+            with torch.enable_grad():
+                logits = model(x)
+                loss = F.cross_entropy(logits, y)
+                # only the input gradient, no parameter .grad is accumulated
+                grad, = torch.autograd.grad(-loss if targeted else loss, x)
+            x = x.detach()
+
+            with torch.no_grad():
+                if early_exit:
+                    # the forward of this step already tells which samples are fooled
+                    done = is_fooled(logits.detach(), y)
+                    if quantize and done.any():
+                        # 只对候选样本再做一次forward: 截断到uint8后仍被攻破才冻结
+                        candidates = torch.nonzero(done).squeeze(1)
+                        x_q = quantize_uint8(x[candidates])
+                        still = is_fooled(model(x_q), y[candidates])
+                        done[candidates[~still]] = False
+                        x[candidates[still]] = x_q[still]
+                    if done.any():
+                        adv[active[done]] = x[done]
+                        fooled[active[done]] = True
+                        keep = ~done
+                        active, x, x_clean, y, grad = (active[keep], x[keep], x_clean[keep],
+                                                       y[keep], grad[keep])
+                        if len(active) == 0:
+                            break
+
+                x = x + alpha * grad.sign()
+                x = torch.min(torch.max(x, x_clean - eps), x_clean + eps)
+                if clamp is not None:
+                    x.clamp_(*clamp)
+
+        if len(active) == 0:
+            continue
+
+        # last iterate: success check and the loss that ranks the restarts
+        if quantize:
+            x = quantize_uint8(x)
+        with torch.inference_mode():
+            logits = model(x)
+            done = is_fooled(logits, y)
+            loss = F.cross_entropy(logits, y, reduction='none')
+        loss = -loss if targeted else loss
+        replace = done | (loss > best_loss[active])
+        adv[active[replace]] = x[replace]
+        best_loss[active[replace]] = loss[replace]
+        fooled[active[done]] = True
+
+    return adv, fooled
+
+
+def fgsm(model, images, labels, eps=8 / 255, targeted=False, clamp=(0, 1)):
+    '''single step attack, one forward/backward for the whole batch'''
+    return pgd(model, images, labels, eps=eps, alpha=eps, steps=1, random_start=False,
+               targeted=targeted, early_exit=False, clamp=clamp)
+
+
+def attack_loader(model, data_loader, save_path=None, verbose=True, **kwargs):
+    """
+    Attack every batch of data_loader, the counterpart of torchattacks' atk.save with
+    set_return_type('int').
+
+    :param kwargs: arguments of pgd (eps, alpha, steps, restarts, ...); quantize defaults to True so
+                   the early exit and the robust accuracy are decided on the saved uint8 values
+    :return: (uint8 adversarial images on cpu, labels), also saved to save_path if given
+    """
+    kwargs.setdefault('quantize', True)
+    adv_images, adv_labels = [], []
+    correct, total = 0, 0
+    start = time.time()
+    for images, labels in data_loader:
+        adv, fooled = pgd(model, images, labels, **kwargs)
+        # 0-255 Save as integer, truncated like torchattacks (already truncated by pgd when quantize,
+        # round() only absorbs the float error of floor(x * 255) / 255 * 255)
+        if kwargs['quantize']:
+            adv_images.append(torch.round(adv * 255).type(torch.uint8).cpu())
+        else:
+            adv_images.append((adv * 255).type(torch.uint8).cpu())
+        adv_labels.append(labels.cpu())
+
+        total += len(labels)
+        correct += len(labels) - int(fooled.sum())
+        if verbose:
+            print('- Save progress: %2.2f %% / Robust accuracy: %2.2f %% / %.1f samples/sec'
+                  % (100 * total / len(data_loader.dataset), 100 * correct / total,
+                     total / (time.time() - start)), end='\r')
+    if verbose:
+        print()
+
+    adv_images, adv_labels = torch.cat(adv_images), torch.cat(adv_labels)
+    if save_path is not None:
+        torch.save((adv_images, adv_labels), save_path)
+    return adv_images, adv_labels
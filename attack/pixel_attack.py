@@ -3,7 +3,9 @@ import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 import torch.nn.functional as F
-from scipy.optimize import differential_evolution
+
+from attack.batch_pixel_attack import perturb_pixels
+from attack.differential_evolution import differential_evolution
 
 # from realcifar import *
 
@@ -22,36 +24,14 @@ def perturb_image(xs, img):
     """
 
     :param xs: numpy array of perturbation(s), could be one perturbation eg.[16,16,255,255,0] or multiple perturbation eg.[[16,16,255,255,0],[...],...]
-    :param img: a numpy array, with pixel value range from -1 to 1
-    :return: perturbed image(s), the dimention of the array is 2D, either [[...]] or [[...],[...],...], numpy -1~1
+    :param img: a numpy array or tensor, with pixel value range from -1 to 1
+    :return: perturbed image(s), a [n, 3, H, W] tensor on `device`, -1~1
     """
-    # If this function is passed just one perturbation vector,
-    # pack it in a list to keep the computation the same
-    if xs.ndim < 2:
-        xs = np.array([xs])
-
-    # Copy the image n == len(xs) times so that we can
-    # create n new perturbed images
-    tile = [len(xs)] + [1] * (xs.ndim + 1)
-    imgs = np.tile(img, tile)
-
-    # Make sure to floor the members of xs as int types
-    xs = xs.astype(int)
-
-    for x, img in zip(xs, imgs):
-        # Split x into an array of 5-tuples (perturbation pixels)
-        # i.e., [[x,y,r,g,b], ...]
-        pixels = np.split(x, len(x) // 5)
-        for pixel in pixels:
-            # At each pixel's x,y position, assign its rgb value
-            x_pos, y_pos, r, g, b = pixel
-            img[0, x_pos, y_pos] = conversion(r)
-            img[1, x_pos, y_pos] = conversion(g)
-            img[2, x_pos, y_pos] = conversion(b)
-
-    return imgs
-
-def predict_classes(xs, img, target_class, model, minimize=True):
+    # -1~1 corresponds to normalising 0~1 with mean 0.5 and std 0.5
+    img = torch.as_tensor(img, device=device)
+    return perturb_pixels(img, xs, mean=(0.5, 0.5, 0.5), std=(0.5, 0.5, 0.5))
+
+def predict_classes(xs, img, target_class, model, minimize=True, return_probs=False):
     """
 
     :param xs: numpy array of perturbation(s), could be one perturbation eg.[16,16,255,255,0] or multiple perturbation eg.[[16,16,255,255,0],[...],...]
@@ -59,26 +39,30 @@ def predict_classes(xs, img, target_class, model, minimize=True):
     :param target_class: the target class of the original image
     :param model: the model used to train the dataset
     :param minimize:
+    :param return_probs: also return the softmax of every perturbed image
     :return: a list of the predicted confidence of the target class
     """
     # Perturb the image with the given pixel(s) x and get the prediction of the model
-    imgs_perturbed = perturb_image(xs, img)
-    input = torch.from_numpy(imgs_perturbed).to(device)
-    predictions = F.softmax(model(input), dim=1).data.cpu().numpy()[:,target_class]
+    input = perturb_image(xs, img)
+    with torch.no_grad():
+        probs = F.softmax(model(input), dim=1).cpu().numpy()
+    predictions = probs[:, target_class]
     # This function should always be minimized, so return its complement if needed
-    return predictions if minimize else 1 - predictions
+    predictions = predictions if minimize else 1 - predictions
+    if return_probs:
+        return predictions, probs
+    return predictions
 
 def predict(img, model):
     """
     Predict the confidence of the image that have gone through the model
-    img: numpy -1~1
+    img: numpy or tensor -1~1
 
     """
-    if img.ndim < 4:
-        img = np.array([img])
+    img = torch.as_tensor(img, device=device)
+    if img.dim() < 4:
+        img = img.unsqueeze(0)
 
-    img = torch.from_numpy(img)
-    img = img.to(device)
     confidence = F.softmax(model(img), dim=1).data.cpu().numpy()
     return confidence
 
@@ -98,6 +82,18 @@ def attack_success(x, img, target_class, model, targeted_attack=False, verbose=F
     attack_image = perturb_image(x, img)
 
     confidence = predict(attack_image,model)[0]
+    return prediction_success(confidence, target_class, targeted_attack, verbose)
+
+
+def prediction_success(confidence, target_class, targeted_attack=False, verbose=False):
+    """
+
+    :param confidence: numpy array of the softmax of one (perturbed) image
+    :param target_class:
+    :param targeted_attack: if the attack is targeted
+    :param verbose:
+    :return: True or None due to if the attack is success or not
+    """
     predicted_class = np.argmax(confidence)
     # print('attacked predicted class: ',classes[predicted_class])
 
@@ -112,10 +108,11 @@ def attack_success(x, img, target_class, model, targeted_attack=False, verbose=F
 
 
 def attack(img, label, model, target=None, pixel_count=1,
-           maxiter=75, popsize=400, verbose=False):
+           maxiter=75, popsize=400, verbose=False, plot=False):
     # Change the target class based on whether this is a targeted attack or not
     targeted_attack = target is not None
     target_class = target if targeted_attack else label
+    img = torch.as_tensor(img, device=device)
 
     # Define bounds for a flat vector of x,y,r,g,b values
     # For more pixels, repeat this layout
@@ -124,24 +121,24 @@ def attack(img, label, model, target=None, pixel_count=1,
     # Population multiplier, in terms of the size of the perturbation vector x
     popmul = max(1, popsize // len(bounds))
 
-    # Format the predict/callback functions for the differential evolution algorithm
+    # Format the predict/callback functions for the differential evolution algorithm;
+    # the solver keeps the softmax of its best member, so the success check needs no forward
     def predict_fn(xs):
         return predict_classes(xs, img, target_class,
-                               model, target is None)
+                               model, target is None, return_probs=True)
 
-    def callback_fn(x, convergence):
-        return attack_success(x, img, target_class,
-                              model, targeted_attack,verbose)
+    def callback_fn(x, convergence, output):
+        return prediction_success(output, target_class, targeted_attack, verbose)
 
-    # Call Scipy's Implementation of Differential Evolution
+    # Call the batched Differential Evolution (one forward per generation)
     attack_result = differential_evolution(
         predict_fn, bounds, maxiter=maxiter, popsize=popmul,
-        recombination=1, atol=-1, callback=callback_fn, polish=False)
+        recombination=1, atol=-1, callback=callback_fn, polish=False, outputs=True)
 
     # Calculate some useful statistics to return from this function
     attack_image = perturb_image(attack_result.x, img)[0]
     prior_probs = predict(img,model)
-    predicted_probs = predict(attack_image,model)
+    predicted_probs = attack_result.output[np.newaxis]
     predicted_class = np.argmax(predicted_probs)
     actual_class = label
     success = predicted_class != actual_class
@@ -149,8 +146,9 @@ def attack(img, label, model, target=None, pixel_count=1,
 
     # Show the best attempt at a solution (successful or not)
     # helper.plot_image(attack_image, actual_class, class_names, predicted_class)
-    plt.imshow(np.transpose(clipping(attack_image),(1,2,0)))
-    plt.show()
+    if plot:
+        plt.imshow(np.transpose(clipping(attack_image.cpu().numpy()),(1,2,0)))
+        plt.show()
 
     return [pixel_count, actual_class, predicted_class, success, cdiff, prior_probs,
             predicted_probs, attack_result.x]
@@ -69,6 +69,74 @@ def test(model, loader, blackbox=False, hold_out_size=None):
     return acc
 
 
+def perturb_on_device(adversary, X, y_pred):
+    """
+    adversarial batch on the device of X. Tensor adversaries (a callable, e.g. a partial of
+    attack.pgd.pgd, whose (adv, fooled) result is reduced to adv) stay on the device,
+    numpy ones (.perturb(X, y)) still need the host round trip
+    """
+    if hasattr(adversary, 'perturb'):
+        X_adv = adversary.perturb(X.cpu().numpy(), y_pred.cpu())
+        return torch.from_numpy(X_adv).to(X.device, non_blocking=True)
+    X_adv = adversary(X, y_pred)
+    return X_adv[0] if isinstance(X_adv, tuple) else X_adv
+
+
+def attack_pipeline(model, adversary, loader_test, oracles=(), device=None):
+    """
+    Streaming attack-and-evaluate: the adversarial batch t is evaluated on a side CUDA
+    stream by the model and every oracle while batch t+1 is loaded and attacked, and the
+    correct counts stay on the device until the end.
+
+    :param adversary: callable adversary(X, y_pred) on device tensors, or an object with a
+                      numpy perturb(X, y_pred)
+    :param oracles: transfer oracles evaluated on the same adversarial batches
+    :return: correct counts [1 + len(oracles)] (model first) and the number of samples
+    """
+    device = device or next(model.parameters()).device
+    nets = [model] + list(oracles)
+    correct = torch.zeros(len(nets), dtype=torch.long, device=device)
+    total = 0
+
+    use_streams = device.type == 'cuda'
+    eval_stream = torch.cuda.Stream(device) if use_streams else None
+
+    def evaluate(X_adv, y):
+        with torch.inference_mode():
+            for i, net in enumerate(nets):
+                correct[i] += (net(X_adv).argmax(1) == y).sum()
+
+    def load(batch):
+        if batch is None:
+            return None
+        return [t.to(device, non_blocking=True) for t in batch]
+
+    batches = iter(loader_test)
+    prefetched = load(next(batches, None))
+    while prefetched is not None:
+        X, y = prefetched
+        # queue the copy of the next batch before attacking this one
+        prefetched = load(next(batches, None))
+
+        with torch.inference_mode():
+            y_pred = model(X).argmax(1)
+        X_adv = perturb_on_device(adversary, X, y_pred)
+        total += len(y)
+
+        if use_streams:
+            eval_stream.wait_stream(torch.cuda.current_stream(device))
+            X_adv.record_stream(eval_stream)
+            y.record_stream(eval_stream)
+            with torch.cuda.stream(eval_stream):
+                evaluate(X_adv, y)
+        else:
+            evaluate(X_adv, y)
+
+    if use_streams:
+        torch.cuda.current_stream(device).wait_stream(eval_stream)
+    return correct.cpu(), total
+
+
 def attack_over_test_data(model, adversary, param, loader_test, oracle=None):
     """
     Given target model computes accuracy on perturbed data
@@ -80,17 +148,9 @@ def attack_over_test_data(model, adversary, param, loader_test, oracle=None):
     if oracle is not None:
         total_samples -= param['hold_out_size']
 
-    for t, (X, y) in enumerate(loader_test):
-        y_pred = pred_batch(X, model)
-        X_adv = adversary.perturb(X.numpy(), y_pred)
-        X_adv = torch.from_numpy(X_adv)
-
-        if oracle is not None:
-            y_pred_adv = pred_batch(X_adv, oracle)
-        else:
-            y_pred_adv = pred_batch(X_adv, model)
-
-        total_correct += (y_pred_adv.numpy() == y.numpy()).sum()
+    oracles = [oracle] if oracle is not None else []
+    correct, _ = attack_pipeline(model, adversary, loader_test, oracles)
+    total_correct = int(correct[-1])
 
     acc = total_correct / total_samples
 
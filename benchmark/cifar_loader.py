@@ -0,0 +1,67 @@
+'''Epoch time of the CIFAR-10 training data path alone: torchvision CIFAR10 + PIL transforms in a
+DataLoader (as in train.py) vs GPUTrainLoader, both delivering normalised batches on the device.
+
+Run from the repository root:
+    python -m benchmark.cifar_loader --batch_size 128 --workers 2 8
+'''
+import argparse
+import time
+
+import torch
+import torchvision
+import torchvision.transforms as transforms
+
+from gpu_loader import GPUTrainLoader
+
+parser = argparse.ArgumentParser(description='CIFAR-10 training data path benchmark')
+parser.add_argument('--batch_size', default=128, type=int)
+parser.add_argument('--workers', nargs='+', default=[2], type=int, help='DataLoader workers')
+parser.add_argument('--epochs', default=2, type=int)
+args = parser.parse_args()
+
+MEAN = (0.4914, 0.4822, 0.4465)
+STD = (0.2023, 0.1994, 0.2010)
+
+
+def epoch_time(loader, device):
+    if device == 'cuda':
+        torch.cuda.synchronize()
+    start = time.time()
+    for inputs, targets in loader:
+        inputs, targets = inputs.to(device, non_blocking=True), targets.to(device, non_blocking=True)
+    if device == 'cuda':
+        torch.cuda.synchronize()
+    return time.time() - start
+
+
+def main():
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    transform_train = transforms.Compose([
+        transforms.RandomCrop(32, padding=4),
+        transforms.RandomHorizontalFlip(),
+        transforms.ToTensor(),
+        transforms.Normalize(MEAN, STD),
+    ])
+    trainset = torchvision.datasets.CIFAR10(root='./data', train=True, download=True, transform=transform_train)
+
+    for workers in args.workers:
+        loader = torch.utils.data.DataLoader(trainset, batch_size=args.batch_size, shuffle=True,
+                                             num_workers=workers, pin_memory=device == 'cuda')
+        times = [epoch_time(loader, device) for _ in range(args.epochs)]
+        print('DataLoader + PIL transforms, workers=%d: %.2fs / epoch' % (workers, min(times)))
+
+    gpu_loader = GPUTrainLoader(trainset.data, trainset.targets, args.batch_size, MEAN, STD, device=device, seed=0)
+    times = [epoch_time(gpu_loader, device) for _ in range(args.epochs)]
+    print('GPUTrainLoader on %s: %.2fs / epoch' % (device, min(times)))
+
+    # 不做crop/flip时与ToTensor + Normalize的结果一致
+    plain = GPUTrainLoader(trainset.data[:256], trainset.targets[:256], 256, MEAN, STD, padding=0, flip=False,
+                           shuffle=False, device=device)
+    inputs, _ = next(iter(plain))
+    reference = torch.stack([transforms.Normalize(MEAN, STD)(transforms.ToTensor()(img))
+                             for img in trainset.data[:256]]).to(device)
+    print('matches ToTensor + Normalize:', torch.allclose(inputs, reference, atol=1e-6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+'''Images/sec of the per-image numpy/PIL noise transforms vs the batched tensor kernels.
+
+Run from the repository root:
+    python -m benchmark.corruptions --n 10000 --batch_size 500
+'''
+import argparse
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+from corruptions import gaussian_noise, salt_pepper_noise
+
+parser = argparse.ArgumentParser(description='Corruption kernel benchmark')
+parser.add_argument('--n', default=10000, type=int, help='number of images')
+parser.add_argument('--size', default=32, type=int)
+parser.add_argument('--batch_size', default=500, type=int)
+parser.add_argument('--variance', default=8.0, type=float)
+parser.add_argument('--density', default=0.05, type=float)
+args = parser.parse_args()
+
+
+def legacy_gaussian(img, mean=0.0, variance=1.0, amplitude=1.0):
+    '''AddGaussianNoise.__call__ before the batched kernel'''
+    img = np.array(img)
+    h, w, c = img.shape
+    N = amplitude * np.random.normal(loc=mean, scale=variance, size=(h, w, 1))
+    N = np.repeat(N, c, axis=2)
+    img = N + img
+    img[img > 255] = 255
+    return Image.fromarray(img.astype('uint8')).convert('RGB')
+
+
+def legacy_salt_pepper(img, density=0.0):
+    '''AddSaltPepperNoise.__call__ (p=1) before the batched kernel'''
+    img = np.array(img)
+    h, w, c = img.shape
+    mask = np.random.choice((0, 1, 2), size=(h, w, 1), p=[density / 2.0, density / 2.0, 1 - density])
+    mask = np.repeat(mask, c, axis=2)
+    img[mask == 0] = 0
+    img[mask == 1] = 255
+    return Image.fromarray(img.astype('uint8')).convert('RGB')
+
+
+def main():
+    images = np.random.randint(0, 256, (args.n, args.size, args.size, 3), dtype=np.uint8)
+    pil_images = [Image.fromarray(img) for img in images]
+
+    for name, fn in [('gaussian', lambda img: legacy_gaussian(img, 0.0, args.variance, 1.0)),
+                     ('salt-pepper', lambda img: legacy_salt_pepper(img, args.density))]:
+        start = time.time()
+        for img in pil_images:
+            np.asarray(fn(img))
+        print('%s per-image PIL: %.0f images/sec' % (name, args.n / (time.time() - start)))
+
+    devices = ['cpu'] + (['cuda'] if torch.cuda.is_available() else [])
+    for device in devices:
+        batch_images = torch.from_numpy(images).to(device)
+        generator = torch.Generator(device).manual_seed(0)
+        for name, fn in [('gaussian', lambda b: gaussian_noise(b, 0.0, args.variance, 1.0,
+                                                                 channels_last=True,
+                                                                 generator=generator)),
+                         ('salt-pepper', lambda b: salt_pepper_noise(b, args.density,
+                                                                     channels_last=True,
+                                                                     generator=generator))]:
+            if device == 'cuda':
+                torch.cuda.synchronize()
+            start = time.time()
+            for i in range(0, args.n, args.batch_size):
+                fn(batch_images[i:i + args.batch_size])
+            if device == 'cuda':
+                torch.cuda.synchronize()
+            print('%s batched on %s: %.0f images/sec' % (name, device, args.n / (time.time() - start)))
+
+    # 同一个seed得到同样的噪声
+    a = gaussian_noise(batch_images, variance=args.variance, channels_last=True,
+                       generator=torch.Generator(device).manual_seed(1))
+    b = gaussian_noise(batch_images, variance=args.variance, channels_last=True,
+                       generator=torch.Generator(device).manual_seed(1))
+    print('reproducible with a seeded generator:', torch.equal(a, b))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+'''Images/sec of ImageFolder (pil_loader over loose JPEG files) vs ShardedImageDataset (records
+read from one memory-mapped file), same transform, for the 9-class ImageNet subset.
+
+Run from the repository root, after prepare_imagenet.py --with-rec:
+    PYTHONPATH=IMAGENET-9 python -m benchmark.imagenet_rec --root ./imagenet-1k/val \
+        --rec ./imagenet-1k/rec/val --n 5000 --workers 0 8
+'''
+import argparse
+import time
+
+import torch
+import torchvision.transforms as transforms
+
+from dataset_img_9 import ImageFolder, ShardedImageDataset
+
+parser = argparse.ArgumentParser(description='ImageNet-9 loose files vs record file benchmark')
+parser.add_argument('--root', default='./imagenet-1k/val', type=str, help='ImageFolder root')
+parser.add_argument('--rec', default='./imagenet-1k/rec/val', type=str, help='record prefix')
+parser.add_argument('--val_data', default='ImageNet-A', type=str)
+parser.add_argument('--n', default=5000, type=int, help='images read per setting')
+parser.add_argument('--input_size', default=224, type=int)
+parser.add_argument('--batch_size', default=64, type=int)
+parser.add_argument('--workers', nargs='+', default=[0, 8], type=int, help='DataLoader workers')
+args = parser.parse_args()
+
+
+def main():
+    transform = transforms.Compose([
+        transforms.Resize([args.input_size, args.input_size]),
+        transforms.ToTensor(),
+    ])
+    datasets = [('pil_loader (loose files)', ImageFolder(args.root, transform=transform, val_data=args.val_data,
+                                                         manifest_dir=None)),
+                ('ShardedImageDataset', ShardedImageDataset(args.rec, transform=transform))]
+    for workers in args.workers:
+        for name, dataset in datasets:
+            subset = torch.utils.data.Subset(dataset, range(min(args.n, len(dataset))))
+            loader = torch.utils.data.DataLoader(subset, batch_size=args.batch_size, num_workers=workers)
+            start = time.time()
+            for _ in loader:
+                pass
+            print('%-26s workers=%d: %.0f images/sec' % (name, workers, len(subset) / (time.time() - start)))
+
+
+if __name__ == '__main__':
+    main()
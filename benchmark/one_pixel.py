@@ -0,0 +1,74 @@
+'''Images/sec of the one-pixel attack: attack.pixel_attack.attack (one image at a time, one forward
+per DE generation) vs attack_batch (the populations of all images in one forward per generation),
+on the same images.
+
+Without a checkpoint a randomly initialised model is attacked; pass a trained one for realistic
+iteration counts.
+
+Run from the repository root:
+    python -m benchmark.one_pixel --n 32 --maxiter 75 --popsize 400
+    python -m benchmark.one_pixel --checkpoint ./checkpoint/ResNet18/ckpt.pth_ResNet18_epoch200_none_20220424
+'''
+import argparse
+import time
+
+import torch
+
+import models
+from attack.batch_pixel_attack import attack_batch
+from attack.pixel_attack import attack, device
+
+parser = argparse.ArgumentParser(description='One-pixel attack benchmark')
+parser.add_argument('--model', default='ResNet18', type=str)
+parser.add_argument('--checkpoint', default=None, type=str, help='checkpoint with a "net" entry')
+parser.add_argument('--n', default=32, type=int, help='number of attacked images')
+parser.add_argument('--pixels', default=1, type=int)
+parser.add_argument('--maxiter', default=75, type=int)
+parser.add_argument('--popsize', default=400, type=int)
+args = parser.parse_args()
+
+# pixel_attack works on images normalised to -1~1
+MEAN = (0.5, 0.5, 0.5)
+STD = (0.5, 0.5, 0.5)
+
+
+def synchronize():
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+
+
+def main():
+    torch.manual_seed(0)
+    if args.checkpoint:
+        net = torch.load(args.checkpoint, map_location=device)['net']
+    else:
+        net = getattr(models, args.model)()
+    net = net.to(device).eval()
+
+    # uint8像素值的图片, 两种方式攻击同一批图片
+    images = torch.randint(0, 256, (args.n, 3, 32, 32)).float().div(255).sub(0.5).div(0.5).to(device)
+    with torch.inference_mode():
+        labels = net(images).argmax(1).cpu()
+
+    synchronize()
+    start = time.time()
+    success = 0
+    for img, label in zip(images, labels.tolist()):
+        result = attack(img, label, net, pixel_count=args.pixels, maxiter=args.maxiter, popsize=args.popsize)
+        success += bool(result[3])
+    synchronize()
+    elapsed = time.time() - start
+    print('pixel_attack.attack (per image): %.2f images/sec, success %d/%d' % (args.n / elapsed, success, args.n))
+
+    synchronize()
+    start = time.time()
+    results = attack_batch(images, labels, net, pixel_count=args.pixels, maxiter=args.maxiter,
+                           popsize=args.popsize, mean=MEAN, std=STD, seed=0)
+    synchronize()
+    elapsed = time.time() - start
+    success = sum(result['success'] for result in results)
+    print('attack_batch (%d images): %.2f images/sec, success %d/%d' % (args.n, args.n / elapsed, success, args.n))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+'''Samples/sec of torchattacks.PGD vs attack.pgd on CPU, with and without early exit.
+
+Without a checkpoint a randomly initialised model is attacked, which is fooled
+after very few steps; pass a trained one to see realistic early exit gains.
+
+Run from the repository root:
+    python -m benchmark.pgd --model ResNet18 --n 256 --batch_size 128
+    python -m benchmark.pgd --checkpoint ./checkpoint/ResNet18/ckpt.pth_ResNet18_epoch200_none_20220424
+'''
+import argparse
+import time
+
+import torch
+
+import models
+from attack.pgd import pgd
+
+parser = argparse.ArgumentParser(description='PGD engine benchmark')
+parser.add_argument('--model', default='ResNet18', type=str)
+parser.add_argument('--checkpoint', default=None, type=str, help='checkpoint with a "net" entry')
+parser.add_argument('--n', default=256, type=int, help='number of attacked samples')
+parser.add_argument('--batch_size', default=128, type=int)
+parser.add_argument('--steps', default=40, type=int)
+parser.add_argument('--eps', default=6.0, type=float, help='in 0~255 units')
+parser.add_argument('--alpha', default=1.0, type=float, help='in 0~255 units')
+parser.add_argument('--threads', default=None, type=int)
+args = parser.parse_args()
+
+
+def main():
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    if args.checkpoint:
+        net = torch.load(args.checkpoint, map_location='cpu')['net']
+    else:
+        net = getattr(models, args.model)()
+    net = net.cpu().eval()
+
+    images = torch.rand(args.n, 3, 32, 32)
+    with torch.inference_mode():
+        labels = net(images).argmax(1)
+    eps, alpha = args.eps / 255, args.alpha / 255
+
+    runs = []
+    try:
+        import torchattacks
+        atk = torchattacks.PGD(net, eps=eps, alpha=alpha, steps=args.steps)
+        runs.append(('torchattacks.PGD', lambda x, y: (atk(x, y), None)))
+    except ImportError:
+        print('torchattacks not installed, skipping the baseline')
+    for early_exit in [False, True]:
+        runs.append(('attack.pgd early_exit=%s' % early_exit,
+                     lambda x, y, e=early_exit: pgd(net, x, y, eps=eps, alpha=alpha,
+                                                     steps=args.steps, early_exit=e)))
+
+    for name, fn in runs:
+        correct = 0
+        start = time.time()
+        for i in range(0, args.n, args.batch_size):
+            x, y = images[i:i + args.batch_size], labels[i:i + args.batch_size]
+            adv, _ = fn(x, y)
+            with torch.inference_mode():
+                correct += int((net(adv).argmax(1) == y).sum())
+        elapsed = time.time() - start
+        print('%s: %.1f samples/sec, robust accuracy %.2f %%'
+              % (name, args.n / elapsed, 100 * correct / args.n))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''Time the PuzzleMix graphcut preprocessing: per-pair terms vs the fused graph_terms.
+
+Run from the repository root:
+    python -m benchmark.puzzlemix_graph --batch_size 100 --block_num 4
+'''
+import argparse
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from puzzlemix.mixup import graph_prior, graph_terms, neigh_penalty
+
+parser = argparse.ArgumentParser(description='PuzzleMix graphcut preprocessing benchmark')
+parser.add_argument('--batch_size', default=100, type=int)
+parser.add_argument('--width', default=32, type=int)
+parser.add_argument('--block_num', default=4, type=int)
+parser.add_argument('--neigh_size', default=4, type=int)
+parser.add_argument('--n_labels', default=3, type=int)
+parser.add_argument('--repeat', default=50, type=int)
+args = parser.parse_args()
+
+
+def legacy_terms(unary1_torch, unary2_torch, input1_pool, input2_pool, k, alpha, beta, gamma, eta,
+                 n_labels, block_num):
+    '''graphcut inputs as built before the fused routine (neigh_penalty x4 + numpy conversion)'''
+    batch_size = unary1_torch.shape[0]
+    pw_x = torch.zeros([batch_size, 2, 2, block_num - 1, block_num])
+    pw_y = torch.zeros([batch_size, 2, 2, block_num, block_num - 1])
+
+    pw_x[:, 0, 0], pw_y[:, 0, 0] = neigh_penalty(input2_pool, input2_pool, k)
+    pw_x[:, 0, 1], pw_y[:, 0, 1] = neigh_penalty(input2_pool, input1_pool, k)
+    pw_x[:, 1, 0], pw_y[:, 1, 0] = neigh_penalty(input1_pool, input2_pool, k)
+    pw_x[:, 1, 1], pw_y[:, 1, 1] = neigh_penalty(input1_pool, input1_pool, k)
+
+    pw_x = beta * gamma * pw_x
+    pw_y = beta * gamma * pw_y
+
+    unary1 = unary1_torch.clone()
+    unary2 = unary2_torch.clone()
+
+    unary2[:, :-1, :] += (pw_x[:, 1, 0] + pw_x[:, 1, 1]) / 2.
+    unary1[:, :-1, :] += (pw_x[:, 0, 1] + pw_x[:, 0, 0]) / 2.
+    unary2[:, 1:, :] += (pw_x[:, 0, 1] + pw_x[:, 1, 1]) / 2.
+    unary1[:, 1:, :] += (pw_x[:, 1, 0] + pw_x[:, 0, 0]) / 2.
+
+    unary2[:, :, :-1] += (pw_y[:, 1, 0] + pw_y[:, 1, 1]) / 2.
+    unary1[:, :, :-1] += (pw_y[:, 0, 1] + pw_y[:, 0, 0]) / 2.
+    unary2[:, :, 1:] += (pw_y[:, 0, 1] + pw_y[:, 1, 1]) / 2.
+    unary1[:, :, 1:] += (pw_y[:, 1, 0] + pw_y[:, 0, 0]) / 2.
+
+    pw_x = (pw_x[:, 1, 0] + pw_x[:, 0, 1] - pw_x[:, 1, 1] - pw_x[:, 0, 0]) / 2
+    pw_y = (pw_y[:, 1, 0] + pw_y[:, 0, 1] - pw_y[:, 1, 1] - pw_y[:, 0, 0]) / 2
+
+    unary1 = unary1.numpy()
+    unary2 = unary2.numpy()
+    pw_x = pw_x.numpy()
+    pw_y = pw_y.numpy()
+
+    large_val = 1000 * block_num**2
+    prior = graph_prior(alpha, eta, block_num, n_labels)
+    unary_cost, pw_x_cost, pw_y_cost = [], [], []
+    for i in range(batch_size):
+        unary_cost.append((large_val * np.stack(
+            [(1 - lam) * unary2[i] + lam * unary1[i] + prior[l]
+             for l, lam in enumerate(np.linspace(0, 1, n_labels))], axis=-1)).astype(np.int32))
+        pw_x_cost.append((large_val * (pw_x[i] + beta)).astype(np.int32))
+        pw_y_cost.append((large_val * (pw_y[i] + beta)).astype(np.int32))
+
+    return np.stack(unary_cost), np.stack(pw_x_cost), np.stack(pw_y_cost)
+
+
+def main():
+    torch.manual_seed(0)
+    block_size = args.width // args.block_num
+    neigh_size = min(args.neigh_size, block_size)
+    k = block_size // neigh_size
+    beta = 1.2 / args.block_num / 16
+    alpha, gamma, eta = 0.4, 0.5, 0.2
+
+    indices = np.random.permutation(args.batch_size)
+    inputs = torch.rand(args.batch_size, 3, args.width, args.width)
+    grad_pool = F.avg_pool2d(torch.rand(args.batch_size, args.width, args.width), block_size)
+    unary1 = grad_pool / grad_pool.reshape(args.batch_size, -1).sum(1).reshape(-1, 1, 1)
+    unary2 = unary1[indices]
+    input1_pool = F.avg_pool2d(inputs, neigh_size)
+    input2_pool = input1_pool[indices]
+
+    legacy = legacy_terms(unary1, unary2, input1_pool, input2_pool, k, alpha, beta, gamma, eta,
+                          args.n_labels, args.block_num)
+    fused = [t.numpy() for t in graph_terms(unary1, unary2, input1_pool, input2_pool, k, alpha,
+                                            beta, gamma, eta, args.n_labels)]
+    for name, a, b in zip(['unary', 'pw_x', 'pw_y'], legacy, fused):
+        print('%s max abs diff: %d' % (name, np.abs(a.astype(np.int64) - b).max()))
+
+    for name, fn in [('legacy', lambda: legacy_terms(unary1, unary2, input1_pool, input2_pool, k,
+                                                      alpha, beta, gamma, eta, args.n_labels,
+                                                      args.block_num)),
+                     ('fused', lambda: [t.numpy() for t in graph_terms(
+                         unary1, unary2, input1_pool, input2_pool, k, alpha, beta, gamma, eta,
+                         args.n_labels)])]:
+        start = time.time()
+        for _ in range(args.repeat):
+            fn()
+        print('%s: %.3f ms / step' % (name, 1000 * (time.time() - start) / args.repeat))
+
+
+if __name__ == '__main__':
+    main()
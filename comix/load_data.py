@@ -3,24 +3,57 @@ import os
 from torchvision import datasets, transforms
 from torch.utils.data.sampler import SubsetRandomSampler
 import numpy as np
-from functools import reduce
-from operator import __or__
+import hashlib
 
 
 # Random sampler
-def get_sampler(labels, n_labels, n=None, n_valid=None):
+def split_indices(labels, n_labels, n=None, n_valid=None, rng=np.random):
+    '''
+    Per class (in class order): the first n_valid shuffled indices for valid, the next n for train,
+    all of them for unlabelled. One stable argsort by label instead of one scan per class.
+    '''
+    labels = np.asarray(labels)
     # Only choose digits in n_labels
-    (indices, ) = np.where(reduce(__or__, [labels == i for i in np.arange(n_labels)]))
-    np.random.shuffle(indices)
-
-    indices_valid = np.hstack(
-        [list(filter(lambda idx: labels[idx] == i, indices))[:n_valid] for i in range(n_labels)])
-    indices_train = np.hstack([
-        list(filter(lambda idx: labels[idx] == i, indices))[n_valid:n_valid + n]
-        for i in range(n_labels)
-    ])
-    indices_unlabelled = np.hstack(
-        [list(filter(lambda idx: labels[idx] == i, indices))[:] for i in range(n_labels)])
+    indices = np.flatnonzero((labels >= 0) & (labels < n_labels))
+    rng.shuffle(indices)
+
+    # stable: inside a class the shuffled order is kept
+    indices = indices[np.argsort(labels[indices], kind='stable')]
+    counts = np.bincount(labels[indices], minlength=n_labels)
+    rank = np.arange(len(indices)) - np.repeat(np.cumsum(counts) - counts, counts)  # position in its class
+    start = n_valid or 0
+    valid = rank < n_valid if n_valid is not None else np.ones(len(indices), dtype=bool)
+    train = rank >= start if n is None else (rank >= start) & (rank < start + n)
+    return indices[train], indices[valid], indices
+
+
+def get_sampler(labels, n_labels, n=None, n_valid=None, seed=None, dataset=None,
+                cache_dir='./data/sampler_cache'):
+    '''
+    SubsetRandomSampler of train, valid and unlabelled indices. With a seed and a dataset name the
+    index arrays are cached in cache_dir by (dataset, n_labels, n, n_valid, seed) and reused.
+    '''
+    labels = np.asarray(labels)
+    rng = np.random.RandomState(seed) if seed is not None else np.random
+    path = None
+    if seed is not None and dataset is not None and cache_dir is not None:
+        path = os.path.join(cache_dir, '%s_%d_%s_%s_%d.npz' % (dataset, n_labels, n, n_valid, seed))
+    digest = hashlib.sha1(labels.astype(np.int64).tobytes()).hexdigest()
+    cached = None
+    if path is not None and os.path.exists(path):
+        with np.load(path) as f:
+            if str(f['labels_sha1']) == digest:  # a dataset of the same name but with other labels is not reused
+                cached = {k: f[k] for k in ('train', 'valid', 'unlabelled')}
+    if cached is not None:
+        indices_train, indices_valid, indices_unlabelled = cached['train'], cached['valid'], cached['unlabelled']
+    else:
+        indices_train, indices_valid, indices_unlabelled = split_indices(labels, n_labels, n, n_valid, rng)
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp = '%s.%d.tmp.npz' % (path[:-len('.npz')], os.getpid())
+            np.savez(tmp, train=indices_train, valid=indices_valid, unlabelled=indices_unlabelled,
+                     labels_sha1=digest)
+            os.replace(tmp, path)
 
     indices_train = torch.from_numpy(indices_train)
     indices_valid = torch.from_numpy(indices_valid)
@@ -36,7 +69,8 @@ def load_data_subset(batch_size,
                      dataset,
                      data_target_dir,
                      labels_per_class=100,
-                     valid_labels_per_class=500):
+                     valid_labels_per_class=500,
+                     seed=None):
     '''Return datalaoder (from GibbsNet_pytorch/load.py)'''
     if dataset == 'cifar10':
         mean = [x / 255 for x in [125.3, 123.0, 113.9]]
@@ -108,7 +142,8 @@ def load_data_subset(batch_size,
         pass
     else:
         train_sampler, valid_sampler, unlabelled_sampler = get_sampler(
-            train_data.targets, num_classes, labels_per_class, valid_labels_per_class)
+            train_data.targets, num_classes, labels_per_class, valid_labels_per_class, seed=seed,
+            dataset=dataset)
 
     # Dataloader
     if dataset == 'tiny-imagenet-200':
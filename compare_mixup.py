@@ -10,7 +10,7 @@ import json
 from torch.utils.data.distributed import DistributedSampler
 import random
 import matplotlib.pyplot as plt
-from dataset_img_9 import get_imagenet_dataloader
+from dataset_img_9 import get_imagenet_dataloader, ManifestSampler
 
 
 parser = argparse.ArgumentParser(description='PyTorch CIFAR10 Training')
@@ -66,8 +66,8 @@ test_dir = './imagenet-1k/val'
 
 trainset =  get_imagenet_dataloader(train_dir, batch_size=batch_size, transform = transform_train,train=True, val_data='ImageNet-A',)
 trainloader = torch.utils.data.DataLoader(
-    trainset, batch_size=batch_size, num_workers=2,sampler=DistributedSampler(trainset)) # 这个sampler会自动分配数据到各个gpu上
+    trainset, batch_size=batch_size, num_workers=2,sampler=ManifestSampler(trainset)) # 这个sampler会自动分配数据到各个gpu上
 
 testset = get_imagenet_dataloader(test_dir, batch_size=1,transform = transform_test, train=False, val_data='ImageNet-A',)
 testloader = torch.utils.data.DataLoader(
-    testset, batch_size=1,  num_workers=2,sampler=DistributedSampler(testset,shuffle=False))
\ No newline at end of file
+    testset, batch_size=1,  num_workers=2,sampler=ManifestSampler(testset,shuffle=False))
\ No newline at end of file
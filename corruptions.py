@@ -0,0 +1,146 @@
+import numpy as np
+import torch
+from PIL import Image
+
+
+def _pixel_shape(images, channels_last):
+    '''[B, H, W, 1] or [B, 1, H, W]: one value per pixel, shared by the channels'''
+    if channels_last:
+        return images.shape[:-1] + (1, )
+    return images.shape[:1] + (1, ) + images.shape[2:]
+
+
+def _per_image(value, images):
+    '''a [B] tensor of parameters (one severity per image) broadcast over [B, ...]'''
+    if torch.is_tensor(value) and value.dim() == 1:
+        return value.to(images.device).view(-1, *([1] * (images.dim() - 1)))
+    return value
+
+
+def gaussian_noise(images, mean=0.0, variance=1.0, amplitude=1.0, channels_last=False,
+                   generator=None):
+    """
+    Gaussian noise on a whole batch, on the device of images.
+
+    :param images: uint8 batch in 0~255, or float batch in 0~1 (mean / variance are still
+                   in 0~255 units)
+    :param mean, variance, amplitude: floats, or [B] tensors with one value per image
+    :param channels_last: [B, H, W, C] instead of [B, C, H, W]
+    :param generator: torch.Generator on the device of images, for reproducible noise
+    :return: noisy batch of the same dtype, clipped to the valid range
+    """
+    mean, variance, amplitude = [_per_image(v, images) for v in (mean, variance, amplitude)]
+    noise = torch.randn(_pixel_shape(images, channels_last), generator=generator,
+                        device=images.device)
+    noise = amplitude * (noise * variance + mean)
+    if images.dtype == torch.uint8:
+        # 与 astype('uint8') 一样向下取整
+        return (images.float() + noise).clamp_(0, 255).to(torch.uint8)
+    return (images + noise / 255.).clamp_(0, 1)
+
+
+def salt_pepper_noise(images, density=0.0, p=1.0, channels_last=False, generator=None):
+    """
+    Salt and pepper noise on a whole batch: every pixel (all its channels) becomes 0 with
+    probability density / 2, max with probability density / 2, for the images picked with
+    probability p. density and p may be [B] tensors with one value per image.
+    """
+    density = _per_image(density, images)
+    u = torch.rand(_pixel_shape(images, channels_last), generator=generator, device=images.device)
+    picked = torch.rand(len(images), generator=generator, device=images.device) < p
+    picked = picked.view(-1, *([1] * (images.dim() - 1)))
+    pepper = (u < density / 2.) & picked
+    salt = (u >= density / 2.) & (u < density) & picked
+    high = 255 if images.dtype == torch.uint8 else 1.
+    return images.masked_fill(pepper, 0).masked_fill(salt, high)
+
+
+def apply_to_pil(kernel, img, **kwargs):
+    '''run a batch kernel on one PIL image / HWC array, for the per-image transforms'''
+    img = torch.from_numpy(np.array(img, dtype=np.uint8))[None]
+    img = kernel(img, channels_last=True, **kwargs)
+    return Image.fromarray(img[0].numpy()).convert('RGB')
+
+
+class AddGaussianNoise(object):
+    '''per-image transform, see gaussian_noise for whole batches'''
+
+    def __init__(self, mean=0.0, variance=1.0, amplitude=1.0, generator=None):
+
+        self.mean = mean            #均值
+        self.variance = variance    #方差
+        self.amplitude = amplitude  #倍数，原始图像所加的高斯噪声的倍数
+        self.generator = generator
+
+    def __call__(self, img):
+        return apply_to_pil(gaussian_noise, img, mean=self.mean, variance=self.variance,
+                             amplitude=self.amplitude, generator=self.generator)
+
+
+def random_erasing(images, probability=0.5, sl=0.02, sh=0.4, r1=0.3,
+                   mean=(0.4914, 0.4822, 0.4465), attempts=100, generator=None):
+    """
+    Random Erasing on a whole [B, C, H, W] batch, on the device of images.
+
+    The area / aspect ratio rejection sampling of RandomErasing is done for all images and
+    all attempts at once, the first fitting rectangle of every image is kept, and all the
+    rectangles are written with one broadcasted mask.
+
+    :param probability: float, or a [B] tensor with one value per image
+    :param mean: erasing value of every channel (only the first is used for 1 channel images)
+    :return: erased copy of images
+    """
+    batch, channels, height, width = images.shape
+    device = images.device
+
+    def uniform(low, high, *size):
+        return low + (high - low) * torch.rand(*size, generator=generator, device=device)
+
+    erase = torch.rand(batch, generator=generator, device=device) <= probability
+    target_area = uniform(sl, sh, batch, attempts) * (height * width)
+    aspect_ratio = uniform(r1, 1 / r1, batch, attempts)
+    h = torch.round(torch.sqrt(target_area * aspect_ratio)).long()
+    w = torch.round(torch.sqrt(target_area / aspect_ratio)).long()
+
+    # first attempt that fits, images without one are left unchanged
+    fits = (w < width) & (h < height)
+    first = torch.argmax(fits.int(), dim=1, keepdim=True)
+    erase &= fits.any(1)
+    h, w = h.gather(1, first), w.gather(1, first)
+    x1 = (torch.rand(batch, 1, generator=generator, device=device) * (height - h + 1)).long()
+    y1 = (torch.rand(batch, 1, generator=generator, device=device) * (width - w + 1)).long()
+
+    rows = torch.arange(height, device=device).view(1, -1)
+    cols = torch.arange(width, device=device).view(1, -1)
+    mask = (((rows >= x1) & (rows < x1 + h)).view(batch, 1, height, 1)
+            & ((cols >= y1) & (cols < y1 + w)).view(batch, 1, 1, width)
+            & erase.view(batch, 1, 1, 1))
+
+    value = torch.as_tensor(list(mean)[:channels], dtype=images.dtype, device=device).view(1, -1, 1, 1)
+    return torch.where(mask, value, images)
+
+
+class RandomErasing(object):
+    '''
+    Class that performs Random Erasing in Random Erasing Data Augmentation
+    -------------------------------------------------------------------------------------
+    probability: The probability that the operation will be performed.
+    sl: min erasing area
+    sh: max erasing area
+    r1: min aspect ratio
+    mean: erasing value
+    -------------------------------------------------------------------------------------
+    per-image transform on a [C, H, W] tensor, see random_erasing for whole batches
+    '''
+    def __init__(self, probability=0.5, sl=0.02, sh=0.4, r1=0.3, mean=[0.4914, 0.4822, 0.4465],
+                 generator=None):
+        self.probability = probability
+        self.mean = mean
+        self.sl = sl
+        self.sh = sh
+        self.r1 = r1
+        self.generator = generator
+
+    def __call__(self, img):
+        return random_erasing(img[None], self.probability, self.sl, self.sh, self.r1, self.mean,
+                              generator=self.generator)[0]
@@ -1,12 +1,16 @@
 """Prepare the ImageNet dataset"""
 import os
+import sys
+import io
 import argparse
+import hashlib
 import tarfile
 import pickle
 import gzip
 import subprocess
 from tqdm import tqdm
 import subprocess
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 # from encoding.utils import check_sha1, download, mkdir
 from files import check_sha1, download, mkdir
 _TARGET_DIR = os.path.expanduser('~/.encoding/data/ILSVRC2012')
@@ -24,47 +28,128 @@ def parse_args():
     parser.add_argument('--target-dir', default=_TARGET_DIR,
                         help="The directory to store extracted images")
     parser.add_argument('--checksum', action='store_true',
-                        help="If check integrity before extracting.")
+                        help="If check integrity, the sha1 is computed while extracting.")
     parser.add_argument('--with-rec', action='store_true',
                         help="If build image record files.")
     parser.add_argument('--num-thread', type=int, default=1,
-                        help="Number of threads to use when building image record file.")
+                        help="Number of processes extracting the class tars, and of threads building image record file.")
+    parser.add_argument('--rec-subset', default='ImageNet-A',
+                        help="val_data subset of dataset_img_9 packed into the record files.")
+    parser.add_argument('--rec-size', type=int, default=256,
+                        help="Shorter side of the images in the record files (0 keeps the original size).")
+    parser.add_argument('--rec-quality', type=int, default=95,
+                        help="JPEG quality of the images in the record files.")
     args = parser.parse_args()
     return args
 
 def check_file(filename, checksum, sha1):
+    # the sha1 is checked while extracting (HashingReader), not in a separate pass over the file
     if not os.path.exists(filename):
         raise ValueError('File not found: '+filename)
-    if checksum and not check_sha1(filename, sha1):
-        raise ValueError('Corrupted file: '+filename)
 
-def extract_train(tar_fname, target_dir, with_rec=False, num_thread=1):
+class HashingReader(object):
+    """File object that updates a sha1 with every byte read through it"""
+    def __init__(self, f):
+        self.f = f
+        self.sha1 = hashlib.sha1()
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.sha1.update(data)
+        return data
+
+    def hexdigest(self):
+        # the bytes after the last tar member (end of archive blocks) are hashed too
+        while self.read(1048576):
+            pass
+        return self.sha1.hexdigest()
+
+def open_archive(tar_fname, sha1):
+    """tar opened as a stream through a HashingReader when sha1 is checked, seekable otherwise"""
+    f = open(tar_fname, 'rb')
+    if sha1 is None:
+        return f, None, tarfile.open(fileobj=f, mode='r:')
+    reader = HashingReader(f)
+    return f, reader, tarfile.open(fileobj=reader, mode='r|')
+
+def verify_archive(tar_fname, reader, sha1):
+    if reader is not None and reader.hexdigest() != sha1:
+        raise ValueError('Corrupted file: '+tar_fname)
+
+def extract_class(data, class_dir, mark=True):
+    """extract one class tar from its bytes, then mark the class as done"""
+    os.makedirs(class_dir, exist_ok=True)
+    with tarfile.open(fileobj=io.BytesIO(data)) as f:
+        f.extractall(class_dir)
+    if mark:
+        open(class_dir + '.done', 'w').close()
+    return os.path.basename(class_dir)
+
+def pack_records(image_dir, split, with_rec, num_thread, rec_args):
+    '''pack the 9-class subset of image_dir into <target>/rec/<split>.rec + <split>.idx.npz'''
+    if not with_rec:
+        return
+    # dataset_img_9.py sits next to datasets/prepare_imagenet.py, the root copy takes it from datasets/
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'datasets'))
+    from dataset_img_9 import write_records
+    prefix = os.path.join(os.path.dirname(image_dir), 'rec', split)
+    print('Building ' + prefix + '.rec')
+    n = write_records(image_dir, prefix, num_thread=num_thread, **(rec_args or {}))
+    print('%d images packed' % n)
+
+def extract_train(tar_fname, target_dir, with_rec=False, num_thread=1, rec_args=None, sha1=None):
     mkdir(target_dir)
-    with tarfile.open(tar_fname) as tar:
-        print("Extracting "+tar_fname+"...")
-        # extract each class one-by-one
-        pbar = tqdm(total=len(tar.getnames()))
+    print("Extracting "+tar_fname+"...")
+    f, reader, tar = open_archive(tar_fname, sha1)
+    # the class tars are read from the outer archive in memory and extracted by a process pool,
+    # classes with a .done mark are skipped so an interrupted run can be resumed.
+    # With a sha1 the marks are written only once the whole archive is verified, so the classes of
+    # a corrupted archive are extracted again from the re-downloaded one
+    pbar = tqdm(unit='class')
+    pending = set()
+    extracted = []
+    with f, tar, ProcessPoolExecutor(num_thread) as pool:
         for class_tar in tar:
-            pbar.set_description('Extract '+class_tar.name)
-            tar.extract(class_tar, target_dir)
-            class_fname = os.path.join(target_dir, class_tar.name)
-            class_dir = os.path.splitext(class_fname)[0]
-            os.mkdir(class_dir)
-            with tarfile.open(class_fname) as f:
-                f.extractall(class_dir)
-            os.remove(class_fname)
+            class_dir = os.path.join(target_dir, os.path.splitext(class_tar.name)[0])
+            if os.path.exists(class_dir + '.done'):
+                pbar.update(1)
+                continue
+            pending.add(pool.submit(extract_class, tar.extractfile(class_tar).read(), class_dir, sha1 is None))
+            extracted.append(class_dir)
+            # at most 2 class tars per process in memory
+            while len(pending) >= 2 * num_thread:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    pbar.set_description('Extract ' + fut.result())
+                    pbar.update(1)
+        for fut in pending:
+            pbar.set_description('Extract ' + fut.result())
             pbar.update(1)
-        pbar.close()
+        verify_archive(tar_fname, reader, sha1)
+    if sha1 is not None:
+        for class_dir in extracted:
+            open(class_dir + '.done', 'w').close()
+    pbar.close()
+    pack_records(target_dir, 'train', with_rec, num_thread, rec_args)
 
-def extract_val(tar_fname, target_dir, with_rec=False, num_thread=1):
+def extract_val(tar_fname, target_dir, with_rec=False, num_thread=1, rec_args=None, sha1=None):
     mkdir(target_dir)
-    print('Extracting ' + tar_fname)
-    with tarfile.open(tar_fname) as tar:
-        tar.extractall(target_dir)
-    # build rec file before images are moved into subfolders
-    # move images to proper subfolders
-    subprocess.call(["wget -qO- https://raw.githubusercontent.com/soumith/imagenetloader.torch/master/valprep.sh | bash"],
-                    cwd=target_dir, shell=True)
+    done = os.path.join(target_dir, '.done')
+    if os.path.exists(done):
+        print('Skip ' + tar_fname + ', already extracted')
+    else:
+        print('Extracting ' + tar_fname)
+        f, reader, tar = open_archive(tar_fname, sha1)
+        with f, tar:
+            tar.extractall(target_dir)
+            verify_archive(tar_fname, reader, sha1)
+        # move images to proper subfolders; pipefail so that a failed wget is an error too, and val is
+        # not marked as done with the images still unsorted
+        subprocess.check_call(["set -o pipefail; wget -qO- https://raw.githubusercontent.com/soumith/imagenetloader.torch/master/valprep.sh | bash"],
+                              cwd=target_dir, shell=True, executable='/bin/bash')
+        open(done, 'w').close()
+    # the labels of the records come from the class subfolders
+    pack_records(target_dir, 'val', with_rec, num_thread, rec_args)
     
 
 def main():
@@ -81,10 +166,13 @@ def main():
     check_file(val_tar_fname, args.checksum, _VAL_TAR_SHA1)
 
     build_rec = args.with_rec
+    rec_args = {'val_data': args.rec_subset, 'size': args.rec_size, 'quality': args.rec_quality}
     if build_rec:
-        os.makedirs(os.path.join(target_dir, 'rec'))
-    extract_train(train_tar_fname, os.path.join(target_dir, 'train'), build_rec, args.num_thread)
-    extract_val(val_tar_fname, os.path.join(target_dir, 'val'), build_rec, args.num_thread)
+        os.makedirs(os.path.join(target_dir, 'rec'), exist_ok=True)
+    extract_train(train_tar_fname, os.path.join(target_dir, 'train'), build_rec, args.num_thread, rec_args,
+                  sha1=_TRAIN_TAR_SHA1 if args.checksum else None)
+    extract_val(val_tar_fname, os.path.join(target_dir, 'val'), build_rec, args.num_thread, rec_args,
+                sha1=_VAL_TAR_SHA1 if args.checksum else None)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,98 @@
+import os
+
+import torch
+import torch.multiprocessing as mp
+from torchvision import models
+
+
+def _worker(rank, model_name, norm, cores, inputs, logits, grad_logits, grad_inputs, conn):
+    '''one source model per process: forward / backward on the shared buffers on request'''
+    if cores:
+        os.sched_setaffinity(0, cores)
+        torch.set_num_threads(len(cores))
+    model = models.__dict__[model_name](pretrained=True).eval()
+    for param in model.parameters():
+        param.requires_grad = False
+    conn.send('ready')
+
+    x, out = None, None
+    while True:
+        cmd, n = conn.recv()
+        if cmd == 'forward':
+            x = inputs[:n].clone().requires_grad_(True)
+            out = model(norm(x))
+            logits[rank, :n] = out.detach()
+        elif cmd == 'backward':
+            grad_inputs[rank, :n] = torch.autograd.grad(out, x, grad_logits[:n])[0]
+            x, out = None, None
+        else:
+            break
+        conn.send('done')
+
+
+class ParallelEnsemble(object):
+    '''
+    Source models of a transfer attack in their own worker processes (plain multiprocessing,
+    CPU), each pinned to its own subset of cores. The batch, the logits and the gradients
+    are exchanged through shared memory, only small commands go through the pipes.
+
+    logits = ensemble(X_adv) is the average of the source model logits and is differentiable:
+    the backward sends dL/dlogits to every worker and averages the input gradients they return,
+    so the gradient is the same as with all models in one process.
+    '''
+
+    def __init__(self, model_names, norm, max_batch, input_size=224, num_classes=1000):
+        self.num_models = len(model_names)
+        self.inputs = torch.zeros(max_batch, 3, input_size, input_size).share_memory_()
+        self.logits = torch.zeros(self.num_models, max_batch, num_classes).share_memory_()
+        self.grad_logits = torch.zeros(max_batch, num_classes).share_memory_()
+        self.grad_inputs = torch.zeros(self.num_models, max_batch, 3, input_size,
+                                       input_size).share_memory_()
+
+        cores = sorted(os.sched_getaffinity(0))
+        per_worker = max(1, len(cores) // self.num_models)
+        ctx = mp.get_context('spawn')
+        self.conns, self.procs = [], []
+        for rank, name in enumerate(model_names):
+            worker_cores = cores[rank * per_worker:(rank + 1) * per_worker] if len(cores) >= self.num_models else None
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(target=_worker, daemon=True,
+                               args=(rank, name, norm, worker_cores, self.inputs, self.logits,
+                                     self.grad_logits, self.grad_inputs, child))
+            proc.start()
+            self.conns.append(parent)
+            self.procs.append(proc)
+        for conn in self.conns:
+            conn.recv()  # 等待所有模型加载完成
+
+    def _run(self, cmd, n):
+        for conn in self.conns:
+            conn.send((cmd, n))
+        for conn in self.conns:
+            conn.recv()
+
+    def __call__(self, X_adv):
+        return _EnsembleFunction.apply(X_adv, self)
+
+    def close(self):
+        for conn in self.conns:
+            conn.send(('stop', 0))
+        for proc in self.procs:
+            proc.join()
+
+
+class _EnsembleFunction(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, X_adv, ensemble):
+        n = X_adv.shape[0]
+        ctx.ensemble, ctx.n, ctx.device = ensemble, n, X_adv.device
+        ensemble.inputs[:n] = X_adv.detach()
+        ensemble._run('forward', n)
+        return ensemble.logits[:, :n].mean(0).to(X_adv.device)
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        ensemble, n = ctx.ensemble, ctx.n
+        ensemble.grad_logits[:n] = grad_output
+        ensemble._run('backward', n)
+        return ensemble.grad_inputs[:, :n].mean(0).to(ctx.device), None
@@ -1,6 +1,7 @@
 __author__ = 'Haohan Wang'
 
 import numpy as np
+import scipy.fft
 from scipy import signal
 
 def fft(img):
@@ -28,11 +29,68 @@ def distance(i, j, imageSize, r):
 
 def mask_radial(img, r):
     rows, cols = img.shape
-    mask = np.zeros((rows, cols))
-    for i in range(rows):
-        for j in range(cols):
-            mask[i, j] = distance(i, j, imageSize=rows, r=r)
-    return mask
+    return radial_masks(rows, cols, [r])[0].astype(np.float64)
+
+
+_RADIAL_MASKS = {}
+
+
+def radial_masks(rows, cols, radius):
+    '''low frequency masks of all radii [R, rows, cols] (float32, centred spectrum), cached by (rows, cols, r)'''
+    for r in radius:
+        if (rows, cols, r) not in _RADIAL_MASKS:
+            i = np.arange(rows).reshape(-1, 1)
+            j = np.arange(cols).reshape(1, -1)
+            # 与distance()相同: 中心为(rows/2, rows/2), dis < r
+            dis = np.sqrt((i - rows / 2) ** 2 + (j - rows / 2) ** 2)
+            _RADIAL_MASKS[(rows, cols, r)] = (dis < r).astype(np.float32)
+    return np.stack([_RADIAL_MASKS[(rows, cols, r)] for r in radius])
+
+
+def frequency_decompose(images, radius, out=None, batch_size=None, max_bytes=1 << 28, workers=-1):
+    """
+    low and high frequency components of the images for all radii, one fft2 per image
+
+    The images are transformed batch by batch (float32 / complex64), the spectrum is masked with
+    every radius and all low components are inverted in one ifft2. high = image - low, which is
+    the inverse of the spectrum masked with (1 - mask).
+
+    :param images: [N, H, W, C] images (uint8 or float)
+    :param radius: list of radii
+    :param out: optional {r: (low, high)} preallocated [N, H, W, C] outputs (e.g. open_memmap)
+    :param batch_size: images per fft, default: as many as fit in max_bytes of complex spectra
+    :return: {r: (low, high)}, float32
+    """
+    n, rows, cols = images.shape[:3]
+    if out is None:
+        out = {r: (np.empty(images.shape, np.float32), np.empty(images.shape, np.float32))
+               for r in radius}
+    if batch_size is None:
+        batch_size = max(1, max_bytes // (8 * (len(radius) + 1) * int(np.prod(images.shape[1:]))))
+    # 掩码定义在fftshift后的频谱上, 先ifftshift掩码即可直接乘未移位的频谱
+    masks = np.fft.ifftshift(radial_masks(rows, cols, radius), axes=(1, 2))
+    masks = masks.reshape(len(radius), 1, rows, cols, *([1] * (images.ndim - 3)))
+    for start in range(0, n, batch_size):
+        x = np.asarray(images[start:start + batch_size], dtype=np.float32)
+        spectrum = scipy.fft.fft2(x, axes=(1, 2), workers=workers)
+        lows = scipy.fft.ifft2(spectrum[None] * masks, axes=(2, 3), workers=workers).real
+        for k, r in enumerate(radius):
+            out[r][0][start:start + len(x)] = lows[k]
+            out[r][1][start:start + len(x)] = x - lows[k]
+    return out
+
+
+def save_frequency_data(images, radius, prefix, **kwargs):
+    '''writes <prefix>_low_<r>.npy and <prefix>_high_<r>.npy for all radii, streamed to memory-mapped files'''
+    out = {}
+    for r in radius:
+        out[r] = tuple(np.lib.format.open_memmap('%s_%s_%d.npy' % (prefix, band, r), mode='w+',
+                                                 dtype=np.float32, shape=images.shape)
+                       for band in ['low', 'high'])
+    frequency_decompose(images, radius, out=out, **kwargs)
+    for low, high in out.values():
+        low.flush()
+        high.flush()
 
 
 def generateSmoothKernel(data, r):
@@ -64,26 +122,7 @@ def generateDataWithDifferentFrequencies_GrayScale(Images, r):
     return np.array(Images_freq_low)
 
 def generateDataWithDifferentFrequencies_3Channel(Images, r):
-    Images_freq_low = []
-    Images_freq_high = []
-    mask = mask_radial(np.zeros([Images.shape[1], Images.shape[2]]), r)
-    for i in range(Images.shape[0]):
-        tmp = np.zeros([Images.shape[1], Images.shape[2], 3])
-        for j in range(3):
-            fd = fftshift(Images[i, :, :, j])
-            fd = fd * mask
-            img_low = ifftshift(fd)
-            tmp[:,:,j] = np.real(img_low)
-        Images_freq_low.append(tmp)
-        tmp = np.zeros([Images.shape[1], Images.shape[2], 3])
-        for j in range(3):
-            fd = fftshift(Images[i, :, :, j])
-            fd = fd * (1 - mask)
-            img_high = ifftshift(fd)
-            tmp[:,:,j] = np.real(img_high)
-        Images_freq_high.append(tmp)
-
-    return np.array(Images_freq_low), np.array(Images_freq_high)
+    return frequency_decompose(Images, [r])[r]
 
 if __name__ == '__main__':
     import sys
@@ -122,46 +161,6 @@ if __name__ == '__main__':
     np.save('./data/CIFAR10/train_images', train_images)
     np.save('./data/CIFAR10/train_label', train_labels)
 
-    train_image_low_4, train_image_high_4 = generateDataWithDifferentFrequencies_3Channel(train_images, 4)
-    np.save('./data/CIFAR10/train_data_low_4', train_image_low_4)
-    np.save('./data/CIFAR10/train_data_high_4', train_image_high_4)
-
-    train_image_low_8, train_image_high_8 = generateDataWithDifferentFrequencies_3Channel(train_images, 8)
-    np.save('./data/CIFAR10/train_data_low_8', train_image_low_8)
-    np.save('./data/CIFAR10/train_data_high_8', train_image_high_8)
-
-    train_image_low_12, train_image_high_12 = generateDataWithDifferentFrequencies_3Channel(train_images, 12)
-    np.save('./data/CIFAR10/train_data_low_12', train_image_low_12)
-    np.save('./data/CIFAR10/train_data_high_12', train_image_high_12)
-
-    train_image_low_16, train_image_high_16 = generateDataWithDifferentFrequencies_3Channel(train_images, 16)
-    np.save('./data/CIFAR10/train_data_low_16', train_image_low_16)
-    np.save('./data/CIFAR10/train_data_high_16', train_image_high_16)
-
-    eval_image_low_4, eval_image_high_4 = generateDataWithDifferentFrequencies_3Channel(eval_images, 4)
-    np.save('./data/CIFAR10/test_data_low_4', eval_image_low_4)
-    np.save('./data/CIFAR10/test_data_high_4', eval_image_high_4)
-
-    eval_image_low_8, eval_image_high_8 = generateDataWithDifferentFrequencies_3Channel(eval_images, 8)
-    np.save('./data/CIFAR10/test_data_low_8', eval_image_low_8)
-    np.save('./data/CIFAR10/test_data_high_8', eval_image_high_8)
-
-    eval_image_low_12, eval_image_high_12 = generateDataWithDifferentFrequencies_3Channel(eval_images, 12)
-    np.save('./data/CIFAR10/test_data_low_12', eval_image_low_12)
-    np.save('./data/CIFAR10/test_data_high_12', eval_image_high_12)
-
-    eval_image_low_16, eval_image_high_16 = generateDataWithDifferentFrequencies_3Channel(eval_images, 16)
-    np.save('./data/CIFAR10/test_data_low_16', eval_image_low_16)
-    np.save('./data/CIFAR10/test_data_high_16', eval_image_high_16)
-
-    eval_image_low_20, eval_image_high_20 = generateDataWithDifferentFrequencies_3Channel(eval_images, 20)
-    np.save('./data/CIFAR10/test_data_low_20', eval_image_low_20)
-    np.save('./data/CIFAR10/test_data_high_20', eval_image_high_20)
-
-    eval_image_low_24, eval_image_high_24 = generateDataWithDifferentFrequencies_3Channel(eval_images, 24)
-    np.save('./data/CIFAR10/test_data_low_24', eval_image_low_24)
-    np.save('./data/CIFAR10/test_data_high_24', eval_image_high_24)
-
-    eval_image_low_28, eval_image_high_28 = generateDataWithDifferentFrequencies_3Channel(eval_images, 28)
-    np.save('./data/CIFAR10/test_data_low_28', eval_image_low_28)
-    np.save('./data/CIFAR10/test_data_high_28', eval_image_high_28)
\ No newline at end of file
+    # 每个batch只做一次fft, 所有半径的低频/高频一次得到
+    save_frequency_data(train_images, [4, 8, 12, 16], './data/CIFAR10/train_data')
+    save_frequency_data(eval_images, [4, 8, 12, 16, 20, 24, 28], './data/CIFAR10/test_data')
@@ -0,0 +1,93 @@
+'''CIFAR training batches augmented on the training device.
+
+    trainloader = GPUTrainLoader(trainset.data, trainset.targets, batch_size=128,
+                                 mean=(0.4914, 0.4822, 0.4465), std=(0.2023, 0.1994, 0.2010))
+    for inputs, targets in trainloader:
+        ...
+
+All training images stay on the device as one uint8 tensor. A batch is an
+index into it, and RandomCrop(padding) + RandomHorizontalFlip + ToTensor +
+Normalize are batched tensor ops, so there is no per-sample Python work and
+no DataLoader worker.
+'''
+import math
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+
+def random_crop_flip(images, padding=4, flip=True, generator=None):
+    """
+    RandomCrop(size, padding) followed by RandomHorizontalFlip, with its own offsets and flip for
+    every image of the batch
+
+    :param images: [B, C, H, W] (uint8), zero padded like RandomCrop's default fill
+    """
+    B, C, H, W = images.shape
+    device = images.device
+    if padding:
+        images = F.pad(images, (padding, padding, padding, padding))
+    dy = torch.randint(0, 2 * padding + 1, (B, 1), device=device, generator=generator)
+    dx = torch.randint(0, 2 * padding + 1, (B, 1), device=device, generator=generator)
+    rows = dy + torch.arange(H, device=device)
+    cols = dx + torch.arange(W, device=device)
+    if flip:
+        flipped = torch.rand(B, 1, device=device, generator=generator) < 0.5
+        cols = torch.where(flipped, cols.flip(1), cols)
+    # 每张图片按各自的行列下标gather
+    batch_index = torch.arange(B, device=device).view(B, 1, 1, 1)
+    channel_index = torch.arange(C, device=device).view(1, C, 1, 1)
+    return images[batch_index, channel_index, rows.view(B, 1, H, 1), cols.view(B, 1, 1, W)]
+
+
+def normalize(images, mean, std):
+    '''uint8 [B, C, H, W] -> (x / 255 - mean) / std, as ToTensor + Normalize'''
+    return (images.float().div(255) - mean) / std
+
+
+class GPUTrainLoader(object):
+    '''
+    Drop-in for the training DataLoader of train.py: iterating gives augmented, normalised
+    (inputs, targets) already on the device, one shuffled pass over the data per epoch,
+    len() is the number of batches.
+    '''
+
+    def __init__(self, data, targets, batch_size, mean, std, padding=4, flip=True, shuffle=True,
+                 drop_last=False, device='cuda', seed=None):
+        """
+        :param data: uint8 images [N, H, W, C] (e.g. CIFAR10(...).data)
+        :param targets: [N] labels
+        """
+        self.images = torch.from_numpy(np.ascontiguousarray(data)).to(device).permute(0, 3, 1, 2).contiguous()
+        self.targets = torch.as_tensor(np.asarray(targets), dtype=torch.long, device=device)
+        self.mean = torch.tensor(mean, dtype=torch.float32, device=device).view(1, -1, 1, 1)
+        self.std = torch.tensor(std, dtype=torch.float32, device=device).view(1, -1, 1, 1)
+        self.batch_size = batch_size
+        self.padding = padding
+        self.flip = flip
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.generator = torch.Generator(device)
+        if seed is not None:
+            self.generator.manual_seed(seed)
+        else:
+            self.generator.seed()
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.images) // self.batch_size
+        return math.ceil(len(self.images) / self.batch_size)
+
+    def __iter__(self):
+        n = len(self.images)
+        if self.shuffle:
+            order = torch.randperm(n, device=self.images.device, generator=self.generator)
+        else:
+            order = torch.arange(n, device=self.images.device)
+        for i in range(len(self)):
+            index = order[i * self.batch_size:(i + 1) * self.batch_size]
+            images = self.images[index]
+            if self.padding or self.flip:
+                images = random_crop_flip(images, self.padding, self.flip, self.generator)
+            yield normalize(images, self.mean, self.std), self.targets[index]
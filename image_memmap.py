@@ -0,0 +1,49 @@
+'''Decode and resize image files with a worker pool straight into a uint8 .npy memmap.
+
+    images, labels = images_to_memmap(items, './data/test_data_regular.npy', './data/test_label.npy')
+
+The images are never collected in a list: every worker opens the pre-allocated
+file and writes its chunk of rows, so the memory used is one chunk per worker.
+The result is read back memory-mapped and can be given to frequency.py, whose
+fft engine reads it in bounded chunks.
+'''
+import random
+from multiprocessing import Pool
+
+import cv2
+import numpy as np
+
+
+def _decode_chunk(task):
+    path, start, files, size = task
+    cv2.setNumThreads(1)
+    images = np.load(path, mmap_mode='r+')
+    for i, f in enumerate(files):
+        images[start + i] = cv2.resize(cv2.imread(f), (size, size))
+    images.flush()
+    return len(files)
+
+
+def images_to_memmap(items, path, label_path, size=224, workers=None, chunk_size=64, shuffle=True):
+    """
+    :param items: [(image file, label)]
+    :param path: .npy file of the uint8 images [N, size, size, 3], BGR as read by cv2.imread
+    :param label_path: .npy file of the labels, in the same order
+    :param shuffle: shuffle the items first (the order of the old image2npy)
+    :return: images (read-only memmap) and labels
+    """
+    items = list(items)
+    if shuffle:
+        random.shuffle(items)
+    labels = np.array([label for _, label in items])
+    np.save(label_path, labels)
+
+    images = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(len(items), size, size, 3))
+    del images  # 只写入header和分配文件, 图像由worker直接写入
+    tasks = [(path, start, [f for f, _ in items[start:start + chunk_size]], size)
+             for start in range(0, len(items), chunk_size)]
+    with Pool(workers) as pool:
+        for _ in pool.imap_unordered(_decode_chunk, tasks):
+            pass
+
+    return np.load(path, mmap_mode='r'), labels
@@ -0,0 +1,127 @@
+'''Shared inference engine of the evaluation scripts.
+
+    engine = InferenceEngine(net)
+    acc = engine.accuracy(testset, name='clean')
+
+Forwards run under torch.inference_mode (no autograd graph), the batch size is
+probed once as the largest power of two whose forward fits the memory budget,
+and the next batch is copied to the device (pinned, non_blocking) while the
+current one is computed. Every call prints images/sec.
+'''
+import time
+
+import torch
+from torch.utils.data import DataLoader, Dataset
+
+
+def probe_batch_size(net, sample, device, start=32, max_batch=4096, memory_fraction=0.9):
+    """
+    Largest power of two batch size in [start, max_batch] whose forward fits in
+    memory_fraction of the GPU memory. Without a GPU the memory is not probed, start * 8 is used.
+
+    :param sample: one input [C, H, W] of the evaluated data
+    """
+    if torch.device(device).type != 'cuda':
+        return min(max_batch, start * 8)
+
+    budget = memory_fraction * torch.cuda.get_device_properties(device).total_memory
+    best, batch_size = None, start
+    while batch_size <= max_batch:
+        try:
+            torch.cuda.reset_peak_memory_stats(device)
+            with torch.inference_mode():
+                net(sample.to(device).unsqueeze(0).expand(batch_size, *sample.shape).contiguous())
+            torch.cuda.synchronize(device)
+            if torch.cuda.max_memory_allocated(device) > budget:
+                break
+            best = batch_size
+            batch_size *= 2
+        except RuntimeError as e:
+            if 'out of memory' not in str(e):
+                raise
+            break
+        finally:
+            torch.cuda.empty_cache()
+    return best or start
+
+
+class InferenceEngine(object):
+    def __init__(self, net, device=None, batch_size=None, max_batch=4096, memory_fraction=0.9,
+                 num_workers=8, verbose=True):
+        self.device = device or next(net.parameters()).device
+        self.net = net.to(self.device).eval()
+        self.batch_size = batch_size
+        self.max_batch = max_batch
+        self.memory_fraction = memory_fraction
+        self.num_workers = num_workers
+        self.verbose = verbose
+
+    def _batch_size(self, sample, prepare=None):
+        if self.batch_size is None:
+            if prepare is not None:
+                with torch.inference_mode():
+                    sample = prepare(torch.as_tensor(sample).unsqueeze(0).to(self.device))[0]
+            self.batch_size = probe_batch_size(self.net, torch.as_tensor(sample), self.device,
+                                               max_batch=self.max_batch,
+                                               memory_fraction=self.memory_fraction)
+            if self.verbose:
+                print('inference batch size: %d' % self.batch_size)
+        return self.batch_size
+
+    def loader(self, dataset, **kwargs):
+        '''DataLoader with the probed batch size, worker processes and pinned memory'''
+        kwargs.setdefault('num_workers', self.num_workers)
+        return DataLoader(dataset, batch_size=self._batch_size(dataset[0][0]), shuffle=False,
+                          pin_memory=torch.device(self.device).type == 'cuda', **kwargs)
+
+    def _batches(self, data, labels, prepare):
+        if isinstance(data, DataLoader):
+            return iter(data)
+        if isinstance(data, Dataset):
+            self._batch_size(data[0][0], prepare)
+            return iter(self.loader(data))
+        # in-memory images (and labels), sliced with the probed batch size
+        batch_size = self._batch_size(data[0], prepare)
+        if labels is None:
+            labels = torch.zeros(len(data), dtype=torch.long)
+        return ((torch.as_tensor(data[i:i + batch_size]), torch.as_tensor(labels[i:i + batch_size]))
+                for i in range(0, len(data), batch_size))
+
+    def predict(self, data, labels=None, prepare=None):
+        """
+        :param data: Dataset, DataLoader, or in-memory images (tensor / array) with labels
+        :param prepare: optional function applied to every input batch on the device
+                        (corruptions, normalisation of uint8 images, ...)
+        :return: predictions and labels, cpu tensors
+        """
+        def load(batch):
+            if batch is None:
+                return None
+            return [t.to(self.device, non_blocking=True) for t in batch[:2]]
+
+        predictions, targets, total = [], [], 0
+        start = time.time()
+        batches = self._batches(data, labels, prepare)
+        with torch.inference_mode():
+            prefetched = load(next(batches, None))
+            while prefetched is not None:
+                images, y = prefetched
+                # 下一个batch的拷贝与当前batch的计算重叠
+                prefetched = load(next(batches, None))
+                if prepare is not None:
+                    images = prepare(images)
+                predictions.append(self.net(images).argmax(1))
+                targets.append(y)
+                total += len(y)
+        predictions, targets = torch.cat(predictions).cpu(), torch.cat(targets).cpu()
+        self.images_per_sec = total / (time.time() - start)
+        return predictions, targets
+
+    def accuracy(self, data, labels=None, prepare=None, name=None):
+        '''accuracy in %, printed with the throughput when name is given'''
+        predictions, targets = self.predict(data, labels, prepare)
+        acc = 100. * float((predictions == targets).sum()) / max(1, len(targets))
+        if name is not None and self.verbose:
+            print('%s accuracy: %.2f %% (%d images, %.0f images/sec)'
+                  % (name, acc, len(targets), self.images_per_sec))
+        return acc
@@ -1,3 +1,6 @@
+import hashlib
+import os
+
 import torch
 import numpy as np
 import skimage
@@ -5,20 +8,69 @@ import skimage
 from torchvision import transforms
 from torch.utils.data import Dataset, ConcatDataset
 from PIL import Image
+
+from frequency import frequency_decompose
  
+def tensor_normalization(transform):
+    """
+    (mean, std) when transform is only ToTensor (+ Normalize), i.e. it can be applied to a whole
+    uint8 batch with tensor ops; None for any other transform (augmentations go through PIL)
+    """
+    steps = transform.transforms if isinstance(transform, transforms.Compose) else [transform]
+    if len(steps) == 1 and isinstance(steps[0], transforms.ToTensor):
+        return (0.0,), (1.0,)
+    if len(steps) == 2 and isinstance(steps[0], transforms.ToTensor) \
+            and isinstance(steps[1], transforms.Normalize) and not steps[1].inplace:
+        return tuple(np.atleast_1d(steps[1].mean)), tuple(np.atleast_1d(steps[1].std))
+    return None
+
+
+def batch_items(images, labels, transform, normalization=None):
+    """
+    items of a batch of uint8 images [B, H, W, C]: one vectorised ToTensor / Normalize when
+    normalization is given (same values as the per-image transform), else PIL + transform per image
+    """
+    if normalization is not None:
+        mean, std = normalization
+        batch = torch.from_numpy(np.ascontiguousarray(images)).permute(0, 3, 1, 2).float().div(255)
+        mean = torch.tensor(mean, dtype=torch.float32).view(1, -1, 1, 1)
+        std = torch.tensor(std, dtype=torch.float32).view(1, -1, 1, 1)
+        batch = (batch - mean) / std
+        return list(zip(batch, labels))
+    items = []
+    for image, label in zip(images, labels):
+        image = Image.fromarray(image)
+        if transform is not None:
+            image = transform(image)
+        items.append((image, label))
+    return items
+
+
 class New_Dataset(Dataset):
 
     def __init__(self, data, labels, transforms):   #初始化函数
-        self.data = np.load(data)               #data为图像数据存放地址，
+        self.data_path = data                   #data为图像数据存放地址，
+        self.data = np.load(data, mmap_mode='r')    #按memmap打开, 各个worker共享page cache, 不复制整个数组
         self.labels = np.load(labels)           #labels为标签存放地址，
         self.transforms = transforms            #对图像进行数据增强
+        self.normalization = tensor_normalization(transforms) if transforms is not None else None
+
+    def __getstate__(self):                     #spawn的worker中重新memmap, 不序列化数组
+        state = self.__dict__.copy()
+        state['data'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.data = np.load(self.data_path, mmap_mode='r')
+
+    def __getitems__(self, indices):                #DataLoader一次取一个batch: 一次读取, 向量化转换
+        indices = np.asarray(indices)
+        images = np.uint8(self.data[indices])       #与逐张np.uint8相同的取值
+        return batch_items(images, self.labels[indices], self.transforms, self.normalization)
 
     def __getitem__(self, index):                   #得到dataset中的每一项对应的图像和标签
-        image= self.data[index, :, :, :]        #读取每一张图像的数据
-        image=Image.fromarray(np.uint8(image))  #转成PIL Image的形式，适合网络输入。(去掉会报错）
-        image= self.transforms(image)           #对图像进行数据增强
-        label = self.labels[index]              #读取图像对应标签
-        return image,label                      #返回图像还有标签
+        return self.__getitems__([index])[0]
 
     def __len__(self):
         return self.data.shape[0]               #返回数据的总个数
@@ -26,3 +78,71 @@ class New_Dataset(Dataset):
     def __add__(self, other):                   #用于多个dataset拼接成一个dataset，将参数中的other与现有数据集进行拼接
         return ConcatDataset([self, other])
  
+
+
+class FrequencyFilteredDataset(Dataset):
+    '''
+    Low or high frequency view of a uint8 image set [N, H, W, C], filtered per batch when it is read
+    (frequency_decompose), in place of the test_data_{low,high}_{r}.npy files of frequency.py.
+    Items are the same as New_Dataset over those files: the PIL image of np.uint8(filtered image) and the label.
+
+    With cache_path the filtered images are computed once into <cache_path>/<data hash>_<band>_<r>_<dtype>.npy
+    and read memory-mapped: uint8 keeps exactly the values the items are made of (1/8 of the float64 files),
+    float16 keeps the filtered values (1/4).
+    '''
+
+    def __init__(self, data, labels, r, band='low', transforms=None, cache_path=None, cache_dtype='uint8',
+                 chunk_size=1000):
+        """
+        :param data: uint8 images [N, H, W, C], array or .npy path (e.g. CIFAR10(...).data)
+        :param labels: labels, array / list or .npy path
+        """
+        assert band in ('low', 'high')
+        assert cache_dtype in ('uint8', 'float16')
+        self.data = np.load(data, mmap_mode='r') if isinstance(data, str) else np.asarray(data)
+        self.labels = np.load(labels) if isinstance(labels, str) else np.asarray(labels)
+        self.r = r
+        self.band = band
+        self.transforms = transforms
+        self.normalization = tensor_normalization(transforms) if transforms is not None else None
+        self.cache = None
+        if cache_path is not None:
+            self.cache = self._load_cache(cache_path, cache_dtype, chunk_size)
+
+    def filter(self, images, workers=1):
+        '''[B, H, W, C] images -> float32 band of radius r'''
+        low, high = frequency_decompose(images, [self.r], workers=workers)[self.r]
+        return low if self.band == 'low' else high
+
+    def _load_cache(self, cache_path, cache_dtype, chunk_size):
+        sha1 = hashlib.sha1(str(self.data.shape).encode())
+        for start in range(0, len(self.data), chunk_size):
+            sha1.update(np.ascontiguousarray(self.data[start:start + chunk_size]).tobytes())
+        path = os.path.join(cache_path, '%s_%s_%d_%s.npy' % (sha1.hexdigest()[:16], self.band, self.r,
+                                                            cache_dtype))
+        if not os.path.exists(path):
+            os.makedirs(cache_path, exist_ok=True)
+            tmp = '%s.%d.tmp' % (path, os.getpid())
+            cache = np.lib.format.open_memmap(tmp, mode='w+', dtype=cache_dtype, shape=self.data.shape)
+            for start in range(0, len(self.data), chunk_size):
+                cache[start:start + chunk_size] = self.filter(self.data[start:start + chunk_size],
+                                                              workers=-1).astype(cache_dtype)
+            cache.flush()
+            del cache
+            os.replace(tmp, path)  # 写完再改名, 其它进程不会读到写了一半的缓存
+        return np.load(path, mmap_mode='r')
+
+    def __getitems__(self, indices):
+        '''all the items of a DataLoader batch, filtered with one batched fft'''
+        indices = np.asarray(indices)
+        if self.cache is not None:
+            images = np.uint8(self.cache[indices])
+        else:
+            images = np.uint8(self.filter(self.data[indices]))
+        return batch_items(images, self.labels[indices], self.transforms, self.normalization)
+
+    def __getitem__(self, index):
+        return self.__getitems__([index])[0]
+
+    def __len__(self):
+        return self.data.shape[0]
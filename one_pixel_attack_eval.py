@@ -1,5 +1,6 @@
 import os
 import sys
+import csv
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -14,14 +15,11 @@ import torchvision.datasets as dsets
 import torchvision.transforms as transforms
 import torchvision.datasets as datasets
 
-from attack.PixelAttack import attack_all
-from attack.differential_evolution import differential_evolution
+from attack.batch_pixel_attack import attack_batch
+from inference import InferenceEngine
 from time import strftime
 
 import torch.multiprocessing
-from attack.PixelAttack import attack_all
-from attack.differential_evolution import differential_evolution
-from time import strftime
 
 device = 'cuda' if torch.cuda.is_available() else 'cpu'
 
@@ -37,43 +35,52 @@ transform_test = transforms.Compose([
 
 testset = datasets.CIFAR10(root='./data', train=False, download=False,
                            transform=transform_test, )
-testloader = torch.utils.data.DataLoader(testset, batch_size=1,
-                                         shuffle=False, num_workers=0)
+# images attacked together, every one with its own DE population of 400
+attack_loader = torch.utils.data.DataLoader(testset, batch_size=32,
+                                            shuffle=False, num_workers=0)
+# images per forward of a generation, every image brings its 400 candidates (4 x 400 = 1600 inputs);
+# raise it if the GPU memory allows
+max_batch = 4
 
 saved_model_path = 'checkpoint/ResNet18/cifar10/ckpt.pth_ResNet18_epoch200_matrix_20220328'
 pgd_saved_path = "./data/cifar10_test_pgd_1-0.pt"
+result_saved_path = './results/one_pixel_attack.csv'
 
 checkpoint = torch.load(saved_model_path)
 net = checkpoint['net']
-net.eval().cuda()
-
-# 模型在原测试集上的准确率
-correct = 0
-total = 0
-
-for images, labels in testloader:
-    images = images.cuda()
-    outputs = net(images)
+net.eval().to(device)
 
-    _, predicted = torch.max(outputs.data, 1)
+engine = InferenceEngine(net)  # inference_mode, 自动选择batch size
 
-    total += labels.size(0)
-    correct += (predicted == labels.cuda()).sum()
+# 模型在原测试集上的准确率, 预测结果也用来挑选要攻击的样本
+clean_predicted, clean_labels = engine.predict(testset)
+print('Before one-pixel attack, accuracy: %.2f %%'
+      % (100 * float((clean_predicted == clean_labels).sum()) / len(clean_labels)))
 
-print('Before one-pixel attack, accuracy: %.2f %%' % (100 * float(correct) / total))
-
-from attack.pixel_attack import attack
+# 对原本预测正确的样本做 one-pixel attack，多张图片的种群一起前向
+results = []
 success = 0
-length = 0
-for image, label in testloader:
-    img = image.numpy()
-    label = label.numpy()
-    result = attack(img, label, net, target=None, pixel_count=1)
-    if result[3] == True:
-        success += 1
-        print('Success')
-    else:
-        print('Fail')
-
-print('Success rate of one pixel attack:', success/length)
-
+for batch_idx, (images, labels) in enumerate(attack_loader):
+    start = batch_idx * attack_loader.batch_size
+    keep = clean_predicted[start:start + len(labels)] == labels
+    if not keep.any():
+        continue
+    batch_results = attack_batch(images[keep], labels[keep], net, target=None, pixel_count=1,
+                                 maxiter=75, popsize=400, max_batch=max_batch)
+    for result, index in zip(batch_results, torch.nonzero(keep).flatten().tolist()):
+        result['index'] = batch_idx * attack_loader.batch_size + index
+        results.append(result)
+    success = sum(result['success'] for result in results)
+    print('success rate: %.4f (%d/%d)' % (success / max(1, len(results)), success, len(results)))
+
+if not os.path.isdir('results'):
+    os.mkdir('results')
+if results:
+    with open(result_saved_path, 'w') as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+else:
+    print('No correctly predicted sample was attacked, %s not written' % result_saved_path)
+
+print('Success rate of one pixel attack:', success / max(1, len(results)))
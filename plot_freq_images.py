@@ -5,6 +5,9 @@ from scipy import signal
 import os
 import cv2
 import random
+
+from frequency import mask_radial, save_frequency_data
+from image_memmap import images_to_memmap
 def fft(img):
     return np.fft.fft2(img)
 
@@ -28,15 +31,6 @@ def distance(i, j, imageSize, r):
     else:
         return 0
 
-def mask_radial(img, r):
-    rows, cols = img.shape
-    mask = np.zeros((rows, cols))
-    for i in range(rows):
-        for j in range(cols):
-            mask[i, j] = distance(i, j, imageSize=rows, r=r)
-    return mask
-
-
 def generateSmoothKernel(data, r):
     result = np.zeros_like(data)
     [k1, k2, m, n] = data.shape
@@ -65,33 +59,17 @@ def generateDataWithDifferentFrequencies_GrayScale(Images, r):
 
     return np.array(Images_freq_low)
 
-def generateDataWithDifferentFrequencies_3Channel(Images, r):
-    Images_freq_low = []
-    Images_freq_high = []
-    mask = mask_radial(np.zeros([Images.shape[1], Images.shape[2]]), r)
+def generateDataWithDifferentFrequencies_3Channel(Images, r, prefix='./data/test_data'):
+    # 分块做fft并直接写入<prefix>_low_<r>.npy / <prefix>_high_<r>.npy, 再按memmap读取
+    save_frequency_data(Images, [r], prefix)
+    Images_freq_low = np.load('%s_low_%d.npy' % (prefix, r), mmap_mode='r')
+    Images_freq_high = np.load('%s_high_%d.npy' % (prefix, r), mmap_mode='r')
     for i in range(Images.shape[0]):
-        img_dir_ori = './data/hfc_32/' + str(i) + '_ori.jpg'
-        img_dir_low = './data/hfc_32/' + str(i) + '_low.jpg'
-        img_dir_high = './data/hfc_32/' + str(i) + '_high.jpg'
-        cv2.imwrite(img_dir_ori,Images[i])
-        tmp = np.zeros([Images.shape[1], Images.shape[2], 3])
-        for j in range(3):
-            fd = fftshift(Images[i, :, :, j])
-            fd = fd * mask
-            img_low = ifftshift(fd)
-            tmp[:,:,j] = np.real(img_low)
-        Images_freq_low.append(tmp)
-        cv2.imwrite(img_dir_low,tmp)
-        tmp = np.zeros([Images.shape[1], Images.shape[2], 3])
-        for j in range(3):
-            fd = fftshift(Images[i, :, :, j])
-            fd = fd * (1 - mask)
-            img_high = ifftshift(fd)
-            tmp[:,:,j] = np.real(img_high)
-        Images_freq_high.append(tmp)
-        cv2.imwrite(img_dir_high,tmp)
+        cv2.imwrite('./data/hfc_32/' + str(i) + '_ori.jpg', Images[i])
+        cv2.imwrite('./data/hfc_32/' + str(i) + '_low.jpg', Images_freq_low[i])
+        cv2.imwrite('./data/hfc_32/' + str(i) + '_high.jpg', Images_freq_high[i])
 
-    return np.array(Images_freq_low), np.array(Images_freq_high)
+    return Images_freq_low, Images_freq_high
 
 
 
@@ -114,18 +92,11 @@ def image2npy(dir_path='./imagenet-100/val'):
             # Ufile是文件名
             img_path = os.path.join(root, Ufile)        # 文件的所在路径
             File = root.split('/')[-1]                  # label名称
-            img_data = cv2.imread(img_path)             # 读取图像
-            img_data = cv2.resize(img_data,(224,224))   # resize成input_size的尺寸，此处需统一尺寸，方便后续生成npy
             label2idx, i = image_label(File, label2idx, i) #得到所有的类别
-            label = label2idx[File]
-            data.append([np.array(img_data), label])    # 存储image和label数据
-    random.shuffle(data) 
-
-    img = np.array([i[0] for i in data])      # 图像
-    label = np.array([i[1] for i in data])    # 标签
+            data.append((img_path, label2idx[File]))    # 只记录路径和label, 解码在worker中进行
 
-    print(len(img), len(label))
-    np.save('./data/test_label', label)       #保存标签的npy文件
+    # 多进程解码并resize成224x224, 直接写入预分配的uint8 memmap, 标签保存为./data/test_label.npy
+    img, label = images_to_memmap(data, './data/test_data_regular.npy', './data/test_label.npy', size=224)
     return img, label, len(img)
 
 
@@ -138,14 +109,7 @@ if __name__ == '__main__':
 
     eval_images, eval_labels, len_images = image2npy(dir_path='./imagenet-100/val')
 
-    images = np.zeros((len_images, 224, 224, 3), dtype='uint8')
-
-    for i, cur_images in enumerate(eval_images):
-        images[i,...] = cur_images
-
-    eval_image_low_32, eval_image_high_32 = generateDataWithDifferentFrequencies_3Channel(images, 32)
-    np.save('./data/test_data_low_32', eval_image_low_32)
-    np.save('./data/test_data_high_32', eval_image_high_32)
+    eval_image_low_32, eval_image_high_32 = generateDataWithDifferentFrequencies_3Channel(eval_images, 32)
     
     ######another way to plot freq images#####
     #image = np.load('./data/test_data_low_32.npy')
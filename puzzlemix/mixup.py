@@ -129,12 +129,8 @@ def get_lambda(alpha=1.0, alpha2=None):
     return lam
 
 
-def graphcut_multi(unary1, unary2, pw_x, pw_y, alpha, beta, eta, n_labels=2, eps=1e-8):
-    '''alpha-beta swap algorithm'''
-    block_num = unary1.shape[0]
-
-    large_val = 1000 * block_num**2
-
+def graph_prior(alpha, eta, block_num, n_labels=2, eps=1e-8):
+    '''label prior of the alpha-beta swap problem'''
     if n_labels == 2:
         prior = np.array([-np.log(alpha + eps), -np.log(1 - alpha + eps)])
     elif n_labels == 3:
@@ -148,16 +144,32 @@ def graphcut_multi(unary1, unary2, pw_x, pw_y, alpha, beta, eta, n_labels=2, eps
             -np.log(3 * alpha * (1 - alpha)**2 + eps), -np.log((1 - alpha)**3 + eps)
         ])
 
-    prior = eta * prior / block_num**2
-    unary_cost = (large_val * np.stack([(1 - lam) * unary1 + lam * unary2 + prior[i]
-                                        for i, lam in enumerate(np.linspace(0, 1, n_labels))],
-                                       axis=-1)).astype(np.int32)
+    return eta * prior / block_num**2
+
+
+def label_cost(n_labels=2):
+    '''pairwise label cost of the alpha-beta swap problem'''
     pairwise_cost = np.zeros(shape=[n_labels, n_labels], dtype=np.float32)
 
     for i in range(n_labels):
         for j in range(n_labels):
             pairwise_cost[i, j] = (i - j)**2 / (n_labels - 1)**2
 
+    return pairwise_cost
+
+
+def graphcut_multi(unary1, unary2, pw_x, pw_y, alpha, beta, eta, n_labels=2, eps=1e-8):
+    '''alpha-beta swap algorithm'''
+    block_num = unary1.shape[0]
+
+    large_val = 1000 * block_num**2
+
+    prior = graph_prior(alpha, eta, block_num, n_labels, eps)
+    unary_cost = (large_val * np.stack([(1 - lam) * unary1 + lam * unary2 + prior[i]
+                                        for i, lam in enumerate(np.linspace(0, 1, n_labels))],
+                                       axis=-1)).astype(np.int32)
+    pairwise_cost = label_cost(n_labels)
+
     pw_x = (large_val * (pw_x + beta)).astype(np.int32)
     pw_y = (large_val * (pw_y + beta)).astype(np.int32)
     labels = 1.0 - gco.cut_grid_graph(unary_cost, pairwise_cost, pw_x, pw_y,
@@ -167,6 +179,18 @@ def graphcut_multi(unary1, unary2, pw_x, pw_y, alpha, beta, eta, n_labels=2, eps
     return mask
 
 
+def graphcut_cost(inputs):
+    '''alpha-beta swap algorithm on precomputed int32 costs'''
+    unary_cost, pairwise_cost, pw_x, pw_y, n_labels = inputs
+    block_num = unary_cost.shape[0]
+
+    labels = 1.0 - gco.cut_grid_graph(unary_cost, pairwise_cost, pw_x, pw_y,
+                                      algorithm='swap') / (n_labels - 1)
+    mask = labels.reshape(block_num, block_num)
+
+    return mask
+
+
 def neigh_penalty(input1, input2, k):
     '''data local smoothness term'''
     pw_x = input1[:, :, :-1, :] - input2[:, :, 1:, :]
@@ -181,6 +205,88 @@ def neigh_penalty(input1, input2, k):
     return pw_x, pw_y
 
 
+def neigh_penalty_pairs(input1_pool, input2_pool, k):
+    '''data local smoothness term for all four (input2, input1) pairs at once
+
+    Returns pw_x, pw_y of shape [batch, 2, 2, ...] where [:, i, j] equals
+    neigh_penalty(pool[i], pool[j], k) with pool = (input2_pool, input1_pool).
+    '''
+    batch_size, channel, height, width = input1_pool.shape
+    pool = torch.stack([input2_pool, input1_pool], dim=1)
+
+    # boundary rows/cols of each block, for the first and second image of a pair
+    pw_x = pool[:, :, None, :, k - 1:-1:k, :] - pool[:, None, :, :, k::k, :]
+    pw_y = pool[:, :, None, :, :, k - 1:-1:k] - pool[:, None, :, :, :, k::k]
+
+    pw_x = F.avg_pool2d(pw_x.abs().mean(3).reshape(batch_size * 4, -1, width), kernel_size=(1, k))
+    pw_y = F.avg_pool2d(pw_y.abs().mean(3).reshape(batch_size * 4, height, -1), kernel_size=(k, 1))
+
+    pw_x = pw_x.reshape(batch_size, 2, 2, *pw_x.shape[-2:])
+    pw_y = pw_y.reshape(batch_size, 2, 2, *pw_y.shape[-2:])
+
+    return pw_x, pw_y
+
+
+def graph_terms(unary1, unary2, input1_pool, input2_pool, k, alpha, beta, gamma, eta, n_labels=2):
+    '''unary and pairwise costs of the graphcut in the int32 layout of gco'''
+    block_num = unary1.shape[-1]
+    large_val = 1000 * block_num**2
+
+    pw_x, pw_y = neigh_penalty_pairs(input1_pool, input2_pool, k)
+    pw_x = beta * gamma * pw_x
+    pw_y = beta * gamma * pw_y
+
+    # re-define unary terms to draw graph: index 0 is unary1, index 1 is unary2
+    unary = torch.stack([unary1, unary2], dim=1)
+    unary = unary + F.pad(pw_x.sum(2), (0, 0, 0, 1)) / 2. + F.pad(pw_x.sum(1), (0, 0, 1, 0)) / 2.
+    unary = unary + F.pad(pw_y.sum(2), (0, 1)) / 2. + F.pad(pw_y.sum(1), (1, 0)) / 2.
+
+    pw_x = (pw_x[:, 1, 0] + pw_x[:, 0, 1] - pw_x[:, 1, 1] - pw_x[:, 0, 0]) / 2
+    pw_y = (pw_y[:, 1, 0] + pw_y[:, 0, 1] - pw_y[:, 1, 1] - pw_y[:, 0, 0]) / 2
+
+    # label l interpolates from unary2 (l = 0) to unary1 (l = n_labels - 1)
+    prior = graph_prior(alpha, eta, block_num, n_labels).tolist()
+    unary_cost = torch.stack([(1 - lam) * unary[:, 1] + lam * unary[:, 0] + prior[i]
+                              for i, lam in enumerate(np.linspace(0, 1, n_labels).tolist())],
+                             dim=-1)
+    unary_cost = (large_val * unary_cost).to(torch.int32)
+    pw_x = (large_val * (pw_x + beta)).to(torch.int32)
+    pw_y = (large_val * (pw_y + beta)).to(torch.int32)
+
+    return unary_cost, pw_x, pw_y
+
+
+def host_chunks(tensors, chunk_size=16):
+    '''non-blocking device-to-host copy, yielding each chunk once it has landed'''
+    tensors = [t.detach() for t in tensors]
+    if tensors[0].device.type != 'cuda':
+        yield [t.contiguous().numpy() for t in tensors]
+        return
+
+    pending = []
+    for idx_from in range(0, tensors[0].shape[0], chunk_size):
+        host = []
+        for t in tensors:
+            chunk = t[idx_from:idx_from + chunk_size]
+            host.append(torch.empty(chunk.shape, dtype=chunk.dtype, pin_memory=True))
+            host[-1].copy_(chunk, non_blocking=True)
+        event = torch.cuda.Event()
+        event.record()
+        pending.append((host, event))
+
+    for host, event in pending:
+        event.synchronize()
+        yield [h.numpy() for h in host]
+
+
+def graphcut_inputs(unary_cost, pw_x, pw_y, n_labels=2):
+    '''per-sample graphcut inputs, streamed while the rest of the batch is copied'''
+    pairwise_cost = label_cost(n_labels)
+    for unary_cost_h, pw_x_h, pw_y_h in host_chunks([unary_cost, pw_x, pw_y]):
+        for i in range(unary_cost_h.shape[0]):
+            yield unary_cost_h[i], pairwise_cost, pw_x_h[i], pw_y_h[i], n_labels
+
+
 def mixup_box(input1, input2, alpha=0.5, device='cuda'):
     '''CutMix'''
     batch_size, _, height, width = input1.shape
@@ -244,55 +350,20 @@ def mixup_graph(input1,
     input1_pool = F.avg_pool2d(input1 * std + mean, neigh_size)
     input2_pool = input1_pool[indices]
 
-    pw_x = torch.zeros([batch_size, 2, 2, block_num - 1, block_num], device=device)
-    pw_y = torch.zeros([batch_size, 2, 2, block_num, block_num - 1], device=device)
-
     k = block_size // neigh_size
 
-    pw_x[:, 0, 0], pw_y[:, 0, 0] = neigh_penalty(input2_pool, input2_pool, k)
-    pw_x[:, 0, 1], pw_y[:, 0, 1] = neigh_penalty(input2_pool, input1_pool, k)
-    pw_x[:, 1, 0], pw_y[:, 1, 0] = neigh_penalty(input1_pool, input2_pool, k)
-    pw_x[:, 1, 1], pw_y[:, 1, 1] = neigh_penalty(input1_pool, input1_pool, k)
-
-    pw_x = beta * gamma * pw_x
-    pw_y = beta * gamma * pw_y
-
-    # re-define unary and pairwise terms to draw graph
-    unary1 = unary1_torch.clone()
-    unary2 = unary2_torch.clone()
-
-    unary2[:, :-1, :] += (pw_x[:, 1, 0] + pw_x[:, 1, 1]) / 2.
-    unary1[:, :-1, :] += (pw_x[:, 0, 1] + pw_x[:, 0, 0]) / 2.
-    unary2[:, 1:, :] += (pw_x[:, 0, 1] + pw_x[:, 1, 1]) / 2.
-    unary1[:, 1:, :] += (pw_x[:, 1, 0] + pw_x[:, 0, 0]) / 2.
-
-    unary2[:, :, :-1] += (pw_y[:, 1, 0] + pw_y[:, 1, 1]) / 2.
-    unary1[:, :, :-1] += (pw_y[:, 0, 1] + pw_y[:, 0, 0]) / 2.
-    unary2[:, :, 1:] += (pw_y[:, 0, 1] + pw_y[:, 1, 1]) / 2.
-    unary1[:, :, 1:] += (pw_y[:, 1, 0] + pw_y[:, 0, 0]) / 2.
-
-    pw_x = (pw_x[:, 1, 0] + pw_x[:, 0, 1] - pw_x[:, 1, 1] - pw_x[:, 0, 0]) / 2
-    pw_y = (pw_y[:, 1, 0] + pw_y[:, 0, 1] - pw_y[:, 1, 1] - pw_y[:, 0, 0]) / 2
-
-    unary1 = unary1.detach().cpu().numpy()
-    unary2 = unary2.detach().cpu().numpy()
-    pw_x = pw_x.detach().cpu().numpy()
-    pw_y = pw_y.detach().cpu().numpy()
+    unary_cost, pw_x, pw_y = graph_terms(unary1_torch, unary2_torch, input1_pool, input2_pool,
+                                         k, alpha, beta, gamma, eta, n_labels)
 
-    # solve graphcut
+    # solve graphcut, overlapping the device-to-host copy with the solver
+    inputs = graphcut_inputs(unary_cost, pw_x, pw_y, n_labels)
     if mp is None:
-        mask = []
-        for i in range(batch_size):
-            mask.append(
-                graphcut_multi(unary2[i], unary1[i], pw_x[i], pw_y[i], alpha, beta, eta, n_labels))
+        mask = [graphcut_cost(x) for x in inputs]
     else:
-        input_mp = []
-        for i in range(batch_size):
-            input_mp.append((unary2[i], unary1[i], pw_x[i], pw_y[i], alpha, beta, eta, n_labels))
-        mask = mp.starmap(graphcut_multi, input_mp)
+        mask = list(mp.imap(graphcut_cost, inputs))
 
     # optimal mask
-    mask = torch.tensor(mask, dtype=torch.float32, device=device)
+    mask = torch.tensor(np.array(mask), dtype=torch.float32, device=device)
     mask = mask.unsqueeze(1)
 
     # add adversarial noise
@@ -3,6 +3,8 @@ import torch
 import torch.nn.functional as F
 import gco
 
+from puzzlemix.mixup import graph_terms, graphcut_inputs, graphcut_cost
+
 
 def cost_matrix(width):
     '''transport cost'''
@@ -114,55 +116,20 @@ def mixup_graph(input1,
     input1_pool = F.avg_pool2d(input1 * std + mean, neigh_size)
     input2_pool = input1_pool[indices]
 
-    pw_x = torch.zeros([batch_size, 2, 2, block_num - 1, block_num], device='cuda')
-    pw_y = torch.zeros([batch_size, 2, 2, block_num, block_num - 1], device='cuda')
-
     k = block_size // neigh_size
 
-    pw_x[:, 0, 0], pw_y[:, 0, 0] = neigh_penalty(input2_pool, input2_pool, k)
-    pw_x[:, 0, 1], pw_y[:, 0, 1] = neigh_penalty(input2_pool, input1_pool, k)
-    pw_x[:, 1, 0], pw_y[:, 1, 0] = neigh_penalty(input1_pool, input2_pool, k)
-    pw_x[:, 1, 1], pw_y[:, 1, 1] = neigh_penalty(input1_pool, input1_pool, k)
-
-    pw_x = beta * gamma * pw_x
-    pw_y = beta * gamma * pw_y
-
-    # re-define unary and pairwise terms to draw graph
-    unary1 = unary1_torch.clone()
-    unary2 = unary2_torch.clone()
-
-    unary2[:, :-1, :] += (pw_x[:, 1, 0] + pw_x[:, 1, 1]) / 2.
-    unary1[:, :-1, :] += (pw_x[:, 0, 1] + pw_x[:, 0, 0]) / 2.
-    unary2[:, 1:, :] += (pw_x[:, 0, 1] + pw_x[:, 1, 1]) / 2.
-    unary1[:, 1:, :] += (pw_x[:, 1, 0] + pw_x[:, 0, 0]) / 2.
-
-    unary2[:, :, :-1] += (pw_y[:, 1, 0] + pw_y[:, 1, 1]) / 2.
-    unary1[:, :, :-1] += (pw_y[:, 0, 1] + pw_y[:, 0, 0]) / 2.
-    unary2[:, :, 1:] += (pw_y[:, 0, 1] + pw_y[:, 1, 1]) / 2.
-    unary1[:, :, 1:] += (pw_y[:, 1, 0] + pw_y[:, 0, 0]) / 2.
-
-    pw_x = (pw_x[:, 1, 0] + pw_x[:, 0, 1] - pw_x[:, 1, 1] - pw_x[:, 0, 0]) / 2
-    pw_y = (pw_y[:, 1, 0] + pw_y[:, 0, 1] - pw_y[:, 1, 1] - pw_y[:, 0, 0]) / 2
-
-    unary1 = unary1.detach().cpu().numpy()
-    unary2 = unary2.detach().cpu().numpy()
-    pw_x = pw_x.detach().cpu().numpy()
-    pw_y = pw_y.detach().cpu().numpy()
+    unary_cost, pw_x, pw_y = graph_terms(unary1_torch, unary2_torch, input1_pool, input2_pool,
+                                         k, alpha, beta, gamma, eta, n_labels)
 
-    # solve graphcut
+    # solve graphcut, overlapping the device-to-host copy with the solver
+    inputs = graphcut_inputs(unary_cost, pw_x, pw_y, n_labels)
     if mp is None:
-        mask = []
-        for i in range(batch_size):
-            mask.append(
-                graphcut_multi(unary2[i], unary1[i], pw_x[i], pw_y[i], alpha, beta, eta, n_labels))
+        mask = [graphcut_cost(x) for x in inputs]
     else:
-        input_mp = []
-        for i in range(batch_size):
-            input_mp.append((unary2[i], unary1[i], pw_x[i], pw_y[i], alpha, beta, eta, n_labels))
-        mask = mp.starmap(graphcut_multi, input_mp)
+        mask = list(mp.imap(graphcut_cost, inputs))
 
     # optimal mask
-    mask = torch.tensor(mask, dtype=torch.float32, device='cuda')
+    mask = torch.tensor(np.array(mask), dtype=torch.float32, device='cuda')
     mask = mask.unsqueeze(1)
 
     # tranport
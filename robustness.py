@@ -0,0 +1,201 @@
+'''Robustness of one checkpoint on the CIFAR-10 test set, all suites in one run.
+
+The checkpoint is loaded once and the test set is decoded once into a uint8
+array. Every suite corrupts or attacks that shared array and evaluates it with
+large batches converted on the device, so the time spent is the model forwards
+(plus the attacks themselves). One table with all results is printed and
+written to ./results/robustness.csv.
+
+    python robustness.py --checkpoint ./checkpoint/ResNet18/ckpt.pth_ResNet18_epoch200_none_20220424 \
+        --suites clean gaussian salt-pepper random-erase frequency pgd transfer one-pixel
+'''
+import argparse
+import csv
+import os
+import random
+import time
+
+import numpy as np
+import torch
+import torchvision
+import torchvision.transforms as transforms
+
+import models
+from attack.adv_store import AdversarialStore
+from attack.batch_pixel_attack import attack_batch
+from corruptions import gaussian_noise, random_erasing, salt_pepper_noise
+from frequency import frequency_decompose
+from inference import InferenceEngine
+from transfer_shards import TensorShardDataset
+
+SUITES = ['clean', 'gaussian', 'salt-pepper', 'random-erase', 'frequency', 'pgd', 'transfer',
+          'one-pixel']
+MEAN = (0.4914, 0.4822, 0.4465)
+STD = (0.2023, 0.1994, 0.2010)
+
+parser = argparse.ArgumentParser(description='Robustness evaluation')
+parser.add_argument('--checkpoint', type=str, required=True, help='checkpoint with a "net" entry')
+parser.add_argument('--suites', nargs='+', default=SUITES[:-1], choices=SUITES)
+parser.add_argument('--batch_size', default=None, type=int, help='default: probed by the inference engine')
+parser.add_argument('--seed', default=0, type=int)
+parser.add_argument('--gau_variance', default=8.0, type=float, help='std of the gaussian noise, 0~255 units')
+parser.add_argument('--salt_density', default=0.05, type=float)
+parser.add_argument('--erase_probability', default=0.5, type=float)
+parser.add_argument('--radius', nargs='+', default=[4, 8, 12, 16, 20, 24, 28], type=int)
+parser.add_argument('--pgd_eps', default=6.0, type=float, help='in 0~255 units')
+parser.add_argument('--pgd_alpha', default=1.0, type=float, help='in 0~255 units')
+parser.add_argument('--pgd_steps', default=40, type=int)
+parser.add_argument('--transfer_root', default='./transfer_res', type=str)
+parser.add_argument('--pixel_samples', default=100, type=int, help='test images for the one pixel attack')
+parser.add_argument('--pixel_count', default=1, type=int)
+parser.add_argument('--pixel_max_batch', default=4, type=int,
+                    help='images per forward of the one pixel attack, each with its 400 candidates')
+parser.add_argument('--result_path', default='./results/robustness.csv', type=str)
+args = parser.parse_args()
+
+device = 'cuda' if torch.cuda.is_available() else 'cpu'
+
+transform_test = transforms.Compose([
+    transforms.ToTensor(),  # 255 1
+    transforms.Normalize(MEAN, STD),
+])
+
+
+def normalize(batch):
+    '''uint8 [B, H, W, C] on the device -> normalised float [B, C, H, W], as transform_test'''
+    batch = batch.permute(0, 3, 1, 2).float() / 255.
+    mean = torch.tensor(MEAN, device=batch.device).view(1, -1, 1, 1)
+    std = torch.tensor(STD, device=batch.device).view(1, -1, 1, 1)
+    return (batch - mean) / std
+
+
+def predict(engine, images, prepare=normalize):
+    """
+    predicted classes of all images, converted by prepare on the device
+
+    :param images: uint8 array / tensor
+    :return: [N] predictions on the cpu
+    """
+    return engine.predict(images, prepare=prepare)[0]
+
+
+def accuracy(predictions, labels):
+    return 100. * float((predictions == torch.as_tensor(labels)).sum()) / len(labels)
+
+
+def main():
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
+    net = torch.load(args.checkpoint)['net']
+    net = net.to(device).eval()
+    engine = InferenceEngine(net, batch_size=args.batch_size)
+
+    # 测试集只解码一次: uint8 [N, 32, 32, 3]
+    testset = torchvision.datasets.CIFAR10(root='./data', train=False, download=False)
+    images, labels = testset.data, np.asarray(testset.targets)
+
+    rows = []
+
+    def report(suite, setting, acc, start):
+        rows.append([suite, setting, '%.2f' % acc, '%.1f' % (time.time() - start)])
+        print('%-13s %-22s accuracy: %.2f %%  (%.1fs)' % (suite, setting, acc, time.time() - start))
+
+    start = time.time()
+    clean_pred = predict(engine, images)
+    if 'clean' in args.suites:
+        report('clean', '-', accuracy(clean_pred, labels), start)
+
+    if 'gaussian' in args.suites:
+        start = time.time()
+        generator = torch.Generator(device).manual_seed(args.seed)
+        prepare = lambda batch: normalize(gaussian_noise(batch, 0.0, args.gau_variance, 1.0,
+                                                         channels_last=True, generator=generator))
+        report('gaussian', 'variance=%g' % args.gau_variance,
+               accuracy(predict(engine, images, prepare), labels), start)
+
+    if 'salt-pepper' in args.suites:
+        start = time.time()
+        generator = torch.Generator(device).manual_seed(args.seed)
+        prepare = lambda batch: normalize(salt_pepper_noise(batch, args.salt_density, p=1.0,
+                                                            channels_last=True, generator=generator))
+        report('salt-pepper', 'density=%g' % args.salt_density,
+               accuracy(predict(engine, images, prepare), labels), start)
+
+    if 'random-erase' in args.suites:
+        start = time.time()
+        # 和Random_erase_cifar10.py一样在Normalize之后擦除
+        generator = torch.Generator(device).manual_seed(args.seed)
+        prepare = lambda batch: random_erasing(normalize(batch), args.erase_probability, sl=0.02, sh=0.4,
+                                               r1=0.3, mean=MEAN, generator=generator)
+        report('random-erase', 'p=%g' % args.erase_probability,
+               accuracy(predict(engine, images, prepare), labels), start)
+
+    if 'frequency' in args.suites:
+        # 在共用的测试集上直接滤波, 与frequency.py生成的npy文件经过New_Dataset后的输入相同
+        # 所有半径一次分解 (一次fft), 分解的时间计入第一个设置
+        start = time.time()
+        bands = frequency_decompose(images, args.radius)
+        for k, band in enumerate(['low', 'high']):
+            for r in args.radius:
+                freq_images = np.uint8(bands[r][k])
+                report('frequency', '%s radius=%d' % (band, r),
+                       accuracy(predict(engine, freq_images), labels), start)
+                start = time.time()
+
+    if 'pgd' in args.suites:
+        start = time.time()
+        # 与PGD_eval.py相同的数据和transform, 对抗样本在AdversarialStore中共用
+        clean_set = torch.utils.data.TensorDataset(normalize(torch.from_numpy(images)),
+                                                   torch.from_numpy(labels))
+        clean_set.transform = transform_test
+        loader = torch.utils.data.DataLoader(clean_set, batch_size=256, shuffle=False)
+        adv_images, adv_labels = AdversarialStore('./data/adv_store').fetch(
+            net, loader, split='cifar10-test', verbose=False, eps=args.pgd_eps / 255,
+            alpha=args.pgd_alpha / 255, steps=args.pgd_steps)
+        report('pgd', 'eps=%g steps=%d' % (args.pgd_eps, args.pgd_steps),
+               accuracy(predict(engine, adv_images, lambda batch: batch.float() / 255), adv_labels),
+               start)
+
+    if 'transfer' in args.suites:
+        start = time.time()
+        shards = os.path.join(args.transfer_root, 'shards')
+        if os.path.exists(os.path.join(shards, 'index.json')):
+            transfer_set = TensorShardDataset(shards)
+            transfer_images = np.concatenate([np.asarray(d) for d in transfer_set.data])
+        else:
+            transfer_set = torchvision.datasets.ImageFolder(os.path.join(args.transfer_root, 'images'))
+            transfer_images = np.stack([np.asarray(img) for img, _ in transfer_set])
+        report('transfer', args.transfer_root,
+               accuracy(predict(engine, transfer_images), transfer_set.targets), start)
+
+    if 'one-pixel' in args.suites:
+        start = time.time()
+        # 只攻击前pixel_samples张中分类正确的图片
+        subset = np.arange(min(args.pixel_samples, len(images)))
+        correct = subset[(clean_pred[subset] == torch.from_numpy(labels[subset])).numpy()]
+        fooled = 0
+        for i in range(0, len(correct), 32):
+            batch = correct[i:i + 32]
+            results = attack_batch(normalize(torch.from_numpy(images[batch]).to(device)),
+                                   labels[batch], net, pixel_count=args.pixel_count,
+                                   seed=args.seed, max_batch=args.pixel_max_batch)
+            fooled += sum(r['success'] for r in results)
+        report('one-pixel', 'pixels=%d n=%d' % (args.pixel_count, len(subset)),
+               100. * (len(correct) - fooled) / len(subset), start)
+
+    os.makedirs(os.path.dirname(args.result_path), exist_ok=True)
+    with open(args.result_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['checkpoint', 'suite', 'setting', 'accuracy', 'seconds'])
+        for row in rows:
+            writer.writerow([args.checkpoint] + row)
+
+    print('\n%-13s %-22s %8s' % ('suite', 'setting', 'acc (%)'))
+    for suite, setting, acc, _ in rows:
+        print('%-13s %-22s %8s' % (suite, setting, acc))
+
+
+if __name__ == '__main__':
+    main()
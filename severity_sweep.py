@@ -0,0 +1,149 @@
+'''Severity sweep of the CIFAR-10 test corruptions for one checkpoint.
+
+Every decoded test batch is corrupted at all severities of all corruptions in
+one batched call per corruption (one severity per copy of the batch), and all
+the copies go through one forward. The clean logits are computed once per
+checkpoint weights and cached; the per-sample correctness of every severity is
+stored as a bitmap, so flip rates between any two severities can be computed
+later without running the model again (see load_bitmaps / flip_rate).
+
+    python severity_sweep.py --checkpoint ./checkpoint/ResNet18/ckpt.pth_ResNet18_epoch200_none_20220424 \
+        --gaussian 4 8 16 32 --salt 0.01 0.05 0.1 --erase 0.25 0.5 1.0
+'''
+import argparse
+import hashlib
+import os
+import time
+
+import numpy as np
+import torch
+import torchvision
+
+import models
+from attack.adv_store import weights_digest
+from corruptions import gaussian_noise, random_erasing, salt_pepper_noise
+
+MEAN = (0.4914, 0.4822, 0.4465)
+STD = (0.2023, 0.1994, 0.2010)
+
+
+def normalize(batch):
+    '''uint8 [B, H, W, C] on the device -> normalised float [B, C, H, W]'''
+    batch = batch.permute(0, 3, 1, 2).float() / 255.
+    mean = torch.tensor(MEAN, device=batch.device).view(1, -1, 1, 1)
+    std = torch.tensor(STD, device=batch.device).view(1, -1, 1, 1)
+    return (batch - mean) / std
+
+
+def corrupt(name, batch, severities, amplitude, generator):
+    '''all severities of one corruption in one call: [S * B] normalised images, severity-major'''
+    repeated = batch.repeat(len(severities), 1, 1, 1)
+    per_image = severities.repeat_interleave(len(batch))
+    if name == 'gaussian':
+        return normalize(gaussian_noise(repeated, 0.0, per_image, amplitude, channels_last=True,
+                                        generator=generator))
+    if name == 'salt-pepper':
+        return normalize(salt_pepper_noise(repeated, per_image, p=1.0, channels_last=True,
+                                           generator=generator))
+    if name == 'random-erase':
+        return random_erasing(normalize(repeated), per_image, sl=0.02, sh=0.4, r1=0.3, mean=MEAN,
+                              generator=generator)
+    raise ValueError(name)
+
+
+def save_bitmaps(path, names, correct):
+    '''correct: bool [settings, N], packed 8 samples per byte'''
+    np.savez(path, names=np.array(names), n=correct.shape[1], bits=np.packbits(correct, axis=1))
+
+
+def load_bitmaps(path):
+    data = np.load(path)
+    bits = np.unpackbits(data['bits'], axis=1)[:, :int(data['n'])].astype(bool)
+    return list(data['names']), bits
+
+
+def flip_rate(a, b):
+    '''fraction of the samples whose correctness differs between two bitmaps'''
+    return float((a != b).mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Corruption severity sweep')
+    parser.add_argument('--checkpoint', type=str, required=True)
+    parser.add_argument('--gaussian', nargs='*', default=[4, 8, 16, 32], type=float,
+                        help='variances (std, 0~255 units) of the gaussian noise')
+    parser.add_argument('--amplitude', default=1.0, type=float)
+    parser.add_argument('--salt', nargs='*', default=[0.01, 0.05, 0.1], type=float,
+                        help='salt and pepper densities')
+    parser.add_argument('--erase', nargs='*', default=[0.25, 0.5, 1.0], type=float,
+                        help='random erasing probabilities')
+    parser.add_argument('--batch_size', default=100, type=int,
+                        help='test images per step, the forward is batch_size * severities')
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--cache_path', default='./results/sweep', type=str)
+    args = parser.parse_args()
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    net = torch.load(args.checkpoint)['net'].to(device).eval()
+    digest = weights_digest(net)
+    os.makedirs(args.cache_path, exist_ok=True)
+
+    testset = torchvision.datasets.CIFAR10(root='./data', train=False, download=False)
+    images, labels = torch.from_numpy(testset.data), torch.tensor(testset.targets)
+
+    grid = [(name, torch.tensor(values, dtype=torch.float32, device=device))
+            for name, values in [('gaussian', args.gaussian), ('salt-pepper', args.salt),
+                                 ('random-erase', args.erase)] if len(values)]
+    names = ['%s=%g' % (name, v) for name, values in grid for v in values.tolist()]
+    if args.amplitude != 1.0:
+        names = [n + (' amplitude=%g' % args.amplitude if n.startswith('gaussian') else '')
+                 for n in names]
+
+    # clean logits, once per checkpoint weights
+    clean_path = os.path.join(args.cache_path, digest + '_clean_logits.npy')
+    clean_logits = np.load(clean_path) if os.path.exists(clean_path) else None
+    if clean_logits is None:
+        logits = []
+        with torch.inference_mode():
+            for i in range(0, len(images), args.batch_size * 8):
+                batch = images[i:i + args.batch_size * 8].to(device, non_blocking=True)
+                logits.append(net(normalize(batch)).float().cpu())
+        clean_logits = torch.cat(logits).numpy()
+        np.save(clean_path, clean_logits)
+    clean_correct = clean_logits.argmax(1) == labels.numpy()
+
+    generator = torch.Generator(device).manual_seed(args.seed)
+    correct = torch.zeros(len(names), len(images), dtype=torch.bool)
+    start = time.time()
+    with torch.inference_mode():
+        for i in range(0, len(images), args.batch_size):
+            batch = images[i:i + args.batch_size].to(device, non_blocking=True)
+            y = labels[i:i + args.batch_size].to(device)
+            # 所有强度的corruption拼成一个大batch, 一次forward
+            inputs = torch.cat([corrupt(name, batch, values, args.amplitude, generator)
+                                for name, values in grid])
+            predicted = net(inputs).argmax(1).view(len(names), len(batch))
+            correct[:, i:i + len(batch)] = (predicted == y).cpu()
+    correct = correct.numpy()
+    print('%d settings x %d images in %.1fs' % (len(names), len(images), time.time() - start))
+
+    # 文件名包含强度网格的hash, 不同网格的结果不互相覆盖
+    grid_digest = hashlib.sha1('\n'.join(names).encode()).hexdigest()[:12]
+    bitmap_path = os.path.join(args.cache_path, '%s_grid%s_seed%d.npz' % (digest, grid_digest, args.seed))
+    save_bitmaps(bitmap_path, ['clean'] + names, np.concatenate([clean_correct[None], correct]))
+
+    print('%-32s %8s %14s %14s' % ('setting', 'acc (%)', 'flip vs clean', 'flip vs prev'))
+    print('%-32s %8.2f' % ('clean', 100 * clean_correct.mean()))
+    previous = clean_correct
+    for k, name in enumerate(names):
+        if k and name.split('=')[0] != names[k - 1].split('=')[0]:
+            previous = clean_correct
+        print('%-32s %8.2f %14.4f %14.4f' % (name, 100 * correct[k].mean(),
+                                             flip_rate(clean_correct, correct[k]),
+                                             flip_rate(previous, correct[k])))
+        previous = correct[k]
+    print('bitmaps saved to %s' % bitmap_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -16,7 +16,8 @@ import torchvision.datasets as datasets
 
 import models
 
-from new_dataset import New_Dataset
+from new_dataset import FrequencyFilteredDataset
+from inference import InferenceEngine
 
 transform_test = transforms.Compose([
     transforms.ToTensor(), #255 1
@@ -25,37 +26,24 @@ transform_test = transforms.Compose([
 
 saved_model_path = './checkpoint/ckpt.pthResNet18_200_one_fourth_20220520'
 
-radius = [4, 8, 12, 16, 20, 24, 28]
-for r in radius:
-    # test_low = './data/CIFAR10/test_data_low_' + str(r) + '.npy'
-    test_high = './data/CIFAR10/test_data_high_' + str(r) + '.npy'
+checkpoint = torch.load(saved_model_path)
+net = checkpoint['net']
+net.eval().cuda()
+engine = InferenceEngine(net)  # inference_mode, 自动选择batch size
 
+# 直接在原始uint8测试集上按batch滤波, 不再需要frequency.py生成的test_data_{low,high}_{r}.npy
+testset = dsets.CIFAR10(root='./data', train=False, download=False)
 
-    # testset = New_Dataset(test_low,'./data/CIFAR10/test_label.npy',transform_test)
-    testset_high_4 = New_Dataset(test_high,'./data/CIFAR10/test_label.npy',transform_test)
+radius = [4, 8, 12, 16, 20, 24, 28]
+for r in radius:
+    # testset_low = FrequencyFilteredDataset(testset.data, testset.targets, r, 'low', transform_test,
+    #                                        cache_path='./data/CIFAR10/freq_cache')
+    testset_high_4 = FrequencyFilteredDataset(testset.data, testset.targets, r, 'high', transform_test,
+                                              cache_path='./data/CIFAR10/freq_cache')
     # testset = testset.__add__(testset_high_4)
     # testloader = torch.utils.data.DataLoader(testset, batch_size=10,
     #                                          shuffle=False, num_workers=8)
 
-    testloader = torch.utils.data.DataLoader(testset_high_4, batch_size=10,
-                                             shuffle=False, num_workers=8)
-    checkpoint = torch.load(saved_model_path)
-    net = checkpoint['net']
-    net.eval().cuda()
-
     # 模型在原测试集上的准确率
-    correct = 0
-    total = 0
-
-    for images, labels in testloader:
-        
-        images = images.cuda()
-        outputs = net(images)
-        
-        _, predicted = torch.max(outputs.data, 1)
-        
-        total += labels.size(0)
-        correct += (predicted == labels.cuda()).sum()
-        
-    print('frequency =',r,', test accuracy: %.2f %%' % (100 * float(correct) / total))
-
+    acc = engine.accuracy(testset_high_4)
+    print('frequency =',r,', test accuracy: %.2f %%' % acc)
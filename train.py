@@ -21,6 +21,8 @@ from models import *
 from puzzlemix.mixup import mixup_process as mixup_process_p
 from puzzlemix.mixup import to_one_hot as to_one_hot_p
 from utils import progress_bar, top_accuracy, calib_err
+from transfer_shards import TensorShardDataset
+from gpu_loader import GPUTrainLoader
 
 
 def str2bool(v):
@@ -115,6 +117,8 @@ parser.add_argument('--in_batch',
 parser.add_argument('--batch_size', type=int, default=100)
 parser.add_argument('--severity', type=int, default=3)
 parser.add_argument('--transfer_datas', type=bool, default=False)
+parser.add_argument('--gpu_loader', type=str2bool, default=False,
+                    help='keep the CIFAR-10 train set on the device and augment batches there')
 # parser.add_argument('--learning_rate', type=float, default=0.2)
 # parser.add_argument('--momentum', type=float, default=0.9)
 # parser.add_argument('--decay', type=float, default=0.0001, help='weight decay (L2 penalty)')
@@ -182,14 +186,22 @@ transform_test = transforms.Compose([
 ])
 preprocess = transform_test
 
-if args.transfer_datas:
+if args.transfer_datas and os.path.exists('./transfer_res/shards/index.json'):
+    trainset = TensorShardDataset('./transfer_res/shards', transform=transform_train)
+elif args.transfer_datas:
     trainset = torchvision.datasets.ImageFolder('./transfer_res/images', transform=transform_train)
 else:
     trainset = torchvision.datasets.CIFAR10(root='./data', train=True, download=True, transform=transform_train)
 if args.mixup == 'AugMix':
     trainset = mix_aug.AugMixDataset(trainset, preprocess)
-trainloader = torch.utils.data.DataLoader(
-    trainset, batch_size=args.batch_size, shuffle=True, num_workers=2)
+if args.gpu_loader and not args.transfer_datas and args.mixup != 'AugMix':
+    # 与transform_train相同的crop/flip/normalize, 在GPU上按batch完成, 没有逐张PIL处理
+    trainloader = GPUTrainLoader(trainset.data, trainset.targets, args.batch_size,
+                                 mean=(0.4914, 0.4822, 0.4465), std=(0.2023, 0.1994, 0.2010),
+                                 padding=4, device=device, seed=args.seed)
+else:
+    trainloader = torch.utils.data.DataLoader(
+        trainset, batch_size=args.batch_size, shuffle=True, num_workers=2)
 
 train_features, train_labels = next(iter(trainloader))
 print(f"Feature batch shape: {train_features.size()}")
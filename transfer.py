@@ -11,8 +11,11 @@ from PIL import Image
 from torchvision import models, transforms
 import torchvision
 from tqdm import tqdm, trange
+from torch.utils.checkpoint import checkpoint
 
 from utils import imgnormalize, gkern, get_gaussian_kernel
+from transfer_shards import ShardWriter
+from ensemble_workers import ParallelEnsemble
 
 seed_num = 1
 random.seed(seed_num)
@@ -34,7 +37,16 @@ def parse_arguments():
     parser.add_argument('--lr', type=eval, default=1.0 / 255.)
     parser.add_argument('--linf_epsilon', type=float, default=32)
     parser.add_argument('--di', type=eval, default="True")
+    parser.add_argument('--eot_chunk', type=int, default=1,
+                        help='scale factors stacked into one forward. 1 has the memory of the per-scale loop; '
+                             'up to 7 (all scales) is faster but needs about eot_chunk x the activation memory')
+    parser.add_argument('--ensemble_workers', type=eval, default="False",
+                        help='one CPU worker process per source model, pinned to its own cores')
+    parser.add_argument('--grad_checkpoint', type=eval, default="False",
+                        help='recompute the activations of every source model in backward')
     parser.add_argument('--result_path', type=str, default='transfer_res')
+    parser.add_argument('--save_format', type=str, default='shards', choices=['shards', 'jpeg'],
+                        help='uint8 shards written in background (result_path/shards) or jpeg folders (result_path/images)')
     args = parser.parse_args()
     return args
 
@@ -42,13 +54,21 @@ def parse_arguments():
 def main():
     args = parse_arguments()
     adv_img_folder = os.path.join(args.result_path, 'images')  # 对抗样本保存文件夹
-    if not os.path.exists(adv_img_folder):
+    if args.save_format == 'jpeg' and not os.path.exists(adv_img_folder):
         os.makedirs(adv_img_folder)
+    if args.save_format == 'shards':
+        writer = ShardWriter(os.path.join(args.result_path, 'shards'))  # 后台线程写盘，攻击循环不等待磁盘
     norm = imgnormalize()  # 标准化处理类
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")  # GPU ID
     source_model_names = args.source_model  # 替代模型
     num_source_models = len(source_model_names)  # 替代模型的数量
     source_models = []  # 根据替代模型的名称分别加载对应的网络模型
+    parallel_ensemble = None
+    if args.ensemble_workers:
+        # 每个替代模型在各自的进程中计算, 通过共享内存交换输入/logits/梯度
+        parallel_ensemble = ParallelEnsemble(source_model_names, norm,
+                                             max_batch=args.eot_chunk * args.batch_size)
+        source_model_names = []
     for model_name in source_model_names:
         print("Loading: {}".format(model_name))
         source_model = models.__dict__[model_name](pretrained=True).eval()
@@ -73,6 +93,24 @@ def main():
     trainset = torchvision.datasets.CIFAR10(root='./data', train=True, download=True, transform=transform_train)
     trainloader = torch.utils.data.DataLoader(trainset, batch_size=args.batch_size, num_workers=2)
     gaussian_smoothing = get_gaussian_kernel(kernel_size=5, sigma=1, channels=3, use_cuda=True)  # 高斯核（过滤部分高频信息） 5，1
+    # 7个尺度一起计算: [7, 1, 1, 1, 1]
+    scales = torch.tensor(liner_interval, dtype=torch.float32, device=device).view(-1, 1, 1, 1, 1)
+    num_scales = len(liner_interval)
+    # 原来的循环中delta.grad在7个尺度间没有清零, 第tt个尺度的梯度被累加了(7 - tt)次, 用loss权重保持同样的更新
+    scale_weights = torch.arange(num_scales, 0, -1, dtype=torch.float32, device=device)
+
+    def ensemble_logits(X_adv):
+        if parallel_ensemble is not None:
+            return parallel_ensemble(X_adv)
+        logits = 0
+        for source_model in source_models:
+            if args.grad_checkpoint:
+                # 只保存输入, backward时重新计算该模型的激活, 大ensemble时省显存
+                logits += checkpoint(lambda x, m=source_model: m(norm(x)), X_adv, use_reentrant=False)
+            else:
+                logits += source_model(norm(X_adv))  # ensemble操作
+        return logits / num_source_models
+
     print('start atttacking....')
     idx = 0
     for X_ori, labels_gt in tqdm(trainloader):
@@ -80,33 +118,28 @@ def main():
         labels_gt = labels_gt.to(device)
         delta = torch.zeros_like(X_ori, requires_grad=True).to(device)  # 噪声大小的初始化
         X_ori = gaussian_smoothing(X_ori)  # 对输入图片进行高斯滤波
+        batch_size = X_ori.shape[0]
         for t in trange(args.max_iterations):
-            g_temp = []
-            for tt in range(len(liner_interval)):
-                c = liner_interval[tt]
-                X_adv = X_ori + c * delta  # 如果使用了DI，则不用顶点浮动
+            for s in range(0, num_scales, args.eot_chunk):
+                c = scales[s:s + args.eot_chunk]
+                X_adv = (X_ori + c * delta).flatten(0, 1)  # 如果使用了DI，则不用顶点浮动, [chunk * B, C, H, W]
                 X_adv = nn.functional.interpolate(X_adv, (224, 224), mode='bilinear', align_corners=False)  # 插值到224
-                logits = 0
-                for source_model_n, source_model in zip(source_model_names, source_models):
-                    logits += source_model(norm(X_adv))  # ensemble操作
-                logits /= num_source_models
-                loss = -nn.CrossEntropyLoss()(logits, labels_gt)  # 交叉熵
-                loss.backward()  # 梯度回传
-                # MI + TI 操作
-                grad_c = delta.grad.clone()  # 同时使用MI和TI
-                grad_c = F.conv2d(grad_c, gaussian_kernel, bias=None, stride=1, padding=(2, 2), groups=3)
-                grad_a = grad_c
-                g_temp.append(grad_a)
-            g0 = 0.0
-            for j in range(7):
-                g0 += g_temp[j]  # 求均值，抵消噪声【多次DI随机，消除噪声，保留有效信息】
-            g0 = g0 / 7.0
+                logits = ensemble_logits(X_adv)
+                loss = F.cross_entropy(logits, labels_gt.repeat(len(c)), reduction='none')  # 交叉熵
+                loss = -(loss.view(len(c), batch_size).mean(1) * scale_weights[s:s + args.eot_chunk]).sum()
+                loss.backward()  # 梯度回传, 在delta.grad中累加
+            # MI + TI 操作, 卷积是线性的, 对累加后的梯度做一次
+            g0 = F.conv2d(delta.grad, gaussian_kernel, bias=None, stride=1, padding=(2, 2), groups=3)
+            g0 = g0 / 7.0  # 求均值，抵消噪声【多次DI随机，消除噪声，保留有效信息】
             delta.grad.zero_()  # 梯度清零
             # 无穷范数攻击
             delta.data = delta.data - args.lr * torch.sign(g0)
             delta.data = delta.data.clamp(-args.linf_epsilon / 255., args.linf_epsilon / 255.)
             delta.data = ((X_ori + delta.data).clamp(0, 1)) - X_ori  # 噪声截取操作
 
+        if args.save_format == 'shards':
+            writer.put(((X_ori + delta).detach() * 255).to(torch.uint8), labels_gt)
+            continue
         for i in range(X_ori.shape[0]):
             adv_final = (X_ori + delta)[i].cpu().detach().numpy()
             adv_final = (adv_final * 255).astype(np.uint8)
@@ -118,6 +151,10 @@ def main():
             im = Image.fromarray(adv_x_255)
             im.save(file_path, quality=99)
             idx += 1
+    if args.save_format == 'shards':
+        writer.close()
+    if parallel_ensemble is not None:
+        parallel_ensemble.close()
 
 if __name__ == '__main__':
     main()
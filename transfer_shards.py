@@ -0,0 +1,109 @@
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset
+
+
+class ShardWriter(object):
+    '''
+    Background writer of uint8 image shards: shard_xxxxx.npy [N, H, W, C] + shard_xxxxx.labels.npy,
+    listed with their sizes in index.json. put() only queues the batch, the copy to the host and
+    the disk writes happen in the writer thread.
+    '''
+
+    def __init__(self, root, shard_size=10000, max_queue=8):
+        self.root = root
+        self.shard_size = shard_size
+        os.makedirs(root, exist_ok=True)
+        self.shards = []
+        self._images, self._labels, self._count = [], [], 0
+        self._error = None
+        self._queue = queue.Queue(maxsize=max_queue)  # 写盘落后太多时才会阻塞攻击循环
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, images, labels):
+        """
+        :param images: [B, C, H, W] uint8 tensor (any device) or [B, H, W, C] uint8 numpy array
+        :param labels: [B] labels
+        """
+        if self._error is not None:
+            raise self._error
+        self._queue.put((images, labels))
+
+    def close(self):
+        '''write the last shard and the index, wait for the writer thread'''
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        with open(os.path.join(self.root, 'index.json'), 'w') as f:
+            json.dump({'shards': self.shards, 'total': sum(s['count'] for s in self.shards)}, f,
+                      indent=2)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is not None:
+                continue
+            try:
+                images, labels = item
+                if torch.is_tensor(images):
+                    images = images.permute(0, 2, 3, 1).cpu().numpy()
+                if torch.is_tensor(labels):
+                    labels = labels.cpu().numpy()
+                self._images.append(images)
+                self._labels.append(np.asarray(labels, dtype=np.int64))
+                self._count += len(images)
+                while self._count >= self.shard_size:
+                    self._flush(self.shard_size)
+            except Exception as e:
+                self._error = e
+        if self._error is None and self._count > 0:
+            try:
+                self._flush(self._count)
+            except Exception as e:
+                self._error = e
+
+    def _flush(self, count):
+        images, labels = np.concatenate(self._images), np.concatenate(self._labels)
+        name = 'shard_%05d' % len(self.shards)
+        np.save(os.path.join(self.root, name + '.npy'), images[:count])
+        np.save(os.path.join(self.root, name + '.labels.npy'), labels[:count])
+        self.shards.append({'images': name + '.npy', 'labels': name + '.labels.npy', 'count': count})
+        self._images, self._labels = [images[count:]], [labels[count:]]
+        self._count -= count
+
+
+class TensorShardDataset(Dataset):
+    '''
+    Dataset over the shards of a ShardWriter, memory-mapped, no JPEG decoding.
+    Items are PIL images like torchvision's CIFAR10, so the same transforms apply.
+    '''
+
+    def __init__(self, root, transform=None):
+        with open(os.path.join(root, 'index.json')) as f:
+            index = json.load(f)
+        self.transform = transform
+        self.data = [np.load(os.path.join(root, s['images']), mmap_mode='r') for s in index['shards']]
+        self.targets = np.concatenate([np.load(os.path.join(root, s['labels']))
+                                       for s in index['shards']]).tolist()
+        self.offsets = np.cumsum([0] + [s['count'] for s in index['shards']])
+        self.classes = sorted(set(self.targets))
+
+    def __getitem__(self, index):
+        shard = np.searchsorted(self.offsets, index, side='right') - 1
+        image = Image.fromarray(np.asarray(self.data[shard][index - self.offsets[shard]]))
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, self.targets[index]
+
+    def __len__(self):
+        return int(self.offsets[-1])